@@ -0,0 +1,106 @@
+"""Peak memory of .pt -> .safetensors conversion.
+
+Writes a synthetic checkpoint, then converts it in a fresh process with
+the old load-everything approach (`load_ckpt_weights` + `safetensors.torch.save_file`)
+and with the streaming `lora_util.convert_pt_to_safetensors`, reporting
+wall time and peak RSS of each (Linux only, it reads /proc). Both
+outputs must be byte-identical.
+
+Usage:
+  python -m benchmarks.bench_convert [--size-mb MB] [--tensors N] [--dir DIR]
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+_LEGACY = """
+safetensors.torch.save_file(lora_util.load_ckpt_weights(SRC), DST)
+"""
+
+_STREAMING = """
+shutil.move(lora_util.convert_pt_to_safetensors(SRC), DST)
+"""
+
+# Importing torch alone peaks near 1 GB on CUDA builds, so the high-water
+# mark is reset (Linux `clear_refs`) once the imports are done and the
+# conversion is measured on its own.
+_RUNNER = """
+import sys, time, json, shutil
+import torch, safetensors.torch
+from src import lora_util
+
+def status(key):
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith(key))
+
+SRC, DST = sys.argv[1], sys.argv[2]
+with open("/proc/self/clear_refs", "w") as f:
+    f.write("5")
+before = status("VmRSS:")
+start = time.perf_counter()
+exec(sys.argv[3])
+print(json.dumps({"seconds": time.perf_counter() - start, "base_rss_kb": before, "peak_rss_kb": status("VmHWM:")}))
+"""
+
+
+def make_checkpoint(path: str, size_mb: int, tensors: int):
+    import torch
+
+    per_tensor = size_mb * 1024 * 1024 // tensors // 4
+    weights = {f"lora_unet_block_{i}.weight": torch.randn(per_tensor) for i in range(tensors)}
+    torch.save({"state_dict": weights}, path)
+
+
+def run(code: str, src: str, dst: str) -> dict:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run(
+        [sys.executable, "-c", _RUNNER, src, dst, code],
+        cwd=root, capture_output=True, text=True,
+    )
+    if out.returncode:
+        raise RuntimeError(out.stderr)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=512)
+    parser.add_argument("--tensors", type=int, default=64)
+    parser.add_argument("--dir", default=None, help="Scratch directory, defaults to a temp dir")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(dir=args.dir)
+    try:
+        source = os.path.join(workdir, "model.pt")
+        make_checkpoint(source, args.size_mb, args.tensors)
+
+        results = {}
+        legacy_out = os.path.join(workdir, "legacy.safetensors")
+        results["legacy"] = run(_LEGACY, source, legacy_out)
+
+        # The streaming converter removes its input, so give it a copy.
+        copy = os.path.join(workdir, "copy.pt")
+        shutil.copy(source, copy)
+        streaming_out = os.path.join(workdir, "streaming.safetensors")
+        results["streaming"] = run(_STREAMING, copy, streaming_out)
+
+        with open(legacy_out, "rb") as a, open(streaming_out, "rb") as b:
+            identical = all(x == y for x, y in zip(iter(lambda: a.read(1 << 20), b""), iter(lambda: b.read(1 << 20), b"")))
+        identical = identical and os.path.getsize(legacy_out) == os.path.getsize(streaming_out)
+
+        print(f"checkpoint: {args.size_mb} MB in {args.tensors} tensors")
+        for name, r in results.items():
+            growth = (r['peak_rss_kb'] - r['base_rss_kb']) / 1024
+            print(f"{name:<10} {r['seconds']:7.2f}s  peak RSS {r['peak_rss_kb'] / 1024:8.1f} MB (+{growth:.1f} MB over imports)")
+        print(f"outputs identical: {identical}")
+        return 0 if identical else 1
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""Startup cost of the CLI commands that never touch tensors.
+
+Runs each command in a fresh interpreter with `python -X importtime`
+against a scratch database, sums the reported import times and fails if
+a command goes over the budget or imports a module reserved for the
+tensor commands (torch, safetensors, PIL, markdownify).
+
+Commands that need the network are covered by importing the modules
+they use instead of running them.
+
+Usage:
+  python -m benchmarks.bench_importtime [--budget SECONDS] [--runs N]
+"""
+import os
+import re
+import sys
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+FORBIDDEN = ("torch", "safetensors", "PIL", "markdownify")
+
+_IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def scenarios(workdir: str) -> dict:
+    empty = os.path.join(workdir, "empty")
+    os.makedirs(empty, exist_ok=True)
+    api_modules = "import src.civit_api, src.crawler, src.persistence, src.sync, src.database, src.http_client"
+    return {
+        "--version": ["main.py", "--version"],
+        "search": ["main.py", "search", "-q", "anime"],
+        "tags --local": ["main.py", "tags", "--local"],
+        "rehash": ["main.py", "rehash", empty],
+        "api commands": ["-c", api_modules],
+    }
+
+
+def measure(args: list[str], env: dict) -> tuple[float, set]:
+    """Returns (seconds spent importing, top-level packages imported)."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=root, env=env, capture_output=True, text=True,
+    )
+    if out.returncode:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{out.stderr[-2000:]}")
+    total = 0
+    packages = set()
+    for line in out.stderr.splitlines():
+        m = _IMPORT_LINE.match(line)
+        if m:
+            total += int(m.group(1))
+            packages.add(m.group(4).split(".")[0])
+    return total / 1e6, packages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget", type=float, default=1.0, help="Seconds of imports allowed per command")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per command, the fastest is kept")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp()
+    try:
+        env = dict(os.environ, DATABASE_NAME=os.path.join(workdir, "bench"))
+        failed = False
+        for name, command in scenarios(workdir).items():
+            results = [measure(command, env) for _ in range(args.runs)]
+            seconds = min(r[0] for r in results)
+            loaded = sorted(set(FORBIDDEN) & results[0][1])
+            ok = seconds <= args.budget and not loaded
+            failed = failed or not ok
+            note = f"  imports {', '.join(loaded)}" if loaded else ""
+            print(f"{name:<14} {seconds:6.3f}s  {'ok' if ok else 'OVER BUDGET'}{note}")
+        print(f"budget: {args.budget:.3f}s per command")
+        return 1 if failed else 0
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""Parsing throughput of `/api/v1/models` pages: ORM objects vs row tuples.
+
+Decodes and parses the same pages with `civit_api.parse_models_page`
+(json + dateutil + ORM instances) and with `ingest.parse_page` (orjson
+when installed + `datetime.fromisoformat` + tuples), then reports rows
+per second and the peak memory allocated while parsing one page.
+
+Pages come from a response archive (see `main.py replay`) or are
+generated.
+
+Usage:
+  python -m benchmarks.bench_ingest [--archive PATH] [--pages N] [--page-size N] [--runs N] [--target X]
+"""
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+from benchmarks.generators import archived_pages, synthetic_page
+
+
+def load_pages(args) -> list[bytes]:
+    if args.archive:
+        return [json.dumps(page).encode("utf8") for page in archived_pages(args.archive, args.pages)]
+    return [json.dumps(synthetic_page(p, args.page_size)).encode("utf8") for p in range(args.pages or 20)]
+
+
+def parse_orm(raw: bytes) -> int:
+    from src.civit_api import parse_models_page
+
+    _, models, versions, files, images = parse_models_page(json.loads(raw))
+    links = sum(len(m.tag_links) for m in models) + sum(len(v.trained_word_links) for v in versions)
+    return len(models) + len(versions) + len(files) + len(images) + links
+
+
+def parse_rows(raw: bytes) -> int:
+    from src.ingest import loads, parse_page
+
+    _, rows = parse_page(loads(raw))
+    return sum(len(r) for _, r in rows.tables())
+
+
+def throughput(parse, pages: list[bytes], runs: int) -> tuple[float, int]:
+    """Returns (best rows per second, rows)."""
+    best = 0.0
+    for _ in range(runs):
+        start = time.perf_counter()
+        rows = sum(parse(raw) for raw in pages)
+        best = max(best, rows / (time.perf_counter() - start))
+    return best, rows
+
+
+def peak_memory(parse, pages: list[bytes]) -> int:
+    """Largest traced allocation peak while parsing a single page."""
+    worst = 0
+    tracemalloc.start()
+    for raw in pages:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        parse(raw)
+        worst = max(worst, tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return worst
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--archive", help="Response archive to read pages from")
+    parser.add_argument("--pages", type=int, help="Pages to parse, defaults to 20 generated or the whole archive")
+    parser.add_argument("--page-size", type=int, default=100, help="Models per generated page")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per parser, the fastest is kept")
+    parser.add_argument("--target", type=float, default=5.0, help="Required speedup of the row parser")
+    args = parser.parse_args(argv)
+
+    pages = load_pages(args)
+    if not pages:
+        print("No pages to parse")
+        return 1
+    # Warm up imports and caches outside the measurements.
+    parse_orm(pages[0])
+    parse_rows(pages[0])
+
+    from src import ingest
+    results = {}
+    for name, parse in (("orm", parse_orm), ("rows", parse_rows)):
+        rate, rows = throughput(parse, pages, args.runs)
+        peak = peak_memory(parse, pages)
+        results[name] = rate, peak
+        print(f"{name:<5} {rate:10.0f} rows/s  peak {peak / 2**20:7.2f} MiB/page  ({rows} rows in {len(pages)} pages)")
+
+    speedup = results["rows"][0] / results["orm"][0]
+    memory = results["rows"][1] / results["orm"][1]
+    decoder = "orjson" if ingest.orjson is not None else "json"
+    print(f"speedup {speedup:.1f}x, peak memory {memory:.2f}x (decoder: {decoder}, target {args.target:.1f}x)")
+    return 0 if speedup >= args.target and memory < 1 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""Synthetic inputs for the benchmarks: API pages, .safetensors files and
+preview images. Everything is derived from a seed, so two runs with the
+same arguments see the same data."""
+import io
+import random
+
+
+def synthetic_page(page: int, size: int = 100, seed: int = 0, base_url: str = "https://civitai.com") -> dict:
+    """A `/api/v1/models` response shaped like the real API's.
+
+    Args:
+        page (int): Page number, models get ids from `page * size`.
+        size (int, optional): Models on the page. Defaults to 100.
+        seed (int, optional): Seed for the random content. Defaults to 0.
+        base_url (str, optional): Host of the download and image URLs. Defaults to civitai.com.
+    """
+    rng = random.Random(seed * 100003 + page)
+    items = []
+    for i in range(size):
+        model_id = page * size + i
+        versions = []
+        for v in range(rng.randint(1, 4)):
+            version_id = model_id * 10 + v
+            versions.append({
+                "id": version_id,
+                "name": f"v{v}.0",
+                "description": "<p>" + "Trained on a curated dataset. " * rng.randint(0, 20) + "</p>",
+                "baseModel": rng.choice(["SD 1.5", "SDXL 1.0", "Pony"]),
+                "createdAt": f"2023-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:13:05.{rng.randint(0, 999):03d}Z",
+                "downloadUrl": f"{base_url}/api/download/models/{version_id}",
+                "trainedWords": [f"trigger{version_id}", "masterpiece", "best quality"][:rng.randint(0, 3)],
+                "files": [{
+                    "id": version_id * 2 + f,
+                    "name": f"model_{version_id}_{f}.safetensors",
+                    "sizeKB": rng.uniform(1e4, 2e6),
+                    "type": "Model",
+                    "metadata": {"format": "SafeTensor", "fp": "fp16", "size": "pruned"},
+                    "pickleScanResult": "Success",
+                    "virusScanResult": "Success",
+                    "scannedAt": "2023-05-01T10:00:00.000Z" if rng.random() > 0.1 else None,
+                    "hashes": {"SHA256": f"{rng.getrandbits(256):064X}", "AutoV2": f"{rng.getrandbits(40):010X}"},
+                } for f in range(rng.randint(1, 2))],
+                "images": [{
+                    "url": f"{base_url}/img/{version_id}_{k}.jpeg",
+                    "nsfw": "None",
+                    "width": 512,
+                    "height": 768,
+                    "hash": f"U{rng.getrandbits(120):030x}",
+                    "meta": {
+                        "prompt": "masterpiece, best quality, 1girl, " * rng.randint(1, 6),
+                        "negativePrompt": "lowres, bad anatomy",
+                        "seed": rng.getrandbits(32), "steps": 28, "cfgScale": 7, "sampler": "DPM++ 2M Karras",
+                    } if rng.random() > 0.2 else None,
+                } for k in range(rng.randint(1, 10))],
+            })
+        items.append({
+            "id": model_id,
+            "name": f"Model {model_id}",
+            "description": "<p>" + "A model description with <b>markup</b>. " * rng.randint(1, 30) + "</p>",
+            "type": rng.choice(["Checkpoint", "LORA", "TextualInversion", "LoCon"]),
+            "nsfw": rng.random() < 0.2,
+            "tags": rng.sample(["anime", "character", "style", "concept", "clothing", "photorealistic", "landscape"], 3),
+            "creator": {"username": f"creator{rng.randint(0, 500)}", "image": None},
+            "stats": {"downloadCount": rng.randint(0, 100000), "rating": rng.uniform(0, 5)},
+            "modelVersions": versions,
+        })
+    return {"items": items, "metadata": {"totalItems": 100000, "currentPage": page, "pageSize": size, "totalPages": 1000}}
+
+
+def archived_pages(root: str, limit: int = None) -> list[dict]:
+    """Returns the `/api/v1/models` responses of a response archive."""
+    from src.archive import iter_records
+
+    pages = []
+    for record in iter_records(root):
+        if "items" in record["data"]:
+            pages.append(record["data"])
+            if limit and len(pages) >= limit:
+                break
+    return pages
+
+
+def write_safetensors(path: str, size: int, tensors: int = 64, metadata: dict = None, seed: int = 0) -> int:
+    """Writes a LoRA-like .safetensors file of about `size` bytes of F16
+    tensors filled with random bytes, without torch.
+
+    Args:
+        path (str): Output file.
+        size (int): Bytes of tensor data, split evenly over the tensors.
+        tensors (int, optional): Number of tensors. Defaults to 64.
+        metadata (dict, optional): `__metadata__` strings. Defaults to a few `ss_` keys.
+        seed (int, optional): Seed for the tensor bytes. Defaults to 0.
+
+    Returns:
+        int: Size of the written file.
+    """
+    from src.safetensors_hack import encode_header
+
+    rng = random.Random(seed)
+    if metadata is None:
+        metadata = {"ss_network_dim": "16", "ss_network_alpha": "8", "ss_base_model_version": "sd_v1"}
+    elements = max(1, size // tensors // 2)
+    header = {"__metadata__": metadata}
+    offset = 0
+    for i in range(tensors):
+        header[f"lora_unet_down_blocks_{i}_attn.lora_down.weight"] = {
+            "dtype": "F16", "shape": [elements], "data_offsets": [offset, offset + elements * 2],
+        }
+        offset += elements * 2
+
+    with open(path, "wb") as f:
+        f.write(encode_header(header))
+        for _ in range(tensors):
+            f.write(rng.randbytes(elements * 2))
+        return f.tell()
+
+
+def preview_jpeg(width: int = 512, height: int = 768, seed: int = 0) -> bytes:
+    """A noisy JPEG, so encoding costs about as much as a real preview."""
+    from PIL import Image
+
+    rng = random.Random(seed)
+    image = Image.frombytes("RGB", (width // 8, height // 8), rng.randbytes(width // 8 * height // 8 * 3))
+    image = image.resize((width, height))
+    with io.BytesIO() as buf:
+        image.save(buf, "JPEG", quality=90)
+        return buf.getvalue()
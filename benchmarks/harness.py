@@ -0,0 +1,198 @@
+"""Measurement and reporting helpers shared by the benchmark suite."""
+import os
+import sys
+import json
+import time
+import platform
+import threading
+import contextlib
+import subprocess
+from datetime import datetime, timezone
+
+
+def reset_peak_rss() -> bool:
+    """Resets the process's RSS high-water mark (Linux `clear_refs`).
+
+    Returns:
+        bool: False where the peak cannot be reset, peaks then include earlier stages.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _status_kb(key: str) -> int:
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith(key))
+
+
+def current_rss() -> int:
+    """Resident set size in bytes, 0 where it cannot be read."""
+    try:
+        return _status_kb("VmRSS:") * 1024
+    except OSError:
+        return 0
+
+
+def peak_rss() -> int:
+    """Peak resident set size in bytes since the last `reset_peak_rss`."""
+    try:
+        return _status_kb("VmHWM:") * 1024
+    except OSError:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Linearly interpolated percentile of `values`, `q` between 0 and 100."""
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * q / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+class Stage:
+    """Collects the latency of every operation of one stage and the units
+    (rows, bytes, files...) it processed. Safe to use from several threads.
+
+    Args:
+        name (str): Stage name, the key in the results.
+        unit (str): What `units` counts, for throughput.
+    """
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.latencies = []
+        self.units = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float, units: float = 1):
+        with self.lock:
+            self.latencies.append(seconds)
+            self.units += units
+
+    @contextlib.contextmanager
+    def measure(self, units: float = 1):
+        """Times the enclosed operation as one latency sample."""
+        start = time.perf_counter()
+        yield
+        self.record(time.perf_counter() - start, units)
+
+
+def run_stage(name: str, unit: str, body) -> dict:
+    """Runs `body(stage)` and returns its throughput, latency percentiles
+    and memory use.
+
+    Args:
+        name (str): Stage name.
+        unit (str): Unit of throughput.
+        body (Callable[[Stage], None]): Does the work, recording each operation on the stage.
+
+    Returns:
+        dict: The stage's results, see the keys below.
+    """
+    stage = Stage(name, unit)
+    resettable = reset_peak_rss()
+    base = current_rss()
+    start = time.perf_counter()
+    body(stage)
+    seconds = time.perf_counter() - start
+    peak = peak_rss()
+
+    latencies = [s * 1000 for s in stage.latencies]
+    return {
+        "unit": unit,
+        "operations": len(latencies),
+        "units": stage.units,
+        "seconds": seconds,
+        "throughput": stage.units / seconds if seconds > 0 else None,
+        "latency_ms": {
+            "mean": sum(latencies) / len(latencies) if latencies else None,
+            "p50": percentile(latencies, 50),
+            "p90": percentile(latencies, 90),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies) if latencies else None,
+        },
+        "peak_rss_mb": peak / 2**20,
+        "rss_growth_mb": (peak - base) / 2**20 if resettable else None,
+    }
+
+
+def environment(args: dict) -> dict:
+    """What a run depends on besides the code: machine, interpreter, commit and arguments."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True, text=True,
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": args,
+    }
+
+
+def save_results(path: str, results: dict):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def format_stage(name: str, r: dict) -> str:
+    lat = r["latency_ms"]
+    p50 = f"{lat['p50']:9.2f}" if lat["p50"] is not None else f"{'-':>9}"
+    p99 = f"{lat['p99']:9.2f}" if lat["p99"] is not None else f"{'-':>9}"
+    growth = f"+{r['rss_growth_mb']:.1f}" if r["rss_growth_mb"] is not None else "?"
+    return (f"{name:<22} {r['throughput']:12.1f} {r['unit'] + '/s':<11} p50 {p50} ms  p99 {p99} ms  "
+            f"peak RSS {r['peak_rss_mb']:7.1f} MB ({growth})")
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Prints every stage next to the baseline and returns the stages that
+    regressed: throughput down, or median latency up, by more than
+    `threshold` percent."""
+    regressions = []
+    print(f"\nAgainst baseline {baseline['environment'].get('commit')} ({baseline['environment'].get('timestamp')}):")
+    for name, r in results["stages"].items():
+        old = baseline["stages"].get(name)
+        if old is None:
+            print(f"{name:<22} new stage")
+            continue
+        notes = []
+        if r["throughput"] and old["throughput"]:
+            change = (r["throughput"] / old["throughput"] - 1) * 100
+            notes.append(f"throughput {change:+6.1f}%")
+            if change < -threshold:
+                regressions.append(name)
+        new_p50, old_p50 = r["latency_ms"]["p50"], old["latency_ms"]["p50"]
+        if new_p50 is not None and old_p50:
+            change = (new_p50 / old_p50 - 1) * 100
+            notes.append(f"p50 {change:+6.1f}%")
+            if change > threshold and name not in regressions:
+                regressions.append(name)
+        # Growth over the stage is comparable across runs with different
+        # stage selections, the absolute peak is not.
+        if r["rss_growth_mb"] is not None and old["rss_growth_mb"] is not None:
+            notes.append(f"RSS growth {r['rss_growth_mb'] - old['rss_growth_mb']:+.1f} MB")
+        else:
+            notes.append(f"peak RSS {r['peak_rss_mb'] - old['peak_rss_mb']:+.1f} MB")
+        flag = "  REGRESSION" if name in regressions else ""
+        print(f"{name:<22} {', '.join(notes)}{flag}")
+    return regressions
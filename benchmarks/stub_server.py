@@ -0,0 +1,237 @@
+"""Local stand-in for civitai.com downloads and the models API.
+
+Serves every file in a directory at `/api/download/models/<stem>` and
+`/files/<name>`, with `Range` support and optional fault injection, so
+resumable and ranged downloads can be exercised without the network.
+`/api/v1/models` answers with generated pages that link to each other
+through `nextCursor`, and `/img/<name>` with a generated JPEG.
+
+Usage:
+  python -m benchmarks.stub_server DIR [--port PORT] [--drop-after BYTES] [--fail-every N] [--api-pages N]
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import threading
+import http.server
+from urllib.parse import urlsplit, parse_qs
+
+from requests.adapters import HTTPAdapter
+
+from benchmarks.generators import preview_jpeg, synthetic_page
+
+CHUNK_SIZE = 64 * 1024
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "CivitaiStub/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _resolve(self):
+        path = self.path.split("?", 1)[0]
+        m = re.fullmatch(r"/api/download/models/([^/]+)", path)
+        if m:
+            for name in os.listdir(self.server.root):
+                if os.path.splitext(name)[0] == m.group(1):
+                    return os.path.join(self.server.root, name)
+            return None
+        m = re.fullmatch(r"/files/([^/]+)", path)
+        if m:
+            candidate = os.path.join(self.server.root, m.group(1))
+            return candidate if os.path.isfile(candidate) else None
+        return None
+
+    def _empty(self, status, headers=None):
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def _send_body(self, body: bytes, content_type: str, head: bool):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def _models_page(self, query: dict) -> bytes:
+        limit = int(query.get("limit", ["100"])[0])
+        if "cursor" in query:
+            page = int(query["cursor"][0])
+        else:
+            page = int(query.get("page", ["1"])[0]) - 1
+        if page >= self.server.api_pages:
+            data = {"items": [], "metadata": {"totalItems": self.server.api_pages * limit}}
+        else:
+            data = synthetic_page(page, limit, self.server.seed, base_url=self.server.url)
+            data["metadata"] = {"totalItems": self.server.api_pages * limit}
+            if page + 1 < self.server.api_pages:
+                data["metadata"]["nextCursor"] = str(page + 1)
+                data["metadata"]["nextPage"] = f"https://civitai.com/api/v1/models?limit={limit}&cursor={page + 1}"
+        return json.dumps(data).encode("utf8")
+
+    def do_GET(self, head=False):
+        with self.server.lock:
+            self.server.requests += 1
+            fail = self.server.fail_every and self.server.requests % self.server.fail_every == 0
+        if fail:
+            return self._empty(503, {"Retry-After": "0"})
+
+        url = urlsplit(self.path)
+        if url.path == "/api/v1/models":
+            return self._send_body(self._models_page(parse_qs(url.query)), "application/json", head)
+        if url.path.startswith("/img/"):
+            return self._send_body(self.server.preview(), "image/jpeg", head)
+
+        filename = self._resolve()
+        if filename is None:
+            return self._empty(404)
+
+        total = os.path.getsize(filename)
+        start, end, status = 0, total - 1, 200
+        range_header = self.headers.get("Range")
+        if range_header:
+            m = re.fullmatch(r"bytes=(\d+)-(\d*)", range_header.strip())
+            if not m or int(m.group(1)) >= total:
+                return self._empty(416, {"Content-Range": f"bytes */{total}"})
+            start = int(m.group(1))
+            end = min(int(m.group(2)), total - 1) if m.group(2) else total - 1
+            status = 206
+
+        length = end - start + 1
+        self.send_response(status)
+        self.send_header("Content-Length", str(length))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(filename)}"')
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{total}")
+        self.end_headers()
+        if head:
+            return
+
+        # Drop the connection mid-body once per file to simulate a flaky link.
+        drop_at = None
+        if self.server.drop_after is not None:
+            with self.server.lock:
+                if filename not in self.server.dropped:
+                    self.server.dropped.add(filename)
+                    drop_at = self.server.drop_after
+
+        sent = 0
+        with open(filename, "rb") as f:
+            f.seek(start)
+            while sent < length:
+                n = min(CHUNK_SIZE, length - sent)
+                if drop_at is not None and sent + n > drop_at:
+                    n = drop_at - sent
+                    if n > 0:
+                        self.wfile.write(f.read(n))
+                        self.server.sent(n)
+                    self.close_connection = True
+                    self.connection.shutdown(2)
+                    return
+                self.wfile.write(f.read(n))
+                self.server.sent(n)
+                sent += n
+
+
+class StubServer(http.server.ThreadingHTTPServer):
+    """Threaded stub server.
+
+    Args:
+        root (str): Directory with the files to serve.
+        port (int, optional): Port to bind, 0 picks a free one. Defaults to 0.
+        drop_after (int, optional): Abort the first response for each file after this many bytes.
+        fail_every (int, optional): Answer every Nth request with a 503.
+        verbose (bool, optional): Log requests. Defaults to False.
+        api_pages (int, optional): Pages served by `/api/v1/models`. Defaults to 10.
+        seed (int, optional): Seed of the generated pages. Defaults to 0.
+    """
+    daemon_threads = True
+
+    def __init__(self, root, port=0, drop_after=None, fail_every=None, verbose=False, api_pages=10, seed=0):
+        super().__init__(("127.0.0.1", port), StubHandler)
+        self.root = root
+        self.drop_after = drop_after
+        self.fail_every = fail_every
+        self.verbose = verbose
+        self.api_pages = api_pages
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+        self.dropped = set()
+        self._preview = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def sent(self, n: int):
+        """Counts file bytes written to clients, in `bytes_sent`."""
+        with self.lock:
+            self.bytes_sent += n
+
+    def preview(self) -> bytes:
+        # One image for every URL, so the stub does not compete with the
+        # client for CPU.
+        with self.lock:
+            if self._preview is None:
+                self._preview = preview_jpeg(seed=self.seed)
+            return self._preview
+
+    def start(self) -> "StubServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _RerouteAdapter(HTTPAdapter):
+    def __init__(self, prefix: str, target: str, **kwargs):
+        super().__init__(**kwargs)
+        self.prefix = prefix
+        self.target = target
+
+    def send(self, request, **kwargs):
+        request.url = self.target + request.url[len(self.prefix):]
+        return super().send(request, **kwargs)
+
+
+def reroute(server: StubServer, host: str = "civitai.com"):
+    """Sends the shared HTTP client's requests for `https://<host>` to
+    `server` instead, so the API code runs unchanged against the stub."""
+    from src import http_client
+
+    prefix = f"https://{host}"
+    http_client.get_client().session.mount(prefix, _RerouteAdapter(prefix, server.url, pool_maxsize=16))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("root")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--drop-after", type=int, default=None)
+    parser.add_argument("--fail-every", type=int, default=None)
+    parser.add_argument("--api-pages", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    server = StubServer(args.root, args.port, args.drop_after, args.fail_every, verbose=True, api_pages=args.api_pages)
+    print(f"Serving {args.root} on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
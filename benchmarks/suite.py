@@ -0,0 +1,341 @@
+"""Benchmark suite: ingest, persistence, crawling, hashing, metadata
+rewrite and dump.
+
+Every stage runs on generated inputs (API pages, .safetensors files,
+preview images) against a scratch database, with a local stand-in for
+civitai.com serving the API, the downloads and the images. For each
+stage the suite reports throughput, latency percentiles per operation
+and peak RSS, keeping the fastest of `--repeat` runs with fresh inputs.
+Results are saved as JSON, and a previous result file can be passed as
+a baseline to spot regressions.
+
+Stages:
+  ingest.orm            parse_models_page on decoded pages, rows/s
+  ingest.rows           ingest.parse_page on decoded pages, rows/s
+  persist.save_page     save_page of ORM objects into an empty database, rows/s
+  persist.save_rows     save_rows of row tuples into an empty database, rows/s
+  crawl                 ModelsCrawler.follow against the stub API, models/s
+  hash.hash_file        safetensors_hack.hash_file, MB/s
+  hash.legacy_hash_file safetensors_hack.legacy_hash_file, MB/s
+  hash.stream           hashing.hash_stream_file (the download-time hasher), MB/s
+  metadata.write        lora_util.write_lora_metadata with cover images, MB/s
+  dump                  DumpPipeline end to end from the stub, versions/s
+
+Usage:
+  python -m benchmarks.suite [--stages NAMES] [--output FILE] [--baseline FILE] [--threshold PCT] [options]
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import base64
+import hashlib
+import argparse
+import tempfile
+import contextlib
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from benchmarks import generators, harness
+from benchmarks.stub_server import StubServer, reroute
+from src import lora_util, safetensors_hack
+from src.civit_api import parse_models_page
+from src.crawler import ModelsCrawler
+from src.database import create_database_engine, init_database
+from src.dump_pipeline import DumpJob, DumpPipeline
+from src.hash_cache import HashCache
+from src.hashing import hash_stream_file
+from src.image_store import ImageStore
+from src.ingest import loads, parse_page
+from src.models import Model, load_model_tree
+from src.persistence import save_page, save_rows
+
+class Fixtures:
+    """Inputs shared by the stages, built on first use in a scratch directory."""
+    def __init__(self, args, workdir: str):
+        self.args = args
+        self.workdir = workdir
+        self._pages = None
+        self._files = None
+        self._server = None
+
+    @property
+    def pages(self) -> list[bytes]:
+        """Encoded API pages, as they come off the wire."""
+        if self._pages is None:
+            if self.args.archive:
+                pages = generators.archived_pages(self.args.archive, self.args.pages)
+            else:
+                pages = [generators.synthetic_page(p, self.args.page_size, self.args.seed) for p in range(self.args.pages)]
+            self._pages = [json.dumps(page).encode("utf8") for page in pages]
+        return self._pages
+
+    @property
+    def files(self) -> list[str]:
+        """Model files for the hashing and metadata stages."""
+        if self._files is None:
+            root = os.path.join(self.workdir, "files")
+            os.makedirs(root)
+            self._files = []
+            for i in range(self.args.files):
+                path = os.path.join(root, f"model_{i}.safetensors")
+                generators.write_safetensors(path, self.args.file_mb * 2**20, self.args.tensors, seed=self.args.seed + i)
+                self._files.append(path)
+        return self._files
+
+    @property
+    def server(self):
+        """The civitai.com stand-in, with the shared HTTP client routed to it."""
+        if self._server is None:
+            root = os.path.join(self.workdir, "served")
+            os.makedirs(root)
+            self._server = StubServer(root, api_pages=self.args.pages, seed=self.args.seed).start()
+            reroute(self._server)
+        return self._server
+
+    def database(self, name: str):
+        """A new empty database, every call gets its own file."""
+        engine = create_database_engine(os.path.join(tempfile.mkdtemp(dir=self.workdir), name))
+        init_database(engine)
+        return engine
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+
+
+@contextlib.contextmanager
+def quiet():
+    """Hides the per-file progress lines the library code prints."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def _mb(path: str) -> float:
+    return os.path.getsize(path) / 2**20
+
+
+# Each benchmark is a setup, run before measuring, and a body that records
+# every operation on the stage.
+
+def bench_ingest_orm(stage, pages):
+    for raw in pages:
+        start = time.perf_counter()
+        _, models, versions, files, images = parse_models_page(json.loads(raw))
+        rows = len(models) + len(versions) + len(files) + len(images)
+        rows += sum(len(m.tag_links) for m in models) + sum(len(v.trained_word_links) for v in versions)
+        stage.record(time.perf_counter() - start, rows)
+
+
+def bench_ingest_rows(stage, pages):
+    for raw in pages:
+        start = time.perf_counter()
+        _, rows = parse_page(loads(raw))
+        stage.record(time.perf_counter() - start, sum(len(r) for _, r in rows.tables()))
+
+
+def setup_save_page(fx):
+    return fx.database("save_page"), [parse_models_page(json.loads(raw))[1:] for raw in fx.pages]
+
+
+def bench_save_page(stage, setup):
+    engine, pages = setup
+    for parsed in pages:
+        start = time.perf_counter()
+        stats = save_page(engine, *parsed)
+        stage.record(time.perf_counter() - start, stats.total_rows)
+
+
+def setup_save_rows(fx):
+    return fx.database("save_rows"), [parse_page(loads(raw))[1] for raw in fx.pages]
+
+
+def bench_save_rows(stage, setup):
+    engine, pages = setup
+    for rows in pages:
+        start = time.perf_counter()
+        stats = save_rows(engine, rows)
+        stage.record(time.perf_counter() - start, stats.total_rows)
+
+
+def setup_crawl(fx):
+    fx.server
+    return ModelsCrawler({"limit": fx.args.page_size}, workers=1, rate=1e6)
+
+
+def bench_crawl(stage, crawler):
+    start = time.perf_counter()
+    for _, data, _ in crawler.follow():
+        stage.record(time.perf_counter() - start, len(data["items"]))
+        start = time.perf_counter()
+
+
+def _bench_files(stage, files, func):
+    for path in files:
+        with stage.measure(_mb(path)):
+            func(path)
+
+
+def bench_hash_file(stage, files):
+    _bench_files(stage, files, safetensors_hack.hash_file)
+
+
+def bench_legacy_hash_file(stage, files):
+    _bench_files(stage, files, safetensors_hack.legacy_hash_file)
+
+
+def bench_hash_stream(stage, files):
+    _bench_files(stage, files, hash_stream_file)
+
+
+def setup_metadata_write(fx):
+    # Three cover thumbnails are the bulk of the metadata written by dump.
+    covers = [base64.b64encode(generators.preview_jpeg(256, 384, seed=i)).decode("ascii") for i in range(3)]
+    return fx.files, json.dumps(covers)
+
+
+def bench_metadata_write(stage, setup):
+    files, covers = setup
+    with quiet():
+        for i, path in enumerate(files):
+            with stage.measure(_mb(path)):
+                lora_util.write_lora_metadata(path, {"ssmd_cover_images": covers, "ssmd_version": f"v{i}"})
+
+
+def setup_dump(fx):
+    """Stores LoRA versions whose downloads and images the stub serves,
+    and returns their dump jobs."""
+    server = fx.server
+    page = generators.synthetic_page(0, fx.args.dump_versions, fx.args.seed, base_url=server.url)
+    for i, item in enumerate(page["items"]):
+        item["type"] = "LORA"
+        version = item["modelVersions"][0]
+        item["modelVersions"] = [version]
+        version["images"] = version["images"][:3]
+        path = os.path.join(server.root, f"{version['id']}.safetensors")
+        generators.write_safetensors(path, fx.args.dump_file_mb * 2**20, fx.args.tensors, seed=fx.args.seed + i)
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(2**20), b""):
+                sha256.update(chunk)
+        file = version["files"][0]
+        file.update({"sizeKB": os.path.getsize(path) / 1024, "hashes": {"SHA256": sha256.hexdigest().upper()}})
+        version["files"] = [file]
+
+    engine = fx.database("dump")
+    save_rows(engine, parse_page(page)[1])
+    out = os.path.join(tempfile.mkdtemp(dir=fx.workdir), "CivitAI")
+    with Session(engine) as session:
+        jobs = [
+            DumpJob(model, version, version.files[0], out)
+            for model in session.scalars(select(Model).options(*load_model_tree()))
+            for version in model.versions
+        ]
+    return engine, out, jobs, fx.args
+
+
+def bench_dump(stage, setup):
+    class TimedPipeline(DumpPipeline):
+        # Latency of a version: from the start of its download to the end
+        # of its processing.
+        def download(self, job):
+            job.bench_start = time.perf_counter()
+            super().download(job)
+
+        def process(self, job):
+            super().process(job)
+            stage.record(time.perf_counter() - job.bench_start)
+
+    engine, out, jobs, args = setup
+    pipeline = TimedPipeline(
+        ImageStore(os.path.join(out, ".images")),
+        connections=args.connections, cpu_workers=args.cpu_workers, hash_cache=HashCache(engine),
+    )
+    with quiet():
+        failures = pipeline.run(jobs, total=len(jobs))
+    if failures:
+        raise RuntimeError(f"{len(failures)} dump jobs failed: {failures[0]['exception']}")
+
+
+def _pages(fx):
+    return fx.pages
+
+
+def _files(fx):
+    return fx.files
+
+
+# name: (unit, setup, body)
+BENCHMARKS = {
+    "ingest.orm": ("rows", _pages, bench_ingest_orm),
+    "ingest.rows": ("rows", _pages, bench_ingest_rows),
+    "persist.save_page": ("rows", setup_save_page, bench_save_page),
+    "persist.save_rows": ("rows", setup_save_rows, bench_save_rows),
+    "crawl": ("models", setup_crawl, bench_crawl),
+    "hash.hash_file": ("MB", _files, bench_hash_file),
+    "hash.legacy_hash_file": ("MB", _files, bench_legacy_hash_file),
+    "hash.stream": ("MB", _files, bench_hash_stream),
+    "metadata.write": ("MB", setup_metadata_write, bench_metadata_write),
+    "dump": ("versions", setup_dump, bench_dump),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stages", default=",".join(BENCHMARKS), help="Comma separated stages to run")
+    parser.add_argument("--pages", type=int, default=20, help="API pages for the ingest, persist and crawl stages")
+    parser.add_argument("--page-size", type=int, default=100, help="Models per generated page")
+    parser.add_argument("--archive", help="Take the ingest and persist pages from a response archive")
+    parser.add_argument("--files", type=int, default=4, help="Files for the hash and metadata stages")
+    parser.add_argument("--file-mb", type=int, default=64, help="Tensor data per file, in MB")
+    parser.add_argument("--tensors", type=int, default=64, help="Tensors per generated file")
+    parser.add_argument("--dump-versions", type=int, default=8, help="Versions downloaded by the dump stage")
+    parser.add_argument("--dump-file-mb", type=int, default=16, help="Size of each dumped model file, in MB")
+    parser.add_argument("--connections", type=int, default=4, help="Dump download threads")
+    parser.add_argument("--cpu-workers", type=int, default=2, help="Dump processing threads")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage with fresh inputs, the fastest is kept")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of every generated input")
+    parser.add_argument("--dir", default=None, help="Scratch directory, defaults to a temp dir")
+    parser.add_argument("--output", default="benchmark-results.json", help="Where to save the results")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Percent change counted as a regression")
+    args = parser.parse_args(argv)
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(unknown)}")
+
+    results = {"environment": harness.environment(vars(args)), "stages": {}}
+    workdir = tempfile.mkdtemp(dir=args.dir)
+    fx = Fixtures(args, workdir)
+    try:
+        for name in stages:
+            unit, setup, bench = BENCHMARKS[name]
+            result = None
+            for _ in range(max(1, args.repeat)):
+                prepared = setup(fx)
+                run = harness.run_stage(name, unit, lambda stage: bench(stage, prepared))
+                if result is None or run["throughput"] > result["throughput"]:
+                    result = run
+            results["stages"][name] = result
+            print(harness.format_stage(name, result), flush=True)
+    finally:
+        fx.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    harness.save_results(args.output, results)
+    print(f"Results saved to {args.output}")
+    if args.baseline:
+        regressions = harness.compare(results, harness.load_results(args.baseline), args.threshold)
+        if regressions:
+            print(f"Regressions over {args.threshold:.0f}%: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
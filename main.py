@@ -7,6 +7,11 @@ Usage:
   main.py tags [options]
   main.py sync [options]
   main.py dump [options]
+  main.py search [options]
+  main.py rehash <path> [options]
+  main.py convert <path> [options]
+  main.py index <path> [options]
+  main.py replay <path> [options]
   main.py verify [options]
   main.py (-h | --help)
   main.py --version
@@ -16,39 +21,42 @@ Options:
     -l LIMIT, --limit LIMIT     Limit items returned
     --period PERIOD             Something???
     -q QUERY, --query QUERY     Text query
-    -p PAGE, --page PAGE        Pagination offset
+    -p PAGE, --page PAGE        Pagination offset, models get follows the API cursor when omitted
+    --restart                   Start models get over instead of resuming an unfinished crawl
     -r RATING, --rating RATING  Search by model ratings
     -s SORT, --sort SORT        Sort results by
     --save                      Save results to database
+    --local                     Use the local database instead of the API
     -t TAG, --tag TAG           Tag search
     -t TYPE, --type TYPE        Model type
     -u USER, --username USER    Model creator username
     -o PATH, --output PATH      Output directory
+    --workers N                 Requests kept in flight, or parallel jobs in rehash/convert/index/replay [default: 4]
+    --rate RATE                 Maximum API requests per second, halved on each 429 and recovered gradually [default: 5]
+    --connections N             Concurrent downloads in dump [default: 4]
+    --cpu-workers N             Concurrent hash/convert jobs in dump [default: 2]
+    --bandwidth BYTES           Download limit per second in dump, e.g. 20M
+    --segments N                Parallel byte ranges per large file in dump [default: 1]
+    --image-store PATH          Preview image cache for dump, defaults to CivitAI/.images under the output
+    --response-archive PATH     Where raw API responses are archived [default: responses]
+    --no-response-archive       Do not archive API responses
+    --max-age DAYS              Re-probe versions verified longer ago than this [default: 7]
+    --memory-budget BYTES       Memory per conversion process in convert, e.g. 4G, --workers times that in total
+    --archive PATH              Move converted .pt/.ckpt files here instead of deleting them
+    --metrics PATH              Write stage timings and counters to PATH at exit, Prometheus text for .prom/.txt, JSON otherwise
+    --profile PATH              Profile the run with cProfile, save the stats to PATH and print the slowest functions
 
     -v --verbose    Increase verbosity
     -h --help       Show this screen.
     --version       Show version.
 """
-from sqlalchemy import create_engine, select, func
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 import os
 import os.path
-import io
-import time
 import json
-import tqdm
-import traceback
-from PIL import PngImagePlugin, Image
-import markdownify
-from pathvalidate import sanitize_filepath
 from docopt import docopt
-import requests
-import base64
 
-from src.models import Base, Model, ModelVersion, ModelVersionFile, ModelVersionImage
-from src.civit_api import get_creators, get_models, get_model, get_model_version, get_tags
-from src import safetensors_hack, lora_util, sd_models
+# Everything else is imported inside the command that needs it: SQLAlchemy,
+# PIL and especially torch add seconds to the startup of every command.
 
 DATABASE_NAME = os.getenv("DATABASE_NAME","civitai_default_db")
 
@@ -61,36 +69,23 @@ DATABASE_NAME = os.getenv("DATABASE_NAME","civitai_default_db")
 #    shutil.copy(DATABASE_NAME + ".db", path)
 #    os.remove(DATABASE_NAME + ".db")
 
-engine = create_engine(f"sqlite:///{DATABASE_NAME}.db")
-Base.metadata.create_all(engine)
-Session = sessionmaker(bind=engine)
 
-VERBOSE = False
-MAX_COVER_IMAGES = 3
-
-def convert_civitai_meta(meta):
-    if meta is None:
-        return None
+def open_database():
+    """Creates the database engine and session factory, migrating the schema.
 
-    meta = json.loads(meta)
-    if meta is None:
-        return None
+    Returns:
+        tuple[Engine, sessionmaker]: Engine and session factory.
+    """
+    from sqlalchemy.orm import sessionmaker
+    from src.database import create_database_engine, init_database
 
-    prompt = meta.pop("prompt", "")
-    neg_prompt = meta.pop("negativePrompt", None)
-    seed = meta.pop("seed", "-1")
-    steps = meta.pop("steps", "20")
-    sampler = meta.pop("sampler", "Euler a")
-    cfgScale = meta.pop("cfgScale", "7")
+    engine = create_database_engine(DATABASE_NAME)
+    init_database(engine)
+    return engine, sessionmaker(bind=engine)
 
-    meta["Seed"] = seed
-    meta["Steps"] = steps
-    meta["Sampler"] = sampler
-    meta["CFG Scale"] = cfgScale
 
-    generation_params_text = ", ".join([k if k == v else f'{k}: {v}' for k, v in meta.items() if v is not None])
-    negative_prompt_text = "\nNegative prompt: " + neg_prompt if neg_prompt else ""
-    return f"{prompt}{negative_prompt_text}\n{generation_params_text}".strip()
+VERBOSE = False
+MODEL_BATCH_SIZE = 100
 
 if __name__ == '__main__':
     arguments = docopt(
@@ -102,7 +97,33 @@ if __name__ == '__main__':
     if arguments['--verbose']:
         VERBOSE = True
 
+    if arguments['--profile']:
+        import atexit
+        from src.profiling import Profiler
+
+        profiler = Profiler()
+        profiler.start()
+        atexit.register(profiler.stop, arguments['--profile'])
+
+    if arguments['--metrics']:
+        import atexit
+        from src import metrics
+
+        def report_metrics(path):
+            metrics.write_report(path)
+            print(metrics.get_registry().summary())
+            print(f"Metrics written to {path}")
+
+        atexit.register(report_metrics, arguments['--metrics'])
+
+    if not arguments['--no-response-archive'] and (arguments["models"] or arguments["sync"] or arguments["dump"]):
+        from src.archive import set_archive
+
+        set_archive(arguments['--response-archive'])
+
     if arguments["creators"]:
+        from src.civit_api import get_creators
+
         passed_args = {}
         if arguments['--limit']:
             passed_args["limit"]=arguments['--limit']
@@ -115,11 +136,15 @@ if __name__ == '__main__':
         get_creators(**passed_args)
     elif arguments["models"]:
         if arguments["get"]:
+            from src import http_client
+            from src.crawler import ModelsCrawler
+            from src.ingest import parse_page
+            from src.persistence import PersistStats, save_rows
+
+            engine, Session = open_database()
             passed_args = {}
             if arguments['--limit']:
                 passed_args["limit"]=arguments['--limit']
-            if arguments['--page']:
-                passed_args["page"]=arguments['--page']
             if arguments['--query']:
                 passed_args["query"]=arguments['--query']
             if arguments['--tag']:
@@ -127,55 +152,74 @@ if __name__ == '__main__':
             if arguments['--username']:
                 passed_args["username"]=arguments['--username']
             if arguments['--type']:
-                passed_args["type"]=arguments['--type']
+                passed_args["model_type"]=arguments['--type']
             if arguments['--sort']:
                 passed_args["sort"]=arguments['--sort']
             if arguments['--period']:
                 passed_args["period"]=arguments['--period']
             if arguments['--rating']:
                 passed_args["rating"]=arguments['--rating']
-            if arguments['--save']:
-                passed_args["save"]=arguments['--save']
-
-            max_pages = 9999
-            page = 1
-            passed_args["page"] = page
-
-            while page <= max_pages:
-                try:
-                    metadata, models, modelVersions, modelVersionFiles, modelVersionImages = get_models(**passed_args)
-                except RuntimeError as ex:
-                    print(f"!!! FAILED to get page: {ex}")
-                    time.sleep(60 * 10)
-                    continue
-
-                max_pages = metadata["totalPages"]
-
-                import json
-                print(json.dumps(metadata))
-                session = Session()
-                # session.add_all(models)
-                # session.add_all(modelVersions)
-                # session.add_all(modelVersionFiles)
-                # session.add_all(modelVersionImages)
-                for m in models + modelVersions + modelVersionFiles + modelVersionImages:
-                    session.merge(m)
-                session.commit()
-                page += 1
-                passed_args["page"] = page
-
-                time.sleep(60)
+
+            if arguments['--page'] is None:
+                from src.sync import crawl_models
+
+                crawl_models(
+                    engine, Session, passed_args,
+                    rate=float(arguments['--rate']),
+                    restart=arguments['--restart'],
+                )
+            else:
+                # An explicit offset: fetch pages concurrently by number.
+                first_page = int(arguments['--page'])
+                crawler = ModelsCrawler(
+                    passed_args,
+                    workers=int(arguments['--workers']),
+                    rate=float(arguments['--rate']),
+                )
+                total_stats = PersistStats()
+
+                for page, data in crawler.crawl(first_page):
+                    metadata, rows = parse_page(data)
+                    print(json.dumps(metadata))
+                    stats = save_rows(engine, rows)
+                    total_stats.add(stats)
+                    print(f"Saved page {page}/{metadata.get('totalPages')}: {stats}")
+                    print(f"Total: {total_stats}")
+
+                if crawler.failed_pages:
+                    print(f"!!! Pages that could not be fetched: {sorted(crawler.failed_pages)}")
+            print(f"HTTP: {http_client.get_client().stats}")
 
         elif arguments["download"]:
             raise Exception('Not Implemented Yet!')
     elif arguments["version"]:
+        from src.civit_api import get_model_version
+
         passed_args = {}
         if arguments['--id']:
             passed_args["model_versions_id"]=arguments['--id']
         if arguments['--save']:
             passed_args["save"]=arguments['--save']
         get_model_version(**passed_args)
+    elif arguments["tags"] and arguments["--local"]:
+        from sqlalchemy import select, func
+        from src.models import ModelTag
+
+        engine, Session = open_database()
+        stmt = (
+            select(ModelTag.tag, func.count().label("models"))
+            .group_by(ModelTag.tag)
+            .order_by(func.count().desc())
+            .limit(int(arguments['--limit'] or 20))
+        )
+        if arguments['--query']:
+            stmt = stmt.where(ModelTag.tag.contains(arguments['--query']))
+        with Session() as session:
+            for tag, count in session.execute(stmt):
+                print(f"{count:>8}  {tag}")
     elif arguments["tags"]:
+        from src.civit_api import get_tags
+
         passed_args = {
             "limit":arguments['--limit'],
             "page":arguments['--page'],
@@ -184,14 +228,98 @@ if __name__ == '__main__':
         }
         get_tags(**passed_args)
     elif arguments["sync"]:
-        raise Exception('Not Implemented Yet!')
+        from src import http_client
+        from src.sync import sync_models
+
+        engine, Session = open_database()
+        passed_args = {}
+        if arguments['--limit']:
+            passed_args["limit"]=arguments['--limit']
+        if arguments['--tag']:
+            passed_args["tag"]=arguments['--tag']
+        if arguments['--username']:
+            passed_args["username"]=arguments['--username']
+        if arguments['--type']:
+            passed_args["model_type"]=arguments['--type']
+        sync_models(engine, Session, passed_args, rate=float(arguments['--rate']))
+        print(f"HTTP: {http_client.get_client().stats}")
+    elif arguments["search"]:
+        if not arguments['--query']:
+            raise Exception("search requires --query")
+        from src.search import search_models
+
+        engine, Session = open_database()
+        with engine.connect() as conn:
+            results = search_models(conn, arguments['--query'], limit=int(arguments['--limit'] or 20), model_type=arguments['--type'])
+        for id, name, type, creator, rank in results:
+            print(f"{rank:8.2f}  {id:>7}  {type or '':<16} {name} (by {creator or ''})")
+        print(f"{len(results)} results")
+    elif arguments["rehash"]:
+        from src.hash_cache import HashCache
+
+        engine, Session = open_database()
+        counts = HashCache(engine).rehash(arguments['<path>'], workers=int(arguments['--workers']))
+        print(f"Hash cache: {counts['fresh']} fresh, {counts['hashed']} hashed, {counts['failed']} failed, {counts['removed']} removed")
+    elif arguments["convert"]:
+        from src.convert import convert_files, find_checkpoints
+        from src.dump_pipeline import parse_size
+        from src.hash_cache import HashCache
+
+        engine, Session = open_database()
+        paths = find_checkpoints(arguments['<path>'])
+        print(f"Converting {len(paths)} checkpoints")
+        counts = convert_files(
+            paths,
+            workers=int(arguments['--workers']),
+            memory_budget=parse_size(arguments['--memory-budget']) if arguments['--memory-budget'] else None,
+            archive_dir=arguments['--archive'],
+            root=arguments['<path>'],
+            hash_cache=HashCache(engine),
+        )
+        print(f"Converted {counts['converted']}, failed {counts['failed']}")
+    elif arguments["index"]:
+        from sqlalchemy import select, func
+        from src.models import LocalModelFile
+        from src.safetensors_index import scan_directory
+
+        engine, Session = open_database()
+        counts = scan_directory(engine, arguments['<path>'], workers=int(arguments['--workers']))
+        print(f"Index: {counts['fresh']} fresh, {counts['indexed']} indexed, {counts['failed']} failed, {counts['removed']} removed")
+        stmt = (
+            select(LocalModelFile.base_model, func.count(), func.sum(LocalModelFile.parameter_count))
+            .group_by(LocalModelFile.base_model)
+            .order_by(func.count().desc())
+        )
+        with engine.connect() as conn:
+            for base_model, files, parameters in conn.execute(stmt):
+                print(f"{files:>8} files  {parameters or 0:>16,} parameters  {base_model or '(unknown base model)'}")
+    elif arguments["replay"]:
+        from src.archive import replay
+
+        engine, Session = open_database()
+        stats = replay(engine, arguments['<path>'], workers=int(arguments['--workers']))
+        print(f"Replayed: {stats}")
     elif arguments["verify"]:
-        failures = []
-        stmt = select(Model).where(Model.type == "LORA")
+        from datetime import timedelta
+        from sqlalchemy import select
+        from src import http_client
+        from src.database import QueryCounter
+        from src.models import Model, load_model_tree, has_tag
+        from src.verify import Verifier, VerifyTarget, needs_probe
+
+        engine, Session = open_database()
+        queries = QueryCounter(engine)
+        stmt = (
+            select(Model)
+            .where(Model.type == "LORA")
+            .options(*load_model_tree())
+            .execution_options(yield_per=MODEL_BATCH_SIZE)
+        )
+        if arguments["--tag"]:
+            stmt = stmt.where(has_tag(arguments["--tag"]))
+        targets = []
         with Session() as session:
-            total = session.query(Model).filter(Model.type == "LORA").with_entities(func.count()).scalar()
-            for row in tqdm.tqdm(session.execute(stmt), total=total):
-                model = row[0]
+            for model in session.scalars(stmt):
                 for version in model.versions:
                     formats = {f.format: True for f in version.files if f.type == "Model"}
                     has_safetensors = "SafeTensor" in formats
@@ -200,22 +328,33 @@ if __name__ == '__main__':
                         format = "PickleTensor"
 
                     file = next(filter(lambda f: f.type == "Model" and f.format == format, version.files), None)
-                    if file is None:
-                       print(f"No file! {model.id} {model.name}")
-                       failures.append((model, version, "No file!"))
-                       continue
-                    response = requests.get(version.download_url + f"?type={file.type}&format={file.format}", allow_redirects=True, stream=True)
-                    chunk = next(response.iter_content(512), None)
-                    if response.status_code != 200 or not chunk:
-                        print(response.content)
-                        print(response.status_code)
-                        failures.append((model, version, response.content))
+                    url = version.download_url + f"?type={file.type}&format={file.format}" if file else None
+                    targets.append(VerifyTarget(model.id, model.name, version.id, version.name, url))
+
+        # Only versions never checked, failed last time or checked too long ago.
+        stale = needs_probe(engine, [t.version_id for t in targets], timedelta(days=float(arguments['--max-age'])))
+        print(f"Verifying {len(stale)} of {len(targets)} versions")
+        verifier = Verifier(engine, workers=int(arguments['--workers']), rate=float(arguments['--rate']))
+        failures = verifier.run([t for t in targets if t.version_id in stale])
 
         print("Missing models:")
-        for model, version, content in failures:
-            print(f"  {model.id} - {model.name} ({version.name})")
+        for target, result in failures:
+            print(f"  {target.model_id} - {target.model_name} ({target.version_name})")
+        print(f"Queries: {queries.count}")
+        print(f"HTTP: {http_client.get_client().stats}")
 
     elif arguments["dump"]:
+        from sqlalchemy import select, func
+        from src import http_client
+        from src.civit_api import get_model
+        from src.database import QueryCounter
+        from src.dump_pipeline import DumpJob, DumpPipeline, parse_size
+        from src.hash_cache import HashCache
+        from src.image_store import ImageStore
+        from src.models import Model, ModelVersion, load_model_tree, has_tag
+        from src.persistence import save_page
+
+        engine, Session = open_database()
         ids = []
         query = None
         user = None
@@ -225,6 +364,7 @@ if __name__ == '__main__':
             query=arguments["--query"]
         if arguments["--username"]:
             user=arguments["--username"]
+        tag = arguments["--tag"]
 
         path = "."
         if arguments['--output']:
@@ -235,8 +375,14 @@ if __name__ == '__main__':
         print(f"Saving models to {path}...")
         failures = []
 
+        queries = QueryCounter(engine)
         model_types = ["LORA", "LoCon", "LyCORIS"]
-        stmt = select(Model).where(Model.type.in_(model_types))
+        stmt = (
+            select(Model)
+            .where(Model.type.in_(model_types))
+            .options(*load_model_tree())
+            .execution_options(yield_per=MODEL_BATCH_SIZE)
+        )
         count_stmt = select(func.count()).select_from(Model).where(Model.type.in_(model_types))
         if ids:
             stmt = stmt.where(Model.id.in_(ids))
@@ -247,6 +393,9 @@ if __name__ == '__main__':
         if user:
             stmt = stmt.filter(Model.creator_username.contains(user))
             count_stmt = count_stmt.filter(Model.creator_username.contains(user))
+        if tag:
+            stmt = stmt.where(has_tag(tag))
+            count_stmt = count_stmt.where(has_tag(tag))
 
         with Session() as session:
             total = session.scalar(count_stmt)
@@ -255,133 +404,54 @@ if __name__ == '__main__':
                     for id in ids:
                         print(f"Fetching model {id}...")
                         model, modelVersions, modelVersionFiles, modelVersionImages = get_model(id)
-                        for m in [model] + modelVersions + modelVersionFiles + modelVersionImages:
-                            session.merge(m)
-                        session.commit()
+                        save_page(engine, [model], modelVersions, modelVersionFiles, modelVersionImages)
                     total = session.scalar(count_stmt)
                     assert total >= len(ids)
                 else:
                     raise Exception(f"No results! {total} {len(ids)}")
 
-            for row in tqdm.tqdm(session.execute(stmt), total=total):
-                model = row[0]
-                print(f"Model: {model.id} - {model.name}")
-                for version in model.versions:
-                    try:
-                        print(f"  Version: {version.id} - {version.name}")
+            version_count_stmt = (
+                select(func.count())
+                .select_from(ModelVersion)
+                .where(ModelVersion.parent_id.in_(count_stmt.with_only_columns(Model.id)))
+            )
+            total_versions = session.scalar(version_count_stmt)
+
+            def dump_jobs():
+                for model in session.scalars(stmt):
+                    print(f"Model: {model.id} - {model.name}")
+                    for version in model.versions:
                         formats = {f.format: True for f in version.files if f.type == "Model"}
                         has_safetensors = "SafeTensor" in formats
                         format = "SafeTensor"
                         if not has_safetensors:
                             format = "PickleTensor"
 
-                        file = next(filter(lambda f: f.type == "Model" and f.format == format, version.files))
+                        file = next(filter(lambda f: f.type == "Model" and f.format == format, version.files), None)
                         if file is None:
-                            raise Exception(f"No file! {model.id} {model.name}")
-
-                        parent_path = sanitize_filepath(os.path.join(path, f"{model.id} - {model.name}"), platform="Windows")
-
-                        print("Downloading preview images...")
-                        cover_images = []
-                        for i, image in tqdm.tqdm(enumerate(version.images), total=len(version.images)):
-                            basename = os.path.splitext(file.name)[0]
-                            suffix = "preview"
-                            if i > 0:
-                                suffix = f"preview.{i}"
-                            outpath = sanitize_filepath(os.path.join(parent_path, f"{basename}.{suffix}.png"), platform="Windows")
-                            if os.path.exists(outpath):
-                                print(f"Path already exists, skipping: {outpath}")
-                                continue
-
-                            os.makedirs(os.path.dirname(outpath), exist_ok=True)
-                            resp = requests.get(image.url)
-
-                            try:
-                                pil = Image.open(io.BytesIO(resp.content))
-
-                                with io.BytesIO() as output_bytes:
-                                    metadata = PngImagePlugin.PngInfo()
-                                    meta = convert_civitai_meta(image.meta)
-                                    if meta:
-                                        metadata.add_text("parameters", meta)
-                                    pil.save(output_bytes, "PNG", pnginfo=(metadata))
-                                    bytes_data = output_bytes.getvalue()
-
-                                with open(outpath, "wb") as f:
-                                    f.write(bytes_data)
-
-                                if len(cover_images) < MAX_COVER_IMAGES:
-                                    cover_images.append(base64.b64encode(bytes_data).decode("ascii"))
-                            except Exception as ex:
-                                print(f"!!! FAILED saving preview image: {ex}")
-
-
-                        outpath = sanitize_filepath(os.path.join(parent_path, f"{file.name}"), platform="Windows")
-                        os.makedirs(os.path.dirname(outpath), exist_ok=True)
-
-                        model_path = outpath
-                        bn, ext = os.path.splitext(outpath)
-                        if ext != ".safetensors":
-                            model_path = f"{bn}.safetensors"
-
-                        if os.path.exists(model_path):
-                            print(f"Path already exists, skipping: {outpath}")
+                            print(f"No file! {model.id} {model.name} ({version.name})")
+                            failures.append({"model_id": model.id, "version_id": version.id, "exception": "No file!"})
                             continue
-
-                        print(f"Saving: {outpath}")
-                        if not os.path.isfile(outpath):
-                            response = requests.get(version.download_url + f"?type={file.type}&format={file.format}", stream=True)
-                            total_size_in_bytes = int(response.headers.get('content-length', 0))
-                            progress_bar = tqdm.tqdm(total=total_size_in_bytes, unit='iB', unit_scale=True)
-                            try:
-                                with open(outpath, "wb") as f:
-                                    for chunk in response.iter_content(1024):
-                                        progress_bar.update(len(chunk))
-                                        f.write(chunk)
-                                    progress_bar.close()
-                            except KeyboardInterrupt:
-                                progress_bar.close()
-                                print(f"*** DELETING partial file: {outpath}")
-                                os.unlink(outpath)
-                                print("Interrupted, exiting.")
-                                exit(1)
-                        else:
-                            print("Using model file on disk.")
-
-                        if ext != ".safetensors":
-                            legacy_hash = sd_models.model_hash(outpath) # use .pt legacy hash
-                            outpath = lora_util.convert_pt_to_safetensors(outpath)
-                        else:
-                            legacy_hash = safetensors_hack.legacy_hash_file(outpath)
-
-                        assert os.path.splitext(outpath)[1] == ".safetensors"
-
-                        description = model.description or ""
-                        if version.description:
-                            description += "<hr>"
-                            description += version.description
-
-                        model_hash = safetensors_hack.hash_file(outpath)
-                        metadata = {
-                            "ssmd_cover_images": json.dumps(cover_images),
-                            "ssmd_display_name": f"{model.name}",
-                            "ssmd_author": model.creator_username,
-                            "ssmd_version": version.name,
-                            "ssmd_source": f"https://civitai.com/models/{model.id}",
-                            "ssmd_keywords": ", ".join(json.loads(version.trained_words)),
-                            "ssmd_description": markdownify.markdownify(description, heading_style="ATX"),
-                            "ssmd_rating": "0",
-                            "ssmd_tags": ", ".join(json.loads(model.tags)),
-                            "sshs_model_hash": model_hash,
-                            "sshs_legacy_hash": legacy_hash
-                           }
-                        lora_util.write_lora_metadata(outpath, metadata)
-                    except Exception as ex:
-                        exs = ''.join(traceback.TracebackException.from_exception(ex).format())
-                        print(f"Failed saving model: {exs}")
-                        failures.append({"model_id": model.id, "version_id": version.id, "exception": str(exs)})
+                        yield DumpJob(model, version, file, path)
+
+            bandwidth = parse_size(arguments['--bandwidth']) if arguments['--bandwidth'] else None
+            pipeline = DumpPipeline(
+                ImageStore(arguments['--image-store'] or os.path.join(path, ".images")),
+                connections=int(arguments['--connections']),
+                cpu_workers=int(arguments['--cpu-workers']),
+                bandwidth=bandwidth,
+                segments=int(arguments['--segments']),
+                hash_cache=HashCache(engine),
+            )
+            try:
+                failures += pipeline.run(dump_jobs(), total=total_versions)
+            except KeyboardInterrupt:
+                print("Interrupted, partial downloads are kept as .part files and resume next time.")
+                exit(1)
 
         with open("failures.json", "w") as f:
             json.dump(failures, f)
+        print(f"Queries: {queries.count}")
+        print(f"HTTP: {http_client.get_client().stats}")
     else:
         raise Exception("Arguments parsing failed")
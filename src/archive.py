@@ -0,0 +1,168 @@
+import os
+import gzip
+import json
+import atexit
+import itertools
+import threading
+import collections
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+
+from src.ingest import loads
+
+# Records per shard. Replay parses one shard per worker task, so this also
+# bounds how many parsed pages are in flight per worker.
+SHARD_RECORDS = 100
+
+
+class ResponseArchive:
+    """Appends raw API responses to gzip-compressed JSONL shards.
+
+    Each line holds the endpoint, the request params, the fetch time and
+    the decoded response, so the database can be rebuilt with `replay`
+    after a parser or schema change without re-crawling. Shards are named
+    after their creation time and are replayed in that order.
+
+    Args:
+        root (str): Archive directory.
+        shard_records (int, optional): Records per shard. Defaults to SHARD_RECORDS.
+    """
+    def __init__(self, root: str, shard_records: int = SHARD_RECORDS):
+        self.root = root
+        self.shard_records = shard_records
+        self.lock = threading.Lock()
+        self.file = None
+        self.count = 0
+        self.shards = 0
+        os.makedirs(root, exist_ok=True)
+
+    def _open_shard(self):
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        name = f"responses-{stamp}-{os.getpid()}-{self.shards:05d}.jsonl.gz"
+        self.shards += 1
+        self.count = 0
+        self.file = gzip.open(os.path.join(self.root, name), "wt", encoding="utf8")
+
+    def record(self, endpoint: str, params: dict, data: dict):
+        """Appends one response. Safe to call from several threads."""
+        line = json.dumps({
+            "endpoint": endpoint,
+            "params": params,
+            "fetched_at": datetime.now(timezone.utc).isoformat(),
+            "data": data,
+        }, separators=(",", ":"))
+        with self.lock:
+            if self.file is None or self.count >= self.shard_records:
+                self.close_shard()
+                self._open_shard()
+            self.file.write(line)
+            self.file.write("\n")
+            self.count += 1
+
+    def close_shard(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def close(self):
+        with self.lock:
+            self.close_shard()
+
+
+_archive = None
+
+
+def set_archive(root: str) -> ResponseArchive:
+    """Starts archiving every API response under `root` for this process."""
+    global _archive
+    _archive = ResponseArchive(root)
+    atexit.register(_archive.close)
+    return _archive
+
+
+def record(endpoint: str, params: dict, data: dict):
+    """Archives a response if `set_archive` was called, otherwise does nothing."""
+    if _archive is not None:
+        _archive.record(endpoint, params, data)
+
+
+def list_shards(root: str) -> list[str]:
+    """Returns the archive's shards, oldest first."""
+    shards = []
+    for dirpath, _, filenames in os.walk(root):
+        shards.extend(os.path.join(dirpath, name) for name in filenames if name.endswith(".jsonl.gz"))
+    return sorted(shards, key=os.path.basename)
+
+
+def read_shard(path: str):
+    """Yields the records of one shard. A shard cut short by a crash is read
+    up to its last complete line."""
+    try:
+        with gzip.open(path, "rt", encoding="utf8") as f:
+            for line in f:
+                if line.endswith("\n"):
+                    yield loads(line)
+    except (EOFError, gzip.BadGzipFile) as ex:
+        print(f"!!! Truncated archive shard {path}: {ex}")
+
+
+def iter_records(root: str):
+    """Yields every archived record, oldest first."""
+    for path in list_shards(root):
+        yield from read_shard(path)
+
+
+def _parse_shard(path: str) -> list:
+    """Process pool entry point: parses every record of a shard into the
+    `PageRows` that `save_rows` takes."""
+    from src.ingest import PageRows, parse_item, parse_page
+
+    pages = []
+    for record in read_shard(path):
+        data = record["data"]
+        if "items" in data:
+            pages.append(parse_page(data)[1])
+        else:
+            page = PageRows()
+            parse_item(data, page)
+            pages.append(page)
+    return pages
+
+
+def replay(engine, root: str, workers: int = None):
+    """Rebuilds the database from an archive without touching the network.
+
+    Shards are parsed in a process pool and written in archive order, so
+    later responses win. Unchanged models are skipped by `save_rows` as
+    usual, so replaying into an existing database only writes what a new
+    parser or schema changed.
+
+    Args:
+        engine (Engine): Database engine.
+        root (str): Archive directory.
+        workers (int, optional): Parsing processes. Defaults to the CPU count.
+
+    Returns:
+        PersistStats: Totals over every replayed page.
+    """
+    import tqdm
+    from src.persistence import PersistStats, save_rows
+
+    paths = list_shards(root)
+    shards = iter(paths)
+    total = PersistStats()
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor, tqdm.tqdm(total=len(paths), unit="shard") as progress:
+        # A bounded window of parsed shards, consumed in submission order.
+        window = collections.deque()
+        for path in itertools.islice(shards, workers * 2):
+            window.append(executor.submit(_parse_shard, path))
+        while window:
+            pages = window.popleft().result()
+            path = next(shards, None)
+            if path is not None:
+                window.append(executor.submit(_parse_shard, path))
+            for page in pages:
+                total.add(save_rows(engine, page))
+            progress.update(1)
+    return total
@@ -1,9 +1,28 @@
-import requests
-from src.models import Creator, Model, ModelVersion, Tag, ModelVersionFile, ModelVersionImage
+from src import archive, http_client, metrics
+from src.http_client import parse_retry_after
+from src.ingest import loads
+from src.models import Creator, Model, ModelVersion, Tag, ModelVersionFile, ModelVersionImage, ModelTag, VersionTrainedWord
 import json
+import hashlib
 from datetime import datetime
 import dateutil.parser
 
+
+API_HOST = "civitai.com"
+
+
+class RequestError(RuntimeError):
+    """Raised when the API answers with a non-200 status.
+
+    Args:
+        response (requests.Response): The failed response.
+    """
+    def __init__(self, response):
+        super().__init__(f"Failed request: {response}")
+        self.status_code = response.status_code
+        self.retry_after = parse_retry_after(response.headers.get("Retry-After"))
+
+
 def _request_creators(limit=20, page=1, query=None) -> dict:
     """_request_creators _summary_
 
@@ -17,7 +36,7 @@ def _request_creators(limit=20, page=1, query=None) -> dict:
     """
     endpoint = "https://civitai.com/api/v1/creators"
     params = {"limit": limit, "page": page, "query": query}
-    response = requests.get(endpoint, params=params, timeout=30)
+    response = http_client.get(endpoint, params=params, timeout=30)
     print(str(response))
     print(response.json())
     if response.status_code == 200:
@@ -67,6 +86,7 @@ def _request_models(
     sort=None,
     period=None,
     rating=None,
+    cursor=None,
 ) -> dict:
     """_request_models _summary_
 
@@ -80,6 +100,7 @@ def _request_models(
         sort (_type_, optional): _description_. Defaults to None.
         period (_type_, optional): _description_. Defaults to None.
         rating (_type_, optional): _description_. Defaults to None.
+        cursor (str, optional): `metadata.nextCursor` of the previous page, used instead of `page`. Defaults to None.
 
     Returns:
         dict: _description_
@@ -95,16 +116,42 @@ def _request_models(
         "sort": sort,
         "period": period,
         "rating": rating,
+        "cursor": cursor,
     }
-    response = requests.get(endpoint, params=params)
+    with metrics.timer("api.request"):
+        response = http_client.get(endpoint, params=params)
     if response.status_code == 200:
-        return response.json()
+        metrics.observe("api.response.bytes", len(response.content), metrics.SIZE_BUCKETS)
+        with metrics.timer("api.decode"):
+            data = loads(response.content)
+        with metrics.timer("archive.record"):
+            archive.record(endpoint, params, data)
+        return data
     else:
         from pprint import pp; pp(response.content)
-        raise RuntimeError(f"Failed request: {response}")
+        raise RequestError(response)
+
+
+def _fingerprint(objects) -> str:
+    """Hashes the column values of `objects`, used to detect unchanged models.
+
+    Only fields that are stored are hashed, so counters the API returns
+    (downloads, ratings) do not mark a model as changed.
+    """
+    hasher = hashlib.sha1()
+    for obj in objects:
+        row = [getattr(obj, c.key) for c in obj.__table__.columns if c.key != "fingerprint"]
+        hasher.update(json.dumps(row, default=str).encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def _unique_strings(values) -> list[str]:
+    """Strips, drops empty entries and de-duplicates while keeping order."""
+    return list(dict.fromkeys(v.strip() for v in values or [] if isinstance(v, str) and v.strip()))
 
 
 def parse_model(item, models, modelVersions, modelVersionFiles, modelVersionImages):
+    first = (len(modelVersions), len(modelVersionFiles), len(modelVersionImages))
     model = Model(
         id=int(item["id"]),
         name=item["name"],
@@ -115,6 +162,7 @@ def parse_model(item, models, modelVersions, modelVersionFiles, modelVersionImag
         creator_username=item["creator"]["username"],
         creator_image=item["creator"]["image"],
     )
+    model.tag_links = [ModelTag(model_id=model.id, tag=tag) for tag in _unique_strings(item["tags"])]
     models.append(model)
     for data in item["modelVersions"]:
         model_version = ModelVersion(
@@ -127,6 +175,9 @@ def parse_model(item, models, modelVersions, modelVersionFiles, modelVersionImag
             trained_words=json.dumps(data["trainedWords"]),
             parent_id=model.id
         )
+        model_version.trained_word_links = [
+            VersionTrainedWord(version_id=model_version.id, word=word) for word in _unique_strings(data["trainedWords"])
+        ]
         modelVersions.append(model_version)
 
         for file in data["files"]:
@@ -139,6 +190,7 @@ def parse_model(item, models, modelVersions, modelVersionFiles, modelVersionImag
                 pickle_scan_result=file["pickleScanResult"],
                 virus_scan_result=file["virusScanResult"],
                 scanned_at=dateutil.parser.parse(file["scannedAt"]) if file["scannedAt"] else datetime.min,
+                sha256=(file.get("hashes") or {}).get("SHA256"),
                 parent_id=model_version.id
             )
             modelVersionFiles.append(version_file)
@@ -155,6 +207,13 @@ def parse_model(item, models, modelVersions, modelVersionFiles, modelVersionImag
             )
             modelVersionImages.append(version_image)
 
+    model.fingerprint = _fingerprint(
+        [model]
+        + modelVersions[first[0]:]
+        + modelVersionFiles[first[1]:]
+        + modelVersionImages[first[2]:]
+    )
+
 
 def get_models(
     limit=100,
@@ -188,6 +247,22 @@ def get_models(
     data = _request_models(
         limit, page, query, tag, username, model_type, sort, period, rating
     )
+    return parse_models_page(data)
+
+
+@metrics.timer("api.parse_orm")
+def parse_models_page(data: dict) -> tuple[dict, list[Model]]:
+    """Parses a raw `/api/v1/models` response into ORM objects.
+
+    Split out of `get_models` so fetching and parsing can run as separate
+    pipeline stages.
+
+    Args:
+        data (dict): Decoded JSON response.
+
+    Returns:
+        tuple[dict, list[Model]]: Metadata, models, versions, files and images.
+    """
     # access the response metadata
     metadata = data["metadata"]  # totalItems,currentPage,pageSize,totalPages,nextPage
 
@@ -205,12 +280,18 @@ def get_models(
 
 def _request_model(model_id) -> dict:
     endpoint = f"https://civitai.com/api/v1/models/{model_id}"
-    response = requests.get(endpoint, params={})
+    with metrics.timer("api.request"):
+        response = http_client.get(endpoint, params={})
     if response.status_code == 200:
-        return response.json()
+        metrics.observe("api.response.bytes", len(response.content), metrics.SIZE_BUCKETS)
+        with metrics.timer("api.decode"):
+            data = loads(response.content)
+        with metrics.timer("archive.record"):
+            archive.record(endpoint, {}, data)
+        return data
     else:
         from pprint import pp; pp(response.content)
-        raise RuntimeError(f"Failed request: {response}")
+        raise RequestError(response)
 
 
 def get_model(model_id: str):
@@ -236,7 +317,7 @@ def _request_model_version(model_versions_id: str) -> dict:
         dict: _description_
     """    
     endpoint = f"https://civitai.com/api/v1/model-versions/{model_versions_id}"
-    response = requests.get(endpoint)
+    response = http_client.get(endpoint)
     if response.status_code == 200:
         return response.json()
     else:
@@ -295,7 +376,7 @@ def _request_tags(limit=20, page=1, query=None) -> dict:
     """    
     endpoint = "https://civitai.com/api/v1/tags"
     params = {"limit": limit, "page": page, "query": query}
-    response = requests.get(endpoint, params=params)
+    response = http_client.get(endpoint, params=params)
     if response.status_code == 200:
         return response.json()
     else:
@@ -332,4 +413,4 @@ def download_model():
         "Content-Disposition": "attachment; filename=example.zip",
         "User-Agent": "MyApp/1.0"
     }
-    response = requests.get(url, headers=headers)
+    response = http_client.get(url, headers=headers)
@@ -0,0 +1,100 @@
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import tqdm
+
+CHECKPOINT_EXTENSIONS = (".pt", ".ckpt")
+
+
+def estimate_memory(filename: str) -> int:
+    """Estimates the peak memory needed to convert a checkpoint.
+
+    Zip-format checkpoints are memory mapped and streamed, so the largest
+    tensor storage is what has to fit. Legacy pickles are read whole.
+    """
+    try:
+        with zipfile.ZipFile(filename) as archive:
+            sizes = [info.file_size for info in archive.infolist() if "/data/" in info.filename]
+        return max(sizes, default=0)
+    except zipfile.BadZipFile:
+        return os.path.getsize(filename)
+
+
+def _convert_worker(filename: str, archive_dir: str) -> str:
+    from src import lora_util
+
+    return lora_util.convert_pt_to_safetensors(filename, archive_dir=archive_dir)
+
+
+def find_checkpoints(root: str) -> list[str]:
+    """Returns the pickled checkpoints under `root` without a .safetensors twin."""
+    found = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            stem, ext = os.path.splitext(name)
+            if ext in CHECKPOINT_EXTENSIONS and f"{stem}.safetensors" not in filenames:
+                found.append(os.path.join(dirpath, name))
+    return found
+
+
+def convert_files(paths: list[str], workers: int = None, memory_budget: int = None, archive_dir: str = None,
+                  root: str = None, hash_cache=None) -> dict:
+    """Converts checkpoints to .safetensors in a process pool.
+
+    `memory_budget` is per worker, so running conversions may use up to
+    `memory_budget * workers` together. A file is only started while their
+    estimated memory stays within that total, and a file larger than one
+    worker's budget runs on its own.
+
+    Args:
+        paths (list[str]): Checkpoints to convert.
+        workers (int, optional): Conversion processes. Defaults to the CPU count.
+        memory_budget (int, optional): Bytes per conversion process. Defaults to None (unlimited).
+        archive_dir (str, optional): Where sources are moved, deleted if None.
+        root (str, optional): Directory scanned for `paths`, its layout is kept under `archive_dir`.
+        hash_cache (HashCache, optional): Cache whose entries for converted sources are dropped.
+
+    Returns:
+        dict: Counts of converted and failed files.
+    """
+    workers = workers or os.cpu_count() or 1
+    pending = sorted(((estimate_memory(path), path) for path in paths), reverse=True)
+    counts = {"converted": 0, "failed": 0}
+    total_budget = memory_budget * workers if memory_budget is not None else None
+
+    with ProcessPoolExecutor(max_workers=workers) as executor, tqdm.tqdm(total=len(pending), unit="file") as progress:
+        running = {}
+        in_use = 0
+        while pending or running:
+            # Largest first, filling leftover budget with whatever still fits.
+            for item in list(pending):
+                if len(running) >= workers:
+                    break
+                cost, path = item
+                if memory_budget is not None and cost > memory_budget:
+                    # Over one worker's share: take the whole budget.
+                    cost = total_budget
+                if not running or memory_budget is None or in_use + cost <= total_budget:
+                    pending.remove(item)
+                    archive = archive_dir
+                    if archive_dir and root:
+                        archive = os.path.join(archive_dir, os.path.relpath(os.path.dirname(path), root))
+                    running[executor.submit(_convert_worker, path, archive)] = (cost, path)
+                    in_use += cost
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                cost, path = running.pop(future)
+                in_use -= cost
+                try:
+                    future.result()
+                    counts["converted"] += 1
+                    if hash_cache is not None:
+                        hash_cache.forget(path)
+                except Exception as ex:
+                    print(f"!!! FAILED converting {path}: {ex}")
+                    counts["failed"] += 1
+                progress.update(1)
+
+    return counts
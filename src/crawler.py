@@ -0,0 +1,146 @@
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from src import http_client
+from src.http_client import TokenBucket
+from src.civit_api import API_HOST, _request_models
+
+
+def next_request(metadata: dict) -> dict:
+    """Returns the params of the page after the one `metadata` belongs to,
+    or None on the last page.
+
+    Prefers `nextCursor`, then the `cursor` or `page` of the `nextPage`
+    link, so the walk follows whatever the API hands out instead of
+    computing offsets.
+    """
+    cursor = metadata.get("nextCursor")
+    if cursor is not None:
+        return {"cursor": str(cursor)}
+    next_page = metadata.get("nextPage")
+    if next_page:
+        query = parse_qs(urlsplit(next_page).query)
+        if "cursor" in query:
+            return {"cursor": query["cursor"][0]}
+        if "page" in query:
+            return {"page": int(query["page"][0])}
+    return None
+
+
+class ModelsCrawler:
+    """Fetches `/api/v1/models` pages concurrently under a shared rate limit.
+
+    Pages are yielded as soon as they arrive so parsing and database writes
+    in the caller overlap with the requests still in flight.
+
+    Args:
+        params (dict): Keyword arguments for `_request_models`, without `page`.
+        workers (int, optional): Page requests kept in flight. Defaults to 4.
+        rate (float, optional): Maximum requests per second. Defaults to 1.
+    """
+    def __init__(self, params: dict, workers: int = 4, rate: float = 1.0):
+        self.params = params
+        self.workers = max(1, workers)
+        self.bucket = TokenBucket(rate, burst=self.workers)
+        http_client.get_client().limit_host(API_HOST, self.bucket)
+        self.failed_pages = []
+
+    def fetch_page(self, page: int) -> dict:
+        """Requests one page. Retries, backoff and `Retry-After` handling
+        happen in the shared HTTP client."""
+        return _request_models(page=page, **self.params)
+
+    def fetch(self, request: dict) -> dict:
+        """Requests the page described by `request`, as returned by `next_request`."""
+        return _request_models(**{**self.params, "page": None, **request})
+
+    def follow(self, request: dict = None):
+        """Yields `(request, data, next_request)` tuples, walking the
+        `nextCursor`/`nextPage` links one page after the other.
+
+        Unlike `crawl`, pages cannot be requested ahead of the cursor, but
+        the next page is requested as soon as the current one arrives, so
+        it downloads while the caller saves the current one.
+
+        Args:
+            request (dict, optional): Params of the first page, e.g. a saved `next_request`. Defaults to the first page.
+        """
+        request = request or {}
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(self.fetch, request)
+            while future is not None:
+                data = future.result()
+                following = next_request(data["metadata"])
+                if following is not None and following == request:
+                    print(f"!!! The API returned the same page again for {request}, stopping.")
+                    following = None
+                future = executor.submit(self.fetch, following) if following is not None else None
+                yield request, data, following
+                request = following
+
+    def crawl(self, first_page: int = 1, last_page: int = None):
+        """Yields `(page, data)` tuples in completion order.
+
+        The first page is fetched alone to learn `metadata.totalPages`, and
+        the remaining pages are then requested concurrently by number. When
+        the API does not report `totalPages` (cursor pagination), the pages
+        are fetched one after the other by following `nextCursor`/`nextPage`
+        instead. Pages that still fail after all retries are recorded in
+        `failed_pages`; a failed page ends a cursor walk, since the page
+        after it is unknown.
+
+        Args:
+            first_page (int, optional): Page to start from. Defaults to 1.
+            last_page (int, optional): Last page to fetch. Defaults to the total reported by the API.
+        """
+        data = self.fetch_page(first_page)
+        yield first_page, data
+
+        total_pages = data["metadata"].get("totalPages")
+        if total_pages is None:
+            yield from self._crawl_links(first_page, last_page, next_request(data["metadata"]))
+            return
+        if last_page is None or last_page > total_pages:
+            last_page = total_pages
+
+        pages = iter(range(first_page + 1, last_page + 1))
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = {}
+
+            def submit():
+                page = next(pages, None)
+                if page is not None:
+                    pending[executor.submit(self.fetch_page, page)] = page
+
+            for _ in range(self.workers):
+                submit()
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    page = pending.pop(future)
+                    submit()
+                    try:
+                        data = future.result()
+                    except Exception as ex:
+                        print(f"!!! {ex}")
+                        self.failed_pages.append(page)
+                        continue
+                    yield page, data
+
+    def _crawl_links(self, page: int, last_page: int, request: dict):
+        """Continues a `crawl` from `page` through the links of each page."""
+        if request is None or (last_page is not None and page >= last_page):
+            return
+        pages = self.follow(request)
+        try:
+            for _, data, _ in pages:
+                page += 1
+                yield page, data
+                if last_page is not None and page >= last_page:
+                    return
+        except Exception as ex:
+            print(f"!!! {ex}")
+            self.failed_pages.append(page + 1)
+        finally:
+            pages.close()
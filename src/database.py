@@ -0,0 +1,146 @@
+import os
+from sqlalchemy import create_engine, event, inspect, text
+
+from src.models import Base
+from src.search import create_search_index, rebuild_search_index
+
+SYNCHRONOUS_LEVELS = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+def create_database_engine(
+    name: str,
+    journal_mode: str = None,
+    synchronous: str = None,
+    mmap_size: int = None,
+    cache_size: int = None,
+):
+    """Creates the SQLite engine with the tuning pragmas applied to every connection.
+
+    Defaults come from the `SQLITE_JOURNAL_MODE`, `SQLITE_SYNCHRONOUS`,
+    `SQLITE_MMAP_SIZE` and `SQLITE_CACHE_SIZE` environment variables. WAL
+    with `synchronous=NORMAL` stays consistent after a crash, but may lose
+    the last few commits on power loss; use FULL if that matters.
+
+    Args:
+        name (str): Database name, without the `.db` suffix.
+        journal_mode (str, optional): SQLite journal mode. Defaults to WAL.
+        synchronous (str, optional): One of SYNCHRONOUS_LEVELS. Defaults to NORMAL.
+        mmap_size (int, optional): Bytes of the file to memory map. Defaults to 256 MiB.
+        cache_size (int, optional): Page cache size, negative values are KiB. Defaults to -65536 (64 MiB).
+
+    Returns:
+        Engine: The configured engine.
+    """
+    journal_mode = (journal_mode or os.getenv("SQLITE_JOURNAL_MODE", "WAL")).upper()
+    synchronous = (synchronous or os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")).upper()
+    if mmap_size is None:
+        mmap_size = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+    if cache_size is None:
+        cache_size = int(os.getenv("SQLITE_CACHE_SIZE", -64 * 1024))
+    if synchronous not in SYNCHRONOUS_LEVELS:
+        raise ValueError(f"Invalid synchronous level {synchronous}, expected one of {SYNCHRONOUS_LEVELS}")
+
+    engine = create_engine(f"sqlite:///{name}.db")
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        cursor.execute(f"PRAGMA cache_size={int(cache_size)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+    return engine
+
+
+class QueryCounter:
+    """Counts the SQL statements an engine executes, to catch N+1 query
+    regressions.
+
+    Args:
+        engine (Engine): Engine to observe.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def close(self):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+def add_missing_columns(engine):
+    """Adds columns declared in `src.models` that an older database lacks.
+
+    `create_all` only creates missing tables, so columns added to existing
+    models need an explicit `ALTER TABLE`. New columns are always nullable.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                print(f"Migrating: adding {table.name}.{column.name}")
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+
+
+def add_missing_indexes(engine):
+    """Creates indexes declared in `src.models` that an older database lacks,
+    then refreshes the planner statistics if anything was added."""
+    inspector = inspect(engine)
+    created = False
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                print(f"Migrating: creating index {index.name}")
+                index.create(conn, checkfirst=True)
+                created = True
+        if created:
+            conn.execute(text("ANALYZE"))
+
+
+def backfill_association_tables(conn):
+    """Fills `model_tags` and `version_trained_words` from the JSON columns
+    of rows stored before those tables existed."""
+    print("Migrating: back-filling model_tags and version_trained_words")
+    conn.execute(text("""
+        INSERT OR IGNORE INTO model_tags(model_id, tag)
+        SELECT m.id, trim(j.value) FROM models m, json_each(m.tags) j
+        WHERE json_valid(m.tags) AND j.type = 'text' AND trim(j.value) != ''
+    """))
+    conn.execute(text("""
+        INSERT OR IGNORE INTO version_trained_words(version_id, word)
+        SELECT v.id, trim(j.value) FROM model_versions v, json_each(v.trained_words) j
+        WHERE json_valid(v.trained_words) AND j.type = 'text' AND trim(j.value) != ''
+    """))
+
+
+def init_database(engine):
+    """Creates missing tables and brings older databases up to date."""
+    inspector = inspect(engine)
+    had_models = inspector.has_table("models")
+    had_tags = inspector.has_table("model_tags")
+
+    Base.metadata.create_all(engine)
+    add_missing_columns(engine)
+    add_missing_indexes(engine)
+    if had_models and not had_tags:
+        with engine.begin() as conn:
+            backfill_association_tables(conn)
+    with engine.begin() as conn:
+        if create_search_index(conn) and had_models:
+            print("Migrating: building full-text search index")
+            rebuild_search_index(conn)
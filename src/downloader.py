@@ -0,0 +1,245 @@
+import os
+import json
+import threading
+
+from src import http_client, metrics
+from src.hashing import StreamingHasher, hash_stream_file
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Files at least this large are fetched as parallel byte ranges when the
+# server supports it.
+SEGMENT_THRESHOLD = 256 * 1024 * 1024
+
+
+class DownloadError(RuntimeError):
+    """Raised when a download fails or does not match the expected size or hash."""
+
+
+class Interrupted(Exception):
+    """Raised inside download threads when the caller asked them to stop."""
+
+
+def _part_paths(outpath: str) -> tuple[str, str]:
+    return f"{outpath}.part", f"{outpath}.part.json"
+
+
+def _state_size(state_path: str) -> int:
+    """Size recorded by a segmented download's state file, None if unreadable."""
+    try:
+        with open(state_path) as f:
+            return json.load(f).get("size")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def size_matches(actual: int, size_kb: float) -> bool:
+    """The API reports sizes in fractional KB, allow for rounding."""
+    return size_kb is None or abs(actual - size_kb * 1024) < 1024
+
+
+class Downloader:
+    """Resumable HTTP downloads into `<outpath>.part`, renamed atomically
+    once the size and SHA256 have been checked.
+
+    An interrupted transfer continues with a `Range` request next time.
+    Large files can be split into parallel byte ranges, whose progress is
+    kept in `<outpath>.part.json` so they resume too, as ranges again
+    whatever the current settings, since their part file has holes.
+
+    Args:
+        chunk_size (int, optional): Streaming read size. Defaults to DOWNLOAD_CHUNK_SIZE.
+        segments (int, optional): Parallel ranges for large files. Defaults to 1.
+        segment_threshold (int, optional): Minimum size for ranged downloads. Defaults to SEGMENT_THRESHOLD.
+        bandwidth (TokenBucket, optional): Shared byte-rate limiter. Defaults to None.
+        stop (threading.Event, optional): Set to abort transfers, keeping partial data.
+        attempts (int, optional): Times a dropped transfer is resumed before giving up. Defaults to 5.
+    """
+    def __init__(self, chunk_size=DOWNLOAD_CHUNK_SIZE, segments=1, segment_threshold=SEGMENT_THRESHOLD,
+                 bandwidth=None, stop=None, attempts=5):
+        self.attempts = max(1, attempts)
+        self.chunk_size = chunk_size
+        self.segments = max(1, segments)
+        self.segment_threshold = segment_threshold
+        self.bandwidth = bandwidth
+        self.stop = stop or threading.Event()
+
+    def _chunks(self, response):
+        for chunk in response.iter_content(self.chunk_size):
+            if self.stop.is_set():
+                raise Interrupted()
+            if self.bandwidth is not None:
+                self.bandwidth.acquire(len(chunk))
+            yield chunk
+
+    @metrics.timer("download.model")
+    def download(self, url: str, outpath: str, size_kb: float = None, sha256: str = None) -> StreamingHasher:
+        """Downloads `url` to `outpath`, resuming any previous partial file.
+
+        The file is hashed as it is written, so callers get the full-file,
+        tensor-region and legacy hashes without reading it back.
+
+        Args:
+            url (str): Source URL.
+            outpath (str): Final destination.
+            size_kb (float, optional): Expected size as reported by the API.
+            sha256 (str, optional): Expected SHA256 hex digest.
+
+        Raises:
+            DownloadError: On HTTP errors or if the result fails verification.
+                The partial file is discarded when verification fails.
+
+        Returns:
+            StreamingHasher: Hashes of the downloaded file.
+        """
+        part, state_path = _part_paths(outpath)
+        safetensors = os.path.splitext(outpath)[1] == ".safetensors"
+        total = None
+        segmented = False
+        if os.path.exists(state_path):
+            # The part file of a segmented download is full size with holes,
+            # it can only be resumed segment by segment.
+            total = self._probe_ranges(url)
+            segmented = total is not None and total == _state_size(state_path)
+            if not segmented:
+                print(f"!!! Cannot resume segmented download, starting over: {part}")
+                for path in (part, state_path):
+                    if os.path.exists(path):
+                        os.unlink(path)
+        elif self.segments > 1 and (size_kb is None or size_kb * 1024 >= self.segment_threshold):
+            total = self._probe_ranges(url)
+            segmented = total is not None and total >= self.segment_threshold
+
+        for attempt in range(self.attempts):
+            try:
+                if segmented:
+                    self._download_segmented(url, part, state_path, total)
+                    # Ranges arrive out of order, so hash once at the end.
+                    hasher = hash_stream_file(part, safetensors, self.chunk_size)
+                else:
+                    hasher = self._download_stream(url, part, safetensors)
+                break
+            except http_client.RETRY_EXCEPTIONS as ex:
+                if attempt + 1 >= self.attempts:
+                    raise DownloadError(f"Giving up on {url} after {self.attempts} attempts: {ex}") from ex
+                print(f"!!! Transfer of {url} dropped ({ex}), resuming")
+
+        actual = os.path.getsize(part)
+        if not size_matches(actual, size_kb) or (sha256 and hasher.sha256 != sha256.lower()):
+            os.unlink(part)
+            if os.path.exists(state_path):
+                os.unlink(state_path)
+            raise DownloadError(
+                f"Verification failed for {outpath}: {actual} bytes, sha256 {hasher.sha256}, "
+                f"expected {size_kb} KB, sha256 {sha256}"
+            )
+
+        os.replace(part, outpath)
+        if os.path.exists(state_path):
+            os.unlink(state_path)
+        metrics.observe("download.model.bytes", actual, metrics.SIZE_BUCKETS)
+        return hasher
+
+    def _download_stream(self, url: str, part: str, safetensors: bool) -> StreamingHasher:
+        """Single connection download, appending to `part` from where it stopped."""
+        hasher = StreamingHasher(safetensors)
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+        response = http_client.get(url, headers=headers, stream=True)
+        try:
+            if response.status_code == 416 and offset:
+                _, _, total = response.headers.get("Content-Range", "").rpartition("/")
+                if total.isdigit() and int(total) == offset:
+                    # Nothing left to fetch, the part file is already complete.
+                    return hash_stream_file(part, safetensors, self.chunk_size)
+                print(f"!!! Part file does not match the remote size, starting over: {part}")
+                os.unlink(part)
+                response.close()
+                return self._download_stream(url, part, safetensors)
+            if response.status_code == 206 and offset:
+                print(f"Resuming at {offset} bytes: {part}")
+                with open(part, "rb") as f:
+                    for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                        hasher.update(chunk)
+                mode = "ab"
+            elif response.status_code == 200:
+                mode = "wb"
+            else:
+                raise DownloadError(f"Failed request: {response} for {url}")
+
+            with open(part, mode) as f:
+                for chunk in self._chunks(response):
+                    f.write(chunk)
+                    hasher.update(chunk)
+        finally:
+            response.close()
+        return hasher
+
+    def _probe_ranges(self, url: str) -> int:
+        """Returns the file size if the server honours byte ranges, else None."""
+        response = http_client.get(url, headers={"Range": "bytes=0-0"}, stream=True)
+        try:
+            if response.status_code != 206:
+                return None
+            content_range = response.headers.get("Content-Range", "")
+            _, _, total = content_range.rpartition("/")
+            return int(total) if total.isdigit() else None
+        finally:
+            response.close()
+
+    def _download_segmented(self, url: str, part: str, state_path: str, total: int):
+        """Fetches `total` bytes as parallel ranges written in place into `part`."""
+        state = None
+        if os.path.exists(state_path) and os.path.exists(part):
+            with open(state_path) as f:
+                state = json.load(f)
+            if state.get("size") != total:
+                state = None
+        if state is None:
+            step = -(-total // self.segments)
+            state = {"size": total, "segments": [[start, min(start + step, total), start] for start in range(0, total, step)]}
+            with open(part, "wb") as f:
+                f.truncate(total)
+        else:
+            print(f"Resuming segmented download: {part}")
+
+        lock = threading.Lock()
+        errors = []
+
+        def save_state():
+            tmp = f"{state_path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp, state_path)
+
+        def fetch(segment):
+            start, end, done = segment
+            if done >= end:
+                return
+            try:
+                response = http_client.get(url, headers={"Range": f"bytes={done}-{end - 1}"}, stream=True)
+                try:
+                    if response.status_code != 206:
+                        raise DownloadError(f"Range request failed: {response} for {url}")
+                    fd = os.open(part, os.O_WRONLY)
+                    try:
+                        for chunk in self._chunks(response):
+                            os.pwrite(fd, chunk, segment[2])
+                            with lock:
+                                segment[2] += len(chunk)
+                                save_state()
+                    finally:
+                        os.close(fd)
+                finally:
+                    response.close()
+            except BaseException as ex:
+                errors.append(ex)
+
+        save_state()
+        threads = [threading.Thread(target=fetch, args=(segment,)) for segment in state["segments"]]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if errors:
+            raise errors[0]
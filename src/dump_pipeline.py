@@ -0,0 +1,395 @@
+import io
+import os
+import json
+import queue
+import base64
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import tqdm
+import markdownify
+from pathvalidate import sanitize_filename
+
+from src import http_client, safetensors_hack, lora_util, metrics
+from src.http_client import TokenBucket
+from src.downloader import DOWNLOAD_CHUNK_SIZE, Downloader, Interrupted
+from src.hash_cache import compute_hashes
+from src.image_store import encode_preview, link_or_copy
+
+MAX_COVER_IMAGES = 3
+
+_SIZE_SUFFIXES = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_size(value: str) -> int:
+    """Parses sizes such as `500K`, `20M` or `1G` into bytes."""
+    value = value.strip().upper().rstrip("B")
+    if value and value[-1] in _SIZE_SUFFIXES:
+        return int(float(value[:-1]) * _SIZE_SUFFIXES[value[-1]])
+    return int(value)
+
+
+def convert_civitai_meta(meta):
+    if meta is None:
+        return None
+
+    meta = json.loads(meta)
+    if meta is None:
+        return None
+
+    prompt = meta.pop("prompt", "")
+    neg_prompt = meta.pop("negativePrompt", None)
+    seed = meta.pop("seed", "-1")
+    steps = meta.pop("steps", "20")
+    sampler = meta.pop("sampler", "Euler a")
+    cfgScale = meta.pop("cfgScale", "7")
+
+    meta["Seed"] = seed
+    meta["Steps"] = steps
+    meta["Sampler"] = sampler
+    meta["CFG Scale"] = cfgScale
+
+    generation_params_text = ", ".join([k if k == v else f'{k}: {v}' for k, v in meta.items() if v is not None])
+    negative_prompt_text = "\nNegative prompt: " + neg_prompt if neg_prompt else ""
+    return f"{prompt}{negative_prompt_text}\n{generation_params_text}".strip()
+
+
+class DumpJob:
+    """Everything needed to dump one model version, copied out of the ORM
+    objects so worker threads never touch the database session.
+
+    Args:
+        model (Model): Parent model.
+        version (ModelVersion): Version to dump.
+        file (ModelVersionFile): File of `version` to download.
+        path (str): Output root directory.
+    """
+    def __init__(self, model, version, file, path):
+        self.model_id = model.id
+        self.model_name = model.name
+        self.model_description = model.description
+        self.creator_username = model.creator_username
+        self.tags = model.tags
+        self.version_id = version.id
+        self.version_name = version.name
+        self.version_description = version.description
+        self.trained_words = version.trained_words
+        self.download_url = version.download_url + f"?type={file.type}&format={file.format}"
+        self.file_name = file.name
+        self.size_kb = file.size_kb
+        self.sha256 = file.sha256
+        self.images = [(image.hash, image.url, image.meta) for image in version.images]
+
+        # Sanitize each component rather than the joined path: on POSIX the
+        # Windows rules would turn every separator into a backslash.
+        self.parent_path = os.path.join(path, sanitize_filename(f"{model.id} - {model.name}", platform="Windows"))
+        self.outpath = os.path.join(self.parent_path, sanitize_filename(f"{file.name}", platform="Windows"))
+        bn, self.ext = os.path.splitext(self.outpath)
+        self.model_path = self.outpath if self.ext == ".safetensors" else f"{bn}.safetensors"
+
+        # Filled in by the download stage.
+        self.previews = []
+        self.skip_model = False
+        self.hasher = None
+
+    def preview_path(self, i: int) -> str:
+        basename = os.path.splitext(self.file_name)[0]
+        suffix = "preview" if i == 0 else f"preview.{i}"
+        return os.path.join(self.parent_path, sanitize_filename(f"{basename}.{suffix}.png", platform="Windows"))
+
+
+class DumpPipeline:
+    """Downloads and post-processes model versions in overlapping stages.
+
+    A pool of download threads fetches preview images and model files,
+    sharing an optional bandwidth limit. Finished downloads go through a
+    bounded queue to a pool of processing threads that hash, convert and
+    tag the model. hashlib, zlib and file I/O release the GIL, so threads
+    are enough to keep both stages busy. Preview images go through an
+    `ImageStore`, and the PIL re-encoding runs in a process pool.
+
+    Args:
+        image_store (ImageStore): Content-addressed preview cache.
+        connections (int, optional): Concurrent downloads. Defaults to 4.
+        cpu_workers (int, optional): Concurrent processing jobs. Defaults to 2.
+        bandwidth (int, optional): Download limit in bytes per second. Defaults to None (unlimited).
+        chunk_size (int, optional): Streaming read size. Defaults to DOWNLOAD_CHUNK_SIZE.
+        segments (int, optional): Parallel byte ranges per large model file. Defaults to 1.
+        hash_cache (HashCache, optional): Cache for hashes of files already on disk. Defaults to None.
+    """
+    def __init__(self, image_store, connections=4, cpu_workers=2, bandwidth=None, chunk_size=DOWNLOAD_CHUNK_SIZE,
+                 segments=1, hash_cache=None):
+        self.image_store = image_store
+        self.hash_cache = hash_cache
+        self.connections = max(1, connections)
+        self.cpu_workers = max(1, cpu_workers)
+        self.chunk_size = chunk_size
+        self.bandwidth = TokenBucket(bandwidth, burst=max(chunk_size, bandwidth)) if bandwidth else None
+        self.download_queue = queue.Queue(maxsize=self.connections * 2)
+        self.process_queue = queue.Queue(maxsize=self.cpu_workers * 2)
+        self.stop = threading.Event()
+        self.downloader = Downloader(chunk_size=chunk_size, segments=segments, bandwidth=self.bandwidth, stop=self.stop)
+        self.failures = []
+        self.lock = threading.Lock()
+        self.progress = None
+        self.image_pool = None
+        self.encoding = {}
+        self.fetching = {}
+
+    def _fail(self, job, ex):
+        exs = ''.join(traceback.TracebackException.from_exception(ex).format())
+        print(f"Failed saving model {job.model_id} version {job.version_id}: {exs}")
+        metrics.count("dump.failed")
+        with self.lock:
+            self.failures.append({"model_id": job.model_id, "version_id": job.version_id, "exception": str(exs)})
+
+    def _fetch(self, url: str, dest) -> int:
+        """Streams `url` into the file object `dest`, returns bytes written."""
+        response = http_client.get(url, stream=True)
+        try:
+            if response.status_code != 200:
+                raise RuntimeError(f"Failed request: {response} for {url}")
+            written = 0
+            for chunk in response.iter_content(self.chunk_size):
+                if self.stop.is_set():
+                    raise Interrupted()
+                if self.bandwidth is not None:
+                    self.bandwidth.acquire(len(chunk))
+                dest.write(chunk)
+                written += len(chunk)
+            metrics.count("dump.preview.bytes", written)
+            return written
+        finally:
+            response.close()
+
+    @metrics.timer("dump.download")
+    def download(self, job: DumpJob):
+        for i, (image_hash, url, meta) in enumerate(job.images):
+            outpath = job.preview_path(i)
+            store = self.image_store
+            if not store.has_encoded(image_hash) and not os.path.exists(store.raw_path(image_hash)):
+                if os.path.exists(outpath):
+                    # Dumped before the store existed, keep the file as it is.
+                    job.previews.append((outpath, None, meta))
+                    continue
+                try:
+                    self._fetch_preview(image_hash, url)
+                except Exception as ex:
+                    print(f"!!! FAILED downloading preview image {url}: {ex}")
+                    continue
+            job.previews.append((outpath, image_hash, meta))
+
+        if os.path.exists(job.model_path):
+            print(f"Path already exists, skipping: {job.outpath}")
+            job.skip_model = True
+            return
+
+        os.makedirs(os.path.dirname(job.outpath), exist_ok=True)
+        if os.path.isfile(job.outpath):
+            print(f"Using model file on disk: {job.outpath}")
+            return
+
+        print(f"Saving: {job.outpath}")
+        job.hasher = self.downloader.download(job.download_url, job.outpath, size_kb=job.size_kb, sha256=job.sha256)
+
+    def _fetch_preview(self, image_hash: str, url: str):
+        """Downloads a preview into the image store. Jobs that need an image
+        while it is being downloaded wait for that fetch instead of
+        starting another."""
+        with self.lock:
+            future = self.fetching.get(image_hash)
+            owner = future is None
+            if owner:
+                if os.path.exists(self.image_store.raw_path(image_hash)):
+                    # Stored by a fetch that finished since the caller looked.
+                    return
+                future = self.fetching[image_hash] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            with io.BytesIO() as buf:
+                self._fetch(url, buf)
+                self.image_store.put_raw(image_hash, buf.getvalue())
+        except BaseException as ex:
+            future.set_exception(ex)
+            raise
+        else:
+            future.set_result(None)
+        finally:
+            # Finished fetches leave the file in the store, failed ones may
+            # be retried by a later job.
+            with self.lock:
+                del self.fetching[image_hash]
+
+    def _encode(self, image_hash: str, meta: str):
+        """Returns a future for the PNG and thumbnail of `image_hash`,
+        sharing one encode between jobs that use the same image."""
+        store = self.image_store
+        with self.lock:
+            future = self.encoding.get(image_hash)
+            if future is None:
+                future = self.image_pool.submit(
+                    encode_preview, store.raw_path(image_hash), store.png_path(image_hash),
+                    store.thumb_path(image_hash), convert_civitai_meta(meta),
+                )
+                self.encoding[image_hash] = future
+        return future
+
+    @metrics.timer("dump.previews")
+    def save_previews(self, job: DumpJob) -> list[str]:
+        """Links previews from the image store into the model directory,
+        encoding them first if needed, and returns base64 cover images
+        made from the cached thumbnails."""
+        store = self.image_store
+        pending = [
+            (outpath, image_hash, None if store.has_encoded(image_hash) else self._encode(image_hash, meta))
+            for outpath, image_hash, meta in job.previews
+        ]
+
+        cover_images = []
+        for outpath, image_hash, future in pending:
+            try:
+                if image_hash is None:
+                    thumb = outpath
+                else:
+                    if future is not None:
+                        future.result()
+                    if not os.path.exists(outpath):
+                        link_or_copy(store.png_path(image_hash), outpath)
+                    thumb = store.thumb_path(image_hash)
+
+                if len(cover_images) < MAX_COVER_IMAGES:
+                    with open(thumb, "rb") as f:
+                        cover_images.append(base64.b64encode(f.read()).decode("ascii"))
+            except Exception as ex:
+                print(f"!!! FAILED saving preview image: {ex}")
+        return cover_images
+
+    def _hashes(self, filename: str) -> tuple[str, str]:
+        if self.hash_cache is not None:
+            return self.hash_cache.hashes(filename)
+        return compute_hashes(filename)
+
+    @metrics.timer("dump.process")
+    def process(self, job: DumpJob):
+        cover_images = self.save_previews(job)
+        if job.skip_model:
+            return
+
+        # Hashes computed while downloading save re-reading the file; files
+        # that were already on disk come from the hash cache.
+        outpath = job.outpath
+        hasher = job.hasher
+        if job.ext != ".safetensors":
+            legacy_hash = hasher.legacy_hash if hasher else self._hashes(outpath)[1] # use .pt legacy hash
+            outpath = lora_util.convert_pt_to_safetensors(outpath)
+            if self.hash_cache is not None:
+                # The source was deleted by the conversion.
+                self.hash_cache.forget(job.outpath)
+            model_hash = safetensors_hack.hash_file(outpath)
+        elif hasher:
+            model_hash = hasher.tensor_sha256
+            if hasher.has_user_metadata:
+                legacy_hash = safetensors_hack.legacy_hash_file(outpath)
+            else:
+                legacy_hash = hasher.legacy_hash
+        else:
+            model_hash, legacy_hash = self._hashes(outpath)
+
+        assert os.path.splitext(outpath)[1] == ".safetensors"
+
+        description = job.model_description or ""
+        if job.version_description:
+            description += "<hr>"
+            description += job.version_description
+
+        metadata = {
+            "ssmd_cover_images": json.dumps(cover_images),
+            "ssmd_display_name": f"{job.model_name}",
+            "ssmd_author": job.creator_username,
+            "ssmd_version": job.version_name,
+            "ssmd_source": f"https://civitai.com/models/{job.model_id}",
+            "ssmd_keywords": ", ".join(json.loads(job.trained_words)),
+            "ssmd_description": markdownify.markdownify(description, heading_style="ATX"),
+            "ssmd_rating": "0",
+            "ssmd_tags": ", ".join(json.loads(job.tags)),
+            "sshs_model_hash": model_hash,
+            "sshs_legacy_hash": legacy_hash
+           }
+        lora_util.write_lora_metadata(outpath, metadata)
+        if self.hash_cache is not None:
+            # Rewriting the metadata leaves both hashes unchanged.
+            self.hash_cache.put(outpath, model_hash, legacy_hash)
+
+    def _download_worker(self):
+        while True:
+            job = self.download_queue.get()
+            if job is None:
+                return
+            try:
+                if not self.stop.is_set():
+                    self.download(job)
+                    self.process_queue.put(job)
+                    continue
+            except BaseException as ex:
+                if not self.stop.is_set():
+                    self._fail(job, ex)
+            self._done()
+
+    def _process_worker(self):
+        while True:
+            job = self.process_queue.get()
+            if job is None:
+                return
+            try:
+                if not self.stop.is_set():
+                    self.process(job)
+            except BaseException as ex:
+                self._fail(job, ex)
+            self._done()
+
+    def _done(self):
+        if self.progress is not None:
+            self.progress.update(1)
+
+    def run(self, jobs, total: int = None) -> list[dict]:
+        """Feeds `jobs` through the pipeline and waits for all of them.
+
+        Args:
+            jobs (Iterable[DumpJob]): Versions to dump, consumed lazily.
+            total (int, optional): Number of jobs, for the progress bar.
+
+        Returns:
+            list[dict]: One entry per failed version.
+        """
+        downloaders = [threading.Thread(target=self._download_worker, daemon=True) for _ in range(self.connections)]
+        processors = [threading.Thread(target=self._process_worker, daemon=True) for _ in range(self.cpu_workers)]
+        for t in downloaders + processors:
+            t.start()
+
+        # Spawned rather than forked: the download threads are already running.
+        self.image_pool = ProcessPoolExecutor(max_workers=self.cpu_workers, mp_context=multiprocessing.get_context("spawn"))
+        self.progress = tqdm.tqdm(total=total, unit="version")
+        try:
+            for job in jobs:
+                self.download_queue.put(job)
+            for _ in downloaders:
+                self.download_queue.put(None)
+            for t in downloaders:
+                t.join()
+            for _ in processors:
+                self.process_queue.put(None)
+            for t in processors:
+                t.join()
+        except KeyboardInterrupt:
+            print("Interrupted, stopping workers...")
+            self.stop.set()
+            raise
+        finally:
+            self.progress.close()
+            self.image_pool.shutdown(cancel_futures=self.stop.is_set())
+
+        return self.failures
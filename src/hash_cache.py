@@ -0,0 +1,152 @@
+import os
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import tqdm
+from sqlalchemy import select, delete
+
+from src import safetensors_hack, sd_models, metrics
+from src.models import FileHash
+from src.persistence import upsert_rows
+
+MODEL_EXTENSIONS = (".safetensors", ".pt", ".ckpt")
+
+
+def stat_key(filename: str) -> tuple:
+    """Returns (absolute path, size, mtime_ns, inode) identifying a file version."""
+    path = os.path.abspath(filename)
+    st = os.stat(path)
+    return path, st.st_size, st.st_mtime_ns, st.st_ino
+
+
+@metrics.timer("hash.compute")
+def compute_hashes(filename: str) -> tuple[str, str]:
+    """Hashes a model file from scratch.
+
+    Returns:
+        tuple[str, str]: Tensor hash (None for pickle files) and legacy hash.
+    """
+    if os.path.splitext(filename)[1] == ".safetensors":
+        return safetensors_hack.hash_file(filename), safetensors_hack.legacy_hash_file(filename)
+    return None, sd_models.model_hash(filename)
+
+
+def _hash_worker(filename: str) -> dict:
+    """Process pool entry point, returns a `file_hashes` row or an error."""
+    try:
+        before = stat_key(filename)
+        model_hash, legacy_hash = compute_hashes(filename)
+        after = stat_key(filename)
+    except Exception as ex:
+        return {"path": os.path.abspath(filename), "error": str(ex)}
+    if before != after:
+        return {"path": before[0], "error": "file changed while hashing"}
+    path, size, mtime_ns, inode = after
+    return {
+        "path": path, "size": size, "mtime_ns": mtime_ns, "inode": inode,
+        "model_hash": model_hash, "legacy_hash": legacy_hash, "updated_at": datetime.utcnow(),
+    }
+
+
+class HashCache:
+    """Looks up model file hashes in the `file_hashes` table, so unchanged
+    files cost a `stat` instead of a full read.
+
+    Args:
+        engine (Engine): Database engine.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+
+    def get(self, filename: str) -> tuple[str, str]:
+        """Returns the cached (model_hash, legacy_hash), or None if missing or
+        stale. Entries for files that no longer exist are ignored."""
+        try:
+            path, size, mtime_ns, inode = stat_key(filename)
+        except FileNotFoundError:
+            return None
+        with self.engine.connect() as conn:
+            row = conn.execute(select(FileHash).where(FileHash.path == path)).first()
+        if row is None or (row.size, row.mtime_ns, row.inode) != (size, mtime_ns, inode):
+            return None
+        return row.model_hash, row.legacy_hash
+
+    def put(self, filename: str, model_hash: str, legacy_hash: str):
+        """Records hashes for the file as it is on disk right now."""
+        path, size, mtime_ns, inode = stat_key(filename)
+        row = {
+            "path": path, "size": size, "mtime_ns": mtime_ns, "inode": inode,
+            "model_hash": model_hash, "legacy_hash": legacy_hash, "updated_at": datetime.utcnow(),
+        }
+        with self.engine.begin() as conn:
+            upsert_rows(conn, FileHash.__table__, [row])
+
+    def forget(self, filename: str):
+        """Drops the entry of a file that was deleted or moved away."""
+        with self.engine.begin() as conn:
+            conn.execute(delete(FileHash).where(FileHash.path == os.path.abspath(filename)))
+
+    def hashes(self, filename: str) -> tuple[str, str]:
+        """Returns (model_hash, legacy_hash), computing and caching on a miss."""
+        cached = self.get(filename)
+        if cached is not None:
+            return cached
+        model_hash, legacy_hash = compute_hashes(filename)
+        self.put(filename, model_hash, legacy_hash)
+        return model_hash, legacy_hash
+
+    def rehash(self, root: str, workers: int = None) -> dict:
+        """Brings the cache up to date for every model file under `root`.
+
+        Only files whose size, mtime or inode changed are hashed, spread
+        over a process pool. Entries for files that no longer exist under
+        `root` are removed.
+
+        Args:
+            root (str): Directory to scan.
+            workers (int, optional): Hashing processes. Defaults to the CPU count.
+
+        Returns:
+            dict: Counts of fresh, hashed, failed and removed entries.
+        """
+        root = os.path.abspath(root)
+        found = {}
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                if os.path.splitext(name)[1] in MODEL_EXTENSIONS:
+                    try:
+                        key = stat_key(os.path.join(dirpath, name))
+                    except OSError:
+                        continue
+                    found[key[0]] = key
+
+        prefix = os.path.join(root, "")
+        with self.engine.connect() as conn:
+            cached = {
+                row.path: (row.path, row.size, row.mtime_ns, row.inode)
+                for row in conn.execute(select(FileHash).where(FileHash.path.startswith(prefix, autoescape=True)))
+            }
+
+        stale = [path for path, key in found.items() if cached.get(path) != key]
+        removed = [path for path in cached if path not in found]
+        counts = {"fresh": len(found) - len(stale), "hashed": 0, "failed": 0, "removed": len(removed)}
+
+        rows = []
+        if stale:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(_hash_worker, path) for path in stale]
+                for future in tqdm.tqdm(as_completed(futures), total=len(futures), unit="file"):
+                    row = future.result()
+                    if "error" in row:
+                        print(f"!!! FAILED hashing {row['path']}: {row['error']}")
+                        counts["failed"] += 1
+                        continue
+                    rows.append(row)
+                    counts["hashed"] += 1
+
+        with self.engine.begin() as conn:
+            upsert_rows(conn, FileHash.__table__, rows)
+            for i in range(0, len(removed), 500):
+                conn.execute(delete(FileHash).where(FileHash.path.in_(removed[i:i + 500])))
+
+        return counts
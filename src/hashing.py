@@ -0,0 +1,92 @@
+import json
+import hashlib
+
+# Region read by the legacy `sd_models.model_hash()`.
+LEGACY_HASH_START = 0x100000
+LEGACY_HASH_END = 0x110000
+# Largest header accepted when parsing a stream, mirrors safetensors' own limit.
+MAX_HEADER_SIZE = 100 * 1024 * 1024
+
+
+class StreamingHasher:
+    """Computes every hash `dump` needs in one pass over a file's bytes.
+
+    Feed the file front to back through `update()`, e.g. while it is being
+    downloaded:
+
+    - `sha256`: digest of the whole file, comparable to the API's SHA256;
+    - `tensor_sha256`: digest of everything after the safetensors header,
+      same as `safetensors_hack.hash_file()`;
+    - `legacy_hash`: the `sd_models.model_hash()` window digest. For a
+      .safetensors file it only equals `safetensors_hack.legacy_hash_file()`
+      when `has_user_metadata` is False.
+
+    Args:
+        safetensors (bool, optional): Parse the safetensors header. Defaults to True.
+    """
+    def __init__(self, safetensors: bool = True):
+        self.safetensors = safetensors
+        self.position = 0
+        self.header = bytearray()
+        self.header_length = None
+        self.metadata = None
+        self._full = hashlib.sha256()
+        self._tensors = hashlib.sha256()
+        self._legacy = hashlib.sha256()
+
+    def update(self, chunk):
+        view = memoryview(chunk)
+        start = self.position
+        end = start + len(view)
+        self.position = end
+        self._full.update(view)
+
+        lo, hi = max(start, LEGACY_HASH_START), min(end, LEGACY_HASH_END)
+        if lo < hi:
+            self._legacy.update(view[lo - start:hi - start])
+
+        if not self.safetensors:
+            return
+
+        while self.metadata is None and start + len(view) > len(self.header) >= start:
+            needed = (8 if self.header_length is None else 8 + self.header_length) - len(self.header)
+            offset = len(self.header) - start
+            self.header += view[offset:offset + needed]
+            if self.header_length is None and len(self.header) >= 8:
+                self.header_length = int.from_bytes(self.header[:8], "little")
+                if self.header_length > MAX_HEADER_SIZE:
+                    raise ValueError(f"safetensors header too large: {self.header_length} bytes")
+            if self.header_length is not None and len(self.header) == 8 + self.header_length:
+                self.metadata = json.loads(bytes(self.header[8:])).get("__metadata__", {})
+                break
+
+        if self.header_length is not None:
+            lo = max(start, 8 + self.header_length)
+            if lo < end:
+                self._tensors.update(view[lo - start:])
+
+    @property
+    def sha256(self) -> str:
+        return self._full.hexdigest()
+
+    @property
+    def tensor_sha256(self) -> str:
+        return self._tensors.hexdigest()
+
+    @property
+    def legacy_hash(self) -> str:
+        return self._legacy.hexdigest()[0:8]
+
+    @property
+    def has_user_metadata(self) -> bool:
+        """True if the header holds metadata that `legacy_hash_file` strips."""
+        return any(not k.startswith("ss_") for k in self.metadata or {})
+
+
+def hash_stream_file(filename: str, safetensors: bool = True, blksize: int = 1024 * 1024) -> StreamingHasher:
+    """Runs a file already on disk through a `StreamingHasher` in one read."""
+    hasher = StreamingHasher(safetensors)
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(blksize), b""):
+            hasher.update(chunk)
+    return hasher
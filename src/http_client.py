@@ -0,0 +1,261 @@
+import time
+import random
+import threading
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src import metrics
+
+# (connect, read) timeout in seconds applied when the caller passes none.
+DEFAULT_TIMEOUT = (10, 60)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRY_EXCEPTIONS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+def parse_retry_after(value) -> float:
+    """Converts a `Retry-After` header (delta-seconds or HTTP-date) to seconds.
+
+    Args:
+        value (str): Header value, may be None.
+
+    Returns:
+        float: Seconds to wait, or None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        return None
+    return max(0.0, (when - datetime.now(when.tzinfo)).total_seconds())
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every request to one host.
+
+    The refill rate backs off multiplicatively on 429 responses and recovers
+    additively on success, so a crawl settles just under whatever rate the
+    server is willing to accept.
+
+    Args:
+        rate (float): Maximum requests per second.
+        burst (int, optional): Bucket capacity. Defaults to 1.
+        min_rate (float, optional): Floor for the backed-off rate. Defaults to 1/60.
+    """
+    def __init__(self, rate: float, burst: int = 1, min_rate: float = 1 / 60):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1):
+        """Blocks until `tokens` are available, one per request by default.
+
+        Requests larger than the bucket are clamped to its capacity.
+        """
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    delay = self.blocked_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= tokens:
+                        self.tokens -= tokens
+                        return
+                    delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+
+    def throttle(self, retry_after: float = None):
+        """Halves the rate and, if given, pauses everyone for `retry_after` seconds."""
+        with self.lock:
+            now = time.monotonic()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+            self.updated = now
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def recover(self):
+        """Nudges the rate back towards the configured maximum."""
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+class ClientStats:
+    """Counters collected by `HttpClient`, safe to update from many threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.statuses = {}
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def record(self, status, latency: float):
+        with self.lock:
+            self.requests += 1
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+        metrics.observe("http.request.seconds", latency)
+        metrics.count(f"http.status.{status}")
+
+    def record_retry(self):
+        with self.lock:
+            self.retries += 1
+        metrics.count("http.retries")
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+        metrics.count("http.failures")
+
+    def __str__(self):
+        mean = self.latency_total / self.requests if self.requests else 0.0
+        statuses = ", ".join(f"{k}={v}" for k, v in sorted(self.statuses.items(), key=str))
+        return (f"{self.requests} requests ({statuses}), {self.retries} retries, {self.failures} failures, "
+                f"latency mean {mean * 1000:.0f}ms max {self.latency_max * 1000:.0f}ms")
+
+
+class HttpClient:
+    """Pooled keep-alive HTTP client with timeouts and retrying backoff.
+
+    Connection errors, timeouts and `RETRY_STATUSES` are retried with
+    exponential backoff and full jitter. 429 responses wait for `Retry-After`
+    when the server sends one. Hosts registered with `limit_host` share a
+    `TokenBucket` across every thread using the client.
+
+    Args:
+        pool_size (int, optional): Keep-alive connections kept per host. Defaults to 16.
+        max_retries (int, optional): Retries after the first attempt. Defaults to 5.
+        backoff (float, optional): Base backoff in seconds. Defaults to 1.
+        max_backoff (float, optional): Cap for a single backoff. Defaults to 120.
+        timeout (tuple, optional): Default (connect, read) timeout. Defaults to DEFAULT_TIMEOUT.
+    """
+    def __init__(self, pool_size=16, max_retries=5, backoff=1.0, max_backoff=120.0, timeout=DEFAULT_TIMEOUT):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.limiters = {}
+        self.stats = ClientStats()
+
+    def limit_host(self, host: str, bucket: TokenBucket):
+        """Routes every request to `host` through `bucket`."""
+        self.limiters[host] = bucket
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def request(self, method: str, url: str, max_retries: int = None, **kwargs) -> requests.Response:
+        """Sends a request, retrying transient failures.
+
+        Args:
+            method (str): HTTP method.
+            url (str): Absolute URL.
+            max_retries (int, optional): Overrides the client default.
+            **kwargs: Passed through to `requests.Session.request`.
+
+        Returns:
+            requests.Response: The last response received. Its status may
+            still be in `RETRY_STATUSES` once retries are exhausted.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        if max_retries is None:
+            max_retries = self.max_retries
+        limiter = self.limiters.get(urlsplit(url).hostname)
+
+        attempt = 0
+        while True:
+            if limiter is not None:
+                with metrics.timer("http.rate_limit_wait"):
+                    limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except RETRY_EXCEPTIONS as ex:
+                self.stats.record(type(ex).__name__, time.perf_counter() - start)
+                if attempt >= max_retries:
+                    self.stats.record_failure()
+                    raise
+                delay = self._backoff(attempt)
+                print(f"!!! {method} {url} failed ({ex}), retrying in {delay:.1f}s")
+            else:
+                self.stats.record(response.status_code, time.perf_counter() - start)
+                if response.status_code not in RETRY_STATUSES:
+                    if limiter is not None:
+                        limiter.recover()
+                    return response
+                if attempt >= max_retries:
+                    self.stats.record_failure()
+                    return response
+
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                delay = retry_after if retry_after is not None else self._backoff(attempt)
+                response.close()
+                print(f"!!! {method} {url} returned {response.status_code}, retrying in {delay:.1f}s")
+                if response.status_code == 429 and limiter is not None:
+                    # The limiter pauses every thread sharing this host.
+                    limiter.throttle(delay)
+                    delay = 0
+
+            self.stats.record_retry()
+            attempt += 1
+            if delay:
+                time.sleep(delay)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        return self.request("HEAD", url, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> HttpClient:
+    """Returns the process-wide client, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """`requests.get` replacement that goes through the shared client."""
+    return get_client().get(url, **kwargs)
+
+
+def head(url: str, **kwargs) -> requests.Response:
+    """`requests.head` replacement that goes through the shared client."""
+    return get_client().head(url, **kwargs)
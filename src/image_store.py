@@ -0,0 +1,114 @@
+import os
+import errno
+import shutil
+import hashlib
+import tempfile
+
+# Longest side of the thumbnails embedded as `ssmd_cover_images`.
+THUMBNAIL_SIZE = 512
+
+
+def _write_atomic(path: str, data: bytes):
+    # A unique temporary file per call: threads of one process may write
+    # the same image at the same time.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def encode_preview(raw_path: str, png_path: str, thumb_path: str, parameters: str = None):
+    """Re-encodes a downloaded image as PNG with generation parameters, plus
+    a PNG thumbnail. Runs in a worker process.
+
+    Args:
+        raw_path (str): Image as downloaded.
+        png_path (str): Where to write the full size PNG.
+        thumb_path (str): Where to write the thumbnail.
+        parameters (str, optional): A1111-style `parameters` text chunk.
+    """
+    import io
+    from PIL import Image, PngImagePlugin
+
+    with Image.open(raw_path) as pil:
+        metadata = PngImagePlugin.PngInfo()
+        if parameters:
+            metadata.add_text("parameters", parameters)
+        with io.BytesIO() as output_bytes:
+            pil.save(output_bytes, "PNG", pnginfo=metadata)
+            _write_atomic(png_path, output_bytes.getvalue())
+
+        pil.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        with io.BytesIO() as output_bytes:
+            pil.save(output_bytes, "PNG")
+            _write_atomic(thumb_path, output_bytes.getvalue())
+    try:
+        os.unlink(raw_path)
+    except FileNotFoundError:
+        pass
+
+
+def link_or_copy(src: str, dst: str):
+    """Hard-links `src` to `dst`, falling back to a reflink and then a copy
+    when the two paths are on different filesystems."""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        os.link(src, dst)
+        return
+    except OSError as ex:
+        if ex.errno == errno.EEXIST:
+            raise
+    try:
+        import fcntl
+
+        FICLONE = 0x40049409
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return
+    except (ImportError, OSError):
+        pass
+    shutil.copyfile(src, dst)
+
+
+class ImageStore:
+    """Content-addressed cache of preview images, keyed by
+    `ModelVersionImage.hash`, so an image shared by several versions or
+    dumps is downloaded and encoded once.
+
+    For each image the store keeps the PNG written to dump directories
+    and a thumbnail used for cover images. The raw download only lives
+    there until it has been encoded.
+
+    Args:
+        root (str): Store directory, on the same filesystem as the dump
+            output for hard links to work.
+    """
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, image_hash: str, kind: str, ext: str) -> str:
+        # Image hashes are blurhashes, which contain characters not allowed
+        # in file names.
+        key = hashlib.sha1(image_hash.encode("utf8")).hexdigest()
+        return os.path.join(self.root, kind, key[:2], f"{key}{ext}")
+
+    def raw_path(self, image_hash: str) -> str:
+        return self._path(image_hash, "raw", "")
+
+    def png_path(self, image_hash: str) -> str:
+        return self._path(image_hash, "png", ".png")
+
+    def thumb_path(self, image_hash: str) -> str:
+        return self._path(image_hash, "thumb", ".png")
+
+    def has_encoded(self, image_hash: str) -> bool:
+        return os.path.exists(self.png_path(image_hash)) and os.path.exists(self.thumb_path(image_hash))
+
+    def put_raw(self, image_hash: str, data: bytes):
+        _write_atomic(self.raw_path(image_hash), data)
@@ -0,0 +1,144 @@
+import json
+import hashlib
+from datetime import datetime
+
+from src import metrics
+from src.models import Model, ModelVersion, ModelVersionFile, ModelVersionImage, ModelTag, VersionTrainedWord
+
+# Listed in requirements.txt: page parsing only meets its throughput
+# target with orjson, the json fallback keeps working without it.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data):
+    """Decodes a JSON document, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Parses the ISO 8601 timestamps the API returns.
+
+    `datetime.fromisoformat` covers them at a fraction of the cost of
+    `dateutil.parser.parse` and gives the same value. Anything it rejects
+    goes through dateutil.
+    """
+    if value[-1:] == "Z":
+        value = value[:-1] + "+00:00"
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        import dateutil.parser
+        return dateutil.parser.parse(value)
+
+
+class PageRows:
+    """Rows parsed from one or more API responses, as tuples in the column
+    order of each table (see `columns`).
+
+    Produced by `parse_item` without building ORM instances, consumed by
+    `persistence.save_rows`.
+    """
+    __slots__ = ("models", "versions", "files", "images", "tags", "trained_words")
+
+    def __init__(self):
+        self.models = []
+        self.versions = []
+        self.files = []
+        self.images = []
+        self.tags = []
+        self.trained_words = []
+
+    def tables(self):
+        """Yields `(table, rows)` for every table, parents first."""
+        yield Model.__table__, self.models
+        yield ModelVersion.__table__, self.versions
+        yield ModelVersionFile.__table__, self.files
+        yield ModelVersionImage.__table__, self.images
+        yield ModelTag.__table__, self.tags
+        yield VersionTrainedWord.__table__, self.trained_words
+
+
+# `json.dumps` builds a new encoder on every call that passes `default`.
+_fingerprint_encoder = json.JSONEncoder(default=str)
+_dumps = json.JSONEncoder().encode
+
+
+def columns(table) -> list[str]:
+    return [c.name for c in table.columns]
+
+
+def _unique_strings(values) -> list[str]:
+    return list(dict.fromkeys(v.strip() for v in values or [] if isinstance(v, str) and v.strip()))
+
+
+def parse_item(item: dict, page: PageRows):
+    """Appends the rows of one model to `page`.
+
+    Stores the same values as `civit_api.parse_model`, fingerprint
+    included, so the two parsers can be mixed on one database without
+    models being reported as changed.
+    """
+    model_id = int(item["id"])
+    creator = item["creator"]
+    model = (
+        model_id, item["name"], item["description"], item["type"], item["nsfw"],
+        _dumps(item["tags"]), None, creator["username"], creator["image"],
+    )
+    page.tags.extend((model_id, tag) for tag in _unique_strings(item["tags"]))
+
+    versions, files, images = [], [], []
+    for data in item["modelVersions"]:
+        version_id = int(data["id"])
+        versions.append((
+            version_id, data["name"], data["description"], data["baseModel"],
+            parse_timestamp(data["createdAt"]), data.get("downloadUrl", ""),
+            _dumps(data["trainedWords"]), model_id,
+        ))
+        page.trained_words.extend((version_id, word) for word in _unique_strings(data["trainedWords"]))
+
+        for file in data["files"]:
+            files.append((
+                int(file["id"]), file["name"], file["sizeKB"], file["type"], file["metadata"]["format"],
+                file["pickleScanResult"], file["virusScanResult"],
+                parse_timestamp(file["scannedAt"]) if file["scannedAt"] else datetime.min,
+                (file.get("hashes") or {}).get("SHA256"), version_id,
+            ))
+
+        for image in data["images"]:
+            images.append((
+                image["hash"], None, image["url"], image["nsfw"], image["width"], image["height"],
+                _dumps(image["meta"]), version_id,
+            ))
+
+    # Same digest as `civit_api._fingerprint`: one JSON array per row, in
+    # column order, fingerprint column excluded.
+    encode = _fingerprint_encoder.encode
+    digest = "".join([encode(model), *map(encode, versions), *map(encode, files), *map(encode, images)])
+    page.models.append(model + (hashlib.sha1(digest.encode("utf-8")).hexdigest(),))
+    page.versions.extend(versions)
+    page.files.extend(files)
+    page.images.extend(images)
+
+
+@metrics.timer("ingest.parse")
+def parse_page(data: dict) -> tuple[dict, PageRows]:
+    """Parses a decoded `/api/v1/models` response into rows.
+
+    The counterpart of `civit_api.parse_models_page` for ingestion, where
+    only the column values are needed.
+
+    Args:
+        data (dict): Decoded JSON response.
+
+    Returns:
+        tuple[dict, PageRows]: Metadata and the parsed rows.
+    """
+    page = PageRows()
+    for item in data["items"]:
+        parse_item(item, page)
+    return data["metadata"], page
@@ -0,0 +1,127 @@
+import pickle
+import zipfile
+import collections
+
+import torch
+
+# Typed storage classes named in torch.save pickles.
+STORAGE_DTYPES = {
+    "DoubleStorage": torch.float64,
+    "FloatStorage": torch.float32,
+    "HalfStorage": torch.float16,
+    "BFloat16Storage": torch.bfloat16,
+    "LongStorage": torch.int64,
+    "IntStorage": torch.int32,
+    "ShortStorage": torch.int16,
+    "CharStorage": torch.int8,
+    "ByteStorage": torch.uint8,
+    "BoolStorage": torch.bool,
+}
+
+
+class LazyStorage:
+    def __init__(self, archive, record, dtype):
+        self.archive = archive
+        self.record = record
+        self.dtype = dtype
+
+
+class LazyTensor:
+    """A tensor in a torch zip checkpoint whose data has not been read yet.
+
+    Exposes the attributes `safetensors_hack.save_file` needs to plan the
+    file layout; `materialize()` reads just this tensor's bytes.
+    """
+    def __init__(self, storage, offset, shape, stride):
+        self.storage = storage
+        self.offset = offset
+        self.shape = torch.Size(shape)
+        self.stride = tuple(stride)
+        self.dtype = storage.dtype
+
+    def numel(self) -> int:
+        return self.shape.numel()
+
+    def element_size(self) -> int:
+        return torch.empty((), dtype=self.dtype).element_size()
+
+    def is_contiguous(self) -> bool:
+        expected = 1
+        for size, stride in reversed(list(zip(self.shape, self.stride))):
+            if size != 1 and stride != expected:
+                return False
+            expected *= size
+        return True
+
+    def materialize(self) -> torch.Tensor:
+        itemsize = self.element_size()
+        with self.storage.archive.open(self.storage.record) as f:
+            if self.is_contiguous():
+                # Read only the slice of the storage this tensor covers.
+                f.seek(self.offset * itemsize)
+                data = bytearray(f.read(self.numel() * itemsize))
+                if not data:
+                    return torch.empty(self.shape, dtype=self.dtype)
+                return torch.frombuffer(data, dtype=self.dtype).reshape(self.shape)
+            data = bytearray(f.read())
+        storage = torch.frombuffer(data, dtype=self.dtype)
+        return storage.as_strided(self.shape, self.stride, self.offset).contiguous()
+
+
+def _rebuild_tensor(storage, offset, shape, stride, requires_grad=False, backward_hooks=None, metadata=None):
+    return LazyTensor(storage, offset, shape, stride)
+
+
+def _rebuild_parameter(data, requires_grad, backward_hooks):
+    return data
+
+
+class _LazyUnpickler(pickle.Unpickler):
+    """Unpickles `data.pkl` of a torch zip checkpoint, turning tensors into
+    `LazyTensor`s. Only the globals a plain state dict needs are allowed."""
+    def __init__(self, file, archive, prefix):
+        super().__init__(file)
+        self.archive = archive
+        self.prefix = prefix
+        self.storages = {}
+
+    def find_class(self, module, name):
+        if module == "torch._utils" and name == "_rebuild_tensor_v2":
+            return _rebuild_tensor
+        if module == "torch._utils" and name == "_rebuild_parameter":
+            return _rebuild_parameter
+        if module == "torch" and name in STORAGE_DTYPES:
+            return STORAGE_DTYPES[name]
+        if module == "collections" and name == "OrderedDict":
+            return collections.OrderedDict
+        raise pickle.UnpicklingError(f"Unsupported global in checkpoint: {module}.{name}")
+
+    def persistent_load(self, pid):
+        typename, dtype, key, _location, _numel = pid
+        if typename != "storage":
+            raise pickle.UnpicklingError(f"Unsupported persistent id: {typename}")
+        if key not in self.storages:
+            self.storages[key] = LazyStorage(self.archive, f"{self.prefix}data/{key}", dtype)
+        return self.storages[key]
+
+
+def load(filename: str) -> tuple[object, zipfile.ZipFile]:
+    """Reads the structure of a torch zip checkpoint without its tensor data.
+
+    Raises:
+        pickle.UnpicklingError: If the checkpoint holds anything but tensors,
+            containers and plain values.
+
+    Returns:
+        tuple[object, ZipFile]: The unpickled object with `LazyTensor`s, and
+            the open archive they read from, to be closed by the caller.
+    """
+    archive = zipfile.ZipFile(filename)
+    try:
+        pkl = next(name for name in archive.namelist() if name.endswith("data.pkl"))
+        with archive.open(pkl) as f:
+            obj = _LazyUnpickler(f, archive, pkl[:-len("data.pkl")]).load()
+    except BaseException:
+        archive.close()
+        raise
+    return obj, archive
@@ -1,40 +1,47 @@
 import os.path
-import torch
-from src import safetensors_hack
-from safetensors.torch import save_file
+import shutil
+import zipfile
+from src import metrics, safetensors_hack
 
+@metrics.timer("lora.write_metadata")
 def write_lora_metadata(model_path, updates):
   if model_path.startswith("\"") and model_path.endswith("\""):             # trim '"' at start/end
     model_path = model_path[1:-1]
   if not os.path.exists(model_path):
     return None
 
-  from safetensors.torch import save_file
-
-  metadata = None
-  tensors = {}
   if os.path.splitext(model_path)[1] == '.safetensors':
-    tensors, metadata = safetensors_hack.load_file(model_path, "cpu")
+    # Only the header changes, the tensor bytes are copied as they are.
+    metadata = safetensors_hack.read_metadata(model_path)
 
     for k, v in updates.items():
       metadata[k] = str(v)
 
-    save_file(tensors, model_path, metadata)
+    safetensors_hack.write_metadata(model_path, metadata)
     print(f" Model saved: {model_path}")
 
 
-def load_ckpt_weights(checkpoint_path):
+def unwrap_state_dict(weights):
+    # Check if the weights are contained in a "state_dict" key
+    if "state_dict" in weights:
+        weights = weights["state_dict"]
+        # If the weights are nested in another "state_dict" key, remove it
+        if "state_dict" in weights:
+            weights.pop("state_dict")
+    return weights
+
+
+def load_ckpt_weights(checkpoint_path, mmap=False):
+    import torch
+
     try:
         # Load the weights from the checkpoint file, without computing gradients
         with torch.no_grad():
-            weights = torch.load(checkpoint_path, map_location=torch.device('cpu'))
-            # Check if the weights are contained in a "state_dict" key
-            if "state_dict" in weights:
-                weights = weights["state_dict"]
-                # If the weights are nested in another "state_dict" key, remove it
-                if "state_dict" in weights:
-                    weights.pop("state_dict")
-            return weights
+            # Only the zip format written by torch >= 1.6 can be memory mapped,
+            # older pickles are read into memory as before.
+            kwargs = {"mmap": True} if mmap and zipfile.is_zipfile(checkpoint_path) else {}
+            weights = torch.load(checkpoint_path, map_location=torch.device('cpu'), **kwargs)
+            return unwrap_state_dict(weights)
 
     except Exception as e:
         if isinstance(e, (RuntimeError, EOFError)):
@@ -46,15 +53,55 @@ def load_ckpt_weights(checkpoint_path):
         else:
             print(f'Error: {e}')
 
-def convert_pt_to_safetensors(f):
+@metrics.timer("lora.convert")
+def convert_pt_to_safetensors(f, archive_dir=None):
+    """Converts a pickled checkpoint to .safetensors next to it.
+
+    Zip checkpoints are unpickled lazily and each tensor is read from the
+    archive only when it is written, so memory use stays around the size
+    of the largest tensor rather than the whole model. Checkpoints the
+    lazy reader cannot handle fall back to a memory-mapped `torch.load`.
+    On success the source is moved into `archive_dir`, or deleted if none
+    is given.
+
+    Args:
+        f (str): Path of the .pt/.ckpt file.
+        archive_dir (str, optional): Where to keep the source. Defaults to None.
+
+    Returns:
+        str: Path of the .safetensors file.
+    """
+    import torch
+    from src import lazy_checkpoint
+
     print(f"Convert .pt: {f}")
-    ext = os.path.splitext(f)[1]
-    fn = f"{f.replace(ext, '')}.safetensors"
-
-    with torch.no_grad():
-        weights = load_ckpt_weights(f)
-        fn = f"{f.replace(ext, '')}.safetensors"
-        print(f'Saving {fn}...')
-        save_file(weights, fn)
+    fn = f"{os.path.splitext(f)[0]}.safetensors"
+
+    archive = None
+    try:
+        with torch.no_grad():
+            weights = None
+            if zipfile.is_zipfile(f):
+                try:
+                    weights, archive = lazy_checkpoint.load(f)
+                    weights = unwrap_state_dict(weights)
+                except Exception as e:
+                    print(f" Cannot read lazily ({e}), loading with torch")
+            if weights is None:
+                weights = load_ckpt_weights(f, mmap=True)
+            if weights is None:
+                raise ValueError(f"Could not load checkpoint: {f}")
+            print(f'Saving {fn}...')
+            safetensors_hack.save_file(weights, fn)
+            del weights
+    finally:
+        if archive is not None:
+            archive.close()
+
+    if archive_dir:
+        os.makedirs(archive_dir, exist_ok=True)
+        shutil.move(f, os.path.join(archive_dir, os.path.basename(f)))
+    else:
+        os.unlink(f)
 
     return fn
@@ -0,0 +1,168 @@
+import json
+import time
+import bisect
+import functools
+import threading
+from datetime import datetime, timezone
+
+# Upper bounds of the histogram buckets for durations, in seconds.
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+# Upper bounds for sizes, in bytes.
+SIZE_BUCKETS = tuple(2 ** n for n in range(10, 36, 2))
+
+
+class Histogram:
+    """Count, sum, extremes and cumulative bucket counts of observed values."""
+    __slots__ = ("buckets", "counts", "count", "sum", "min", "max")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def to_dict(self) -> dict:
+        cumulative = []
+        total = 0
+        for bound, n in zip(self.buckets, self.counts):
+            total += n
+            cumulative.append([bound, total])
+        return {
+            "count": self.count, "sum": self.sum, "min": self.min, "max": self.max,
+            "mean": self.sum / self.count if self.count else None,
+            "buckets": cumulative,
+        }
+
+
+class Registry:
+    """Thread-safe counters and histograms, named `stage.what`.
+
+    Timers are histograms of seconds. Every update takes one lock, so
+    instrument operations (a request, a file, a page), not inner loops.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+
+    def count(self, name: str, value: float = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float, buckets: tuple = TIME_BUCKETS):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                "started": datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+                "seconds": time.time() - self.started,
+                "counters": dict(self.counters),
+                "histograms": {name: h.to_dict() for name, h in self.histograms.items()},
+            }
+
+    def to_prometheus(self, prefix: str = "civitai") -> str:
+        """Renders the registry in the Prometheus text exposition format."""
+        data = self.to_dict()
+        lines = []
+        for name, value in sorted(data["counters"].items()):
+            metric = _metric_name(prefix, name) + "_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, h in sorted(data["histograms"].items()):
+            metric = _metric_name(prefix, name)
+            lines.append(f"# TYPE {metric} histogram")
+            for bound, total in h["buckets"]:
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {total}')
+            lines += [f'{metric}_bucket{{le="+Inf"}} {h["count"]}', f"{metric}_sum {h['sum']}", f"{metric}_count {h['count']}"]
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """One line per timer, slowest total first, for the end of a run."""
+        data = self.to_dict()
+        timers = sorted(data["histograms"].items(), key=lambda item: -item[1]["sum"])
+        lines = [f"{'stage':<32} {'count':>8} {'total s':>10} {'mean ms':>10} {'max ms':>10}"]
+        for name, h in timers:
+            if name.endswith(".seconds"):
+                lines.append(f"{name[:-8]:<32} {h['count']:8d} {h['sum']:10.2f} {h['mean'] * 1000:10.2f} {h['max'] * 1000:10.2f}")
+        for name, value in sorted(data["counters"].items()):
+            lines.append(f"{name:<32} {value:8g}")
+        return "\n".join(lines)
+
+
+def _metric_name(prefix: str, name: str) -> str:
+    return prefix + "_" + "".join(c if c.isalnum() else "_" for c in name)
+
+
+_registry = Registry()
+
+
+def get_registry() -> Registry:
+    return _registry
+
+
+def count(name: str, value: float = 1):
+    """Adds `value` to the counter `name`."""
+    _registry.count(name, value)
+
+
+def observe(name: str, value: float, buckets: tuple = TIME_BUCKETS):
+    """Records `value` in the histogram `name`."""
+    _registry.observe(name, value, buckets)
+
+
+class timer:
+    """Times a block or, as a decorator, every call of a function into the
+    histogram `<name>.seconds`. Calls that raise are counted in
+    `<name>.errors` as well.
+
+    Args:
+        name (str): Stage name, e.g. `api.request`.
+    """
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _registry.observe(f"{self.name}.seconds", time.perf_counter() - self.start)
+        if exc_type is not None:
+            _registry.count(f"{self.name}.errors")
+        return False
+
+    def __call__(self, func):
+        name = self.name
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def write_report(path: str):
+    """Writes the registry to `path`: Prometheus text for `.prom` and
+    `.txt` files, JSON otherwise."""
+    if path.endswith((".prom", ".txt")):
+        content = _registry.to_prometheus()
+    else:
+        content = json.dumps(_registry.to_dict(), indent=2)
+    with open(path, "w") as f:
+        f.write(content)
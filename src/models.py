@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, ARRAY, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, ARRAY, Boolean, DateTime, ForeignKey, select
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, selectinload
 
 Base = declarative_base()
 
@@ -26,13 +26,15 @@ class Model(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String)
     description = Column(String)
-    type = Column(String)#	enum (Checkpoint, TextualInversion, Hypernetwork, AestheticGradient)
+    type = Column(String, index=True)#	enum (Checkpoint, TextualInversion, Hypernetwork, AestheticGradient)
     nsfw = Column(Boolean)
     tags = Column(String) # JSON array
     triggerWords = Column(String) # JSON array
-    creator_username = Column(String)
+    creator_username = Column(String, index=True)
     creator_image = Column(String) #TODO: figure out key to creator table
+    fingerprint = Column(String) # sha1 of the stored fields of the model and its children
     versions = relationship("ModelVersion", backref="model")
+    tag_links = relationship("ModelTag", backref="model")
 
 class ModelVersion(Base):
     """ModelVersion _summary_
@@ -48,9 +50,10 @@ class ModelVersion(Base):
     created_at = Column(DateTime)
     download_url = Column(String)
     trained_words = Column(String) # JSON array
-    parent_id = Column(Integer, ForeignKey("models.id"))
+    parent_id = Column(Integer, ForeignKey("models.id"), index=True)
     files = relationship("ModelVersionFile", backref="model_version")
     images = relationship("ModelVersionImage", backref="model_version")
+    trained_word_links = relationship("VersionTrainedWord", backref="model_version")
 
 class ModelVersionFile(Base):
     """ModelVersion _summary_
@@ -67,7 +70,8 @@ class ModelVersionFile(Base):
     pickle_scan_result = Column(String)
     virus_scan_result = Column(String)
     scanned_at = Column(DateTime)
-    parent_id = Column(Integer, ForeignKey("model_versions.id"))
+    sha256 = Column(String, nullable=True)
+    parent_id = Column(Integer, ForeignKey("model_versions.id"), index=True)
 
 class ModelVersionImage(Base):
     """ModelVersion _summary_
@@ -83,7 +87,62 @@ class ModelVersionImage(Base):
     width = Column(Integer)
     height = Column(Integer)
     meta = Column(String)
-    parent_id = Column(Integer, ForeignKey("model_versions.id"))
+    parent_id = Column(Integer, ForeignKey("model_versions.id"), index=True)
+
+class ModelTag(Base):
+    """ModelTag One row per tag of a model, mirrors `Model.tags`."""
+    __tablename__ = "model_tags"
+    model_id = Column(Integer, ForeignKey("models.id"), primary_key=True)
+    tag = Column(String, primary_key=True, index=True)
+
+class VersionTrainedWord(Base):
+    """VersionTrainedWord One row per trained word of a version, mirrors `ModelVersion.trained_words`."""
+    __tablename__ = "version_trained_words"
+    version_id = Column(Integer, ForeignKey("model_versions.id"), primary_key=True)
+    word = Column(String, primary_key=True, index=True)
+
+class FileHash(Base):
+    """FileHash Cached hashes of a local model file.
+
+    An entry is only valid while the file's size, mtime and inode still
+    match, so a rewritten file is hashed again.
+    """
+    __tablename__ = "file_hashes"
+    path = Column(String, primary_key=True)
+    size = Column(Integer)
+    mtime_ns = Column(Integer)
+    inode = Column(Integer)
+    model_hash = Column(String, nullable=True) # sha256 of the tensor region, see safetensors_hack.hash_file
+    legacy_hash = Column(String, nullable=True) # see safetensors_hack.legacy_hash_file
+    updated_at = Column(DateTime)
+
+class VerificationResult(Base):
+    """VerificationResult Outcome of the last `verify` probe of a model version's download.
+    """
+    __tablename__ = "verification_results"
+    version_id = Column(Integer, ForeignKey("model_versions.id"), primary_key=True)
+    model_id = Column(Integer, ForeignKey("models.id"), index=True)
+    url = Column(String, nullable=True)
+    status_code = Column(Integer, nullable=True)
+    ok = Column(Boolean)
+    error = Column(String, nullable=True)
+    checked_at = Column(DateTime, index=True)
+
+class LocalModelFile(Base):
+    """LocalModelFile Inventory of a .safetensors file on disk, read from its
+    header by `SafetensorsIndex` without loading any tensor.
+    """
+    __tablename__ = "local_model_files"
+    path = Column(String, primary_key=True)
+    size = Column(Integer)
+    mtime_ns = Column(Integer)
+    header_size = Column(Integer)
+    tensor_count = Column(Integer)
+    parameter_count = Column(Integer)
+    dtypes = Column(String) # JSON object, dtype -> number of parameters
+    metadata_json = Column(String) # JSON object, the file's __metadata__
+    base_model = Column(String, nullable=True, index=True) # ss_base_model_version, if present
+    updated_at = Column(DateTime)
 
 class Tag(Base):
     """Tag _summary_
@@ -101,3 +160,46 @@ class Tag(Base):
     metadata_total_pages = Column(String)
     metadata_next_page = Column(String)
     metadata_prev_page = Column(String)
+
+class CrawlState(Base):
+    """CrawlState Progress of an incremental crawl, one row per crawl key.
+
+    `high_water_mark` is the newest `ModelVersion.created_at` stored by the
+    last completed `sync` for that key. Full crawls (`models get`) keep the
+    request for their next page in `cursor` until they finish, so an
+    interrupted crawl resumes after its last committed page.
+    """
+    __tablename__ = "crawl_state"
+    key = Column(String, primary_key=True)
+    high_water_mark = Column(DateTime, nullable=True)
+    last_page = Column(Integer)
+    updated_at = Column(DateTime)
+    cursor = Column(String, nullable=True) # JSON params of the next request, see crawler.next_request
+    items_seen = Column(Integer, nullable=True) # distinct model ids returned so far
+    duplicates = Column(Integer, nullable=True) # model ids returned more than once
+    total_items = Column(Integer, nullable=True) # metadata.totalItems, when the API reports it
+    completed_at = Column(DateTime, nullable=True)
+
+class CrawlSeenModel(Base):
+    """CrawlSeenModel Model ids returned by the current full crawl of a key,
+    used to spot pages that overlap or skip models."""
+    __tablename__ = "crawl_seen_models"
+    key = Column(String, ForeignKey("crawl_state.key"), primary_key=True)
+    model_id = Column(Integer, primary_key=True)
+
+
+def load_model_tree() -> tuple:
+    """Loader options that fetch the versions, files and images of a batch of
+    models with one `SELECT ... WHERE parent_id IN (...)` per relationship,
+    instead of one lazy load per model and per version."""
+    versions = selectinload(Model.versions)
+    return (
+        versions.selectinload(ModelVersion.files),
+        versions.selectinload(ModelVersion.images),
+    )
+
+
+def has_tag(tag: str):
+    """`WHERE` clause matching models tagged `tag`, answered from the
+    `model_tags` index instead of scanning `Model.tags`."""
+    return Model.id.in_(select(ModelTag.model_id).where(ModelTag.tag == tag))
@@ -0,0 +1,208 @@
+import time
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+
+from src import metrics
+from src.models import Model, ModelVersion, ModelVersionFile, ModelVersionImage, ModelTag, VersionTrainedWord
+from src.search import refresh_search_index
+from src.ingest import PageRows, columns
+
+class PersistStats:
+    """Row counts and timing for one or more persisted pages."""
+
+    def __init__(self):
+        self.rows = {}
+        self.seconds = 0.0
+        self.models_new = 0
+        self.models_changed = 0
+        self.models_unchanged = 0
+
+    @property
+    def total_rows(self) -> int:
+        return sum(self.rows.values())
+
+    @property
+    def rows_per_second(self) -> float:
+        if self.seconds <= 0:
+            return 0.0
+        return self.total_rows / self.seconds
+
+    def add(self, other: "PersistStats"):
+        for table, count in other.rows.items():
+            self.rows[table] = self.rows.get(table, 0) + count
+        self.seconds += other.seconds
+        self.models_new += other.models_new
+        self.models_changed += other.models_changed
+        self.models_unchanged += other.models_unchanged
+
+    def __str__(self):
+        tables = ", ".join(f"{table}={count}" for table, count in self.rows.items())
+        return (f"{self.total_rows} rows ({tables}) in {self.seconds:.2f}s, {self.rows_per_second:.0f} rows/s; "
+                f"models new={self.models_new} changed={self.models_changed} unchanged={self.models_unchanged}")
+
+
+def _key_indexes(table, names) -> list[int]:
+    positions = [c.name for c in table.columns]
+    return [positions.index(name) for name in names]
+
+
+def _dedupe(table, rows: list[tuple]) -> list[tuple]:
+    """Drops duplicate primary keys so a single statement never touches the
+    same row twice. The last occurrence wins, matching repeated
+    `session.merge` calls."""
+    pk = _key_indexes(table, [c.name for c in table.primary_key.columns])
+    unique = {tuple(row[i] for i in pk): row for row in rows}
+    if len(unique) == len(rows):
+        return rows
+    return list(unique.values())
+
+
+def _to_tuples(objects, table) -> list[tuple]:
+    """Converts ORM instances to row tuples in the table's column order."""
+    keys = [c.key for c in table.columns]
+    return [tuple(getattr(obj, key) for key in keys) for obj in objects]
+
+
+def upsert_rows(conn, table, rows: list[dict]) -> int:
+    """Writes `rows` into `table` with INSERT ... ON CONFLICT DO UPDATE.
+
+    The statement is compiled once and all rows are bound to it in a single
+    `executemany`, which the sqlite3 driver runs as one prepared statement.
+    Rendering a literal multi-row VALUES clause instead spends most of the
+    time in SQLAlchemy's compiler.
+
+    Args:
+        conn (Connection): Open connection, the caller owns the transaction.
+        table (Table): Target table.
+        rows (list[dict]): Column dicts, all with the same keys.
+
+    Returns:
+        int: Number of rows written.
+    """
+    if not rows:
+        return 0
+
+    pk = [c.name for c in table.primary_key.columns]
+    columns = list(rows[0].keys())
+
+    stmt = insert(table)
+    updates = {c: stmt.excluded[c] for c in columns if c not in pk}
+    if updates:
+        stmt = stmt.on_conflict_do_update(index_elements=pk, set_=updates)
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=pk)
+    conn.execute(stmt, rows)
+
+    return len(rows)
+
+
+def replace_children(conn, table, parent_column: str, parent_ids, rows: list[dict]) -> int:
+    """Replaces every row of `table` belonging to `parent_ids` with `rows`.
+
+    Used for the association tables, where rows that vanished upstream have
+    to be removed rather than upserted.
+    """
+    if parent_ids:
+        conn.execute(delete(table).where(table.c[parent_column].in_(list(parent_ids))))
+    return upsert_rows(conn, table, rows)
+
+
+def _drop_unchanged(conn, stats, page):
+    """Filters out models whose stored fingerprint is identical, counting
+    new, changed and unchanged models into `stats`."""
+    table = Model.__table__
+    model_id, fingerprint = _key_indexes(table, ["id", "fingerprint"])
+    ids = [m[model_id] for m in page.models]
+    stored = dict(conn.execute(select(Model.id, Model.fingerprint).where(Model.id.in_(ids))).all()) if ids else {}
+
+    keep = set()
+    for m in page.models:
+        if m[model_id] not in stored:
+            stats.models_new += 1
+        elif m[fingerprint] is None or stored[m[model_id]] != m[fingerprint]:
+            stats.models_changed += 1
+        else:
+            stats.models_unchanged += 1
+            continue
+        keep.add(m[model_id])
+
+    if len(keep) == len(ids):
+        return page
+
+    kept = PageRows()
+    kept.models = [m for m in page.models if m[model_id] in keep]
+    kept.tags = [t for t in page.tags if t[0] in keep]
+    parent = _key_indexes(ModelVersion.__table__, ["parent_id"])[0]
+    kept.versions = [v for v in page.versions if v[parent] in keep]
+    version_ids = {v[0] for v in kept.versions}
+    kept.trained_words = [w for w in page.trained_words if w[0] in version_ids]
+    parent = _key_indexes(ModelVersionFile.__table__, ["parent_id"])[0]
+    kept.files = [f for f in page.files if f[parent] in version_ids]
+    parent = _key_indexes(ModelVersionImage.__table__, ["parent_id"])[0]
+    kept.images = [i for i in page.images if i[parent] in version_ids]
+    return kept
+
+
+def save_page(engine, models, modelVersions, modelVersionFiles, modelVersionImages) -> PersistStats:
+    """Persists the output of `parse_model` for one page in a single transaction.
+
+    Replaces per-object `session.merge`, which costs a SELECT plus an INSERT
+    or UPDATE for every entity. Models whose `fingerprint` matches the stored
+    one are skipped together with their versions, files and images. The
+    full-text search index is refreshed for every model that was written.
+
+    Args:
+        engine (Engine): Database engine.
+        models (list[Model]): Parsed models.
+        modelVersions (list[ModelVersion]): Parsed model versions.
+        modelVersionFiles (list[ModelVersionFile]): Parsed version files.
+        modelVersionImages (list[ModelVersionImage]): Parsed version images.
+
+    Returns:
+        PersistStats: Rows written per table and elapsed time.
+    """
+    page = PageRows()
+    page.models = _to_tuples(models, Model.__table__)
+    page.versions = _to_tuples(modelVersions, ModelVersion.__table__)
+    page.files = _to_tuples(modelVersionFiles, ModelVersionFile.__table__)
+    page.images = _to_tuples(modelVersionImages, ModelVersionImage.__table__)
+    page.tags = _to_tuples([t for m in models for t in m.tag_links], ModelTag.__table__)
+    page.trained_words = _to_tuples([w for v in modelVersions for w in v.trained_word_links], VersionTrainedWord.__table__)
+    return save_rows(engine, page)
+
+
+def save_rows(engine, page: PageRows) -> PersistStats:
+    """Persists rows from `ingest.parse_page` in a single transaction.
+
+    Same behavior as `save_page`, without going through ORM instances.
+
+    Args:
+        engine (Engine): Database engine.
+        page (PageRows): Parsed rows.
+
+    Returns:
+        PersistStats: Rows written per table and elapsed time.
+    """
+    stats = PersistStats()
+    start = time.perf_counter()
+
+    with engine.begin() as conn:
+        page = _drop_unchanged(conn, stats, page)
+        # Both ids are the first column of their table.
+        model_ids = [m[0] for m in page.models]
+        version_ids = [v[0] for v in page.versions]
+        for table, rows in page.tables():
+            names = columns(table)
+            rows = [dict(zip(names, row)) for row in _dedupe(table, rows)]
+            if table is ModelTag.__table__:
+                stats.rows[table.name] = replace_children(conn, table, "model_id", model_ids, rows)
+            elif table is VersionTrainedWord.__table__:
+                stats.rows[table.name] = replace_children(conn, table, "version_id", version_ids, rows)
+            else:
+                stats.rows[table.name] = upsert_rows(conn, table, rows)
+        refresh_search_index(conn, model_ids)
+
+    stats.seconds = time.perf_counter() - start
+    metrics.observe("db.save.seconds", stats.seconds)
+    metrics.count("db.rows", stats.total_rows)
+    return stats
@@ -0,0 +1,52 @@
+import sys
+import pstats
+import cProfile
+import threading
+
+
+class Profiler:
+    """cProfile over a whole run: the main thread and every thread started
+    after `start`, merged into one set of stats.
+
+    Work done in process pools (rehash, convert, preview encoding, replay
+    parsing) is not profiled, only the parent's wait for it.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profiles = []
+
+    def _add(self):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ profiles every thread from the first profiler
+            # and refuses a second one.
+            return
+        with self.lock:
+            self.profiles.append(profile)
+
+    def _thread_start(self, frame, event, arg):
+        sys.setprofile(None)
+        self._add()
+
+    def start(self):
+        threading.setprofile(self._thread_start)
+        self._add()
+
+    def stop(self, path: str, top: int = 25):
+        """Saves the merged stats to `path` (loadable with `pstats` or
+        snakeviz) and prints the `top` functions by cumulative time."""
+        threading.setprofile(None)
+        with self.lock:
+            profiles = list(self.profiles)
+        profiles[0].disable()
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            # Threads that made no calls have no stats, which pstats rejects.
+            profile.snapshot_stats()
+            if profile.stats:
+                stats.add(profile)
+        stats.dump_stats(path)
+        print(f"Profile saved to {path}, {len(profiles)} threads:")
+        stats.sort_stats("cumulative").print_stats(top)
@@ -1,16 +1,14 @@
 import io
 import os
 import mmap
-import torch
 import json
+import shutil
 import hashlib
-import safetensors
-import safetensors.torch
 
-from src import sd_models
+from src import metrics, sd_models
 
-# PyTorch 1.13 and later have _TypedStorage renamed to TypedStorage
-UntypedStorage = torch.storage.UntypedStorage if hasattr(torch.storage, 'UntypedStorage') else torch.storage._UntypedStorage
+# torch is only imported by the functions that build tensors, so hashing
+# and metadata helpers stay cheap to import.
 
 def read_metadata(filename):
     """Reads the JSON metadata from a .safetensors file"""
@@ -24,6 +22,103 @@ def read_metadata(filename):
     return metadata.get("__metadata__", {})
 
 
+def read_header(filename):
+    """Reads the raw JSON header of a .safetensors file.
+
+    Returns:
+        tuple[dict, int]: Parsed header and the offset where tensor data starts.
+    """
+    with open(filename, mode="rb") as file_obj:
+        n = int.from_bytes(file_obj.read(8), "little")
+        header = json.loads(file_obj.read(n))
+    return header, n + 8
+
+
+def encode_header(header):
+    """Encodes a header the way safetensors writes it: its length as 8
+    little-endian bytes, then compact JSON padded with spaces to 8 bytes."""
+    header_bytes = json.dumps(header, separators=(",", ":"), ensure_ascii=False).encode("utf8")
+    header_bytes += b" " * (-len(header_bytes) % 8)
+    return len(header_bytes).to_bytes(8, "little") + header_bytes
+
+
+def _copy_range(src, dst, offset, count):
+    """Copies `count` bytes of `src` from `offset` to the end of `dst`,
+    letting the kernel move the data when it can."""
+    src_fd, dst_fd = src.fileno(), dst.fileno()
+    dst.flush()
+    if hasattr(os, "copy_file_range"):
+        try:
+            while count > 0:
+                copied = os.copy_file_range(src_fd, dst_fd, count, offset)
+                if copied == 0:
+                    break
+                offset += copied
+                count -= copied
+        except OSError:
+            pass  # e.g. across filesystems on older kernels
+    if count > 0 and hasattr(os, "sendfile"):
+        try:
+            while count > 0:
+                sent = os.sendfile(dst_fd, src_fd, offset, count)
+                if sent == 0:
+                    break
+                offset += sent
+                count -= sent
+        except OSError:
+            pass
+    if count > 0:
+        dst.seek(0, os.SEEK_END)
+        src.seek(offset)
+        while count > 0:
+            chunk = src.read(min(count, 1024 * 1024))
+            if not chunk:
+                break
+            dst.write(chunk)
+            count -= len(chunk)
+    if count > 0:
+        raise IOError("Unexpected end of file copying tensor data")
+
+
+@metrics.timer("safetensors.write_metadata")
+def write_metadata(filename, metadata):
+    """Replaces the `__metadata__` of a .safetensors file without loading
+    any tensors.
+
+    A new header is written to a temporary file next to `filename`, the
+    tensor bytes are copied over unchanged and the temporary file replaces
+    the original, keeping its permissions. Tensor offsets are relative to
+    the end of the header, so they stay valid and the tensor region is
+    byte-identical.
+
+    Args:
+        filename (str): File to update.
+        metadata (dict): New metadata, values are converted to str.
+    """
+    header, data_start = read_header(filename)
+    tensors = {k: v for k, v in header.items() if k != "__metadata__"}
+    # Same layout as safetensors.torch.save: metadata first, tensors in
+    # offset order, compact JSON padded with spaces to 8 bytes.
+    new_header = {"__metadata__": {k: str(v) for k, v in metadata.items()}} if metadata else {}
+    new_header.update(sorted(tensors.items(), key=lambda kv: kv[1]["data_offsets"]))
+    header_bytes = encode_header(new_header)
+
+    size = os.path.getsize(filename)
+    tmp = f"{filename}.tmp"
+    try:
+        with open(filename, mode="rb") as src, open(tmp, mode="wb") as dst:
+            dst.write(header_bytes)
+            _copy_range(src, dst, data_start, size - data_start)
+        shutil.copymode(filename, tmp)
+        os.replace(tmp, filename)
+        metrics.count("safetensors.write_metadata.bytes", size - data_start + len(header_bytes))
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+@metrics.timer("safetensors.load")
 def load_file(filename, device):
     """"Loads a .safetensors file without memory mapping that locks the model file.
     Works around safetensors issue: https://github.com/huggingface/safetensors/issues/164"""
@@ -34,6 +129,10 @@ def load_file(filename, device):
             metadata_bytes = m.read(n)
             metadata = json.loads(metadata_bytes)
 
+    import torch
+
+    # PyTorch 1.13 and later have _TypedStorage renamed to TypedStorage
+    UntypedStorage = torch.storage.UntypedStorage if hasattr(torch.storage, 'UntypedStorage') else torch.storage._UntypedStorage
     size = os.stat(filename).st_size
     storage = UntypedStorage.from_file(filename, False, size)
     offset = n + 8
@@ -41,6 +140,7 @@ def load_file(filename, device):
     return {name: create_tensor(storage, info, offset) for name, info in metadata.items() if name != "__metadata__"}, md
 
 
+@metrics.timer("hash.tensor")
 def hash_file(filename):
     """Hashes a .safetensors file using the new hashing method.
     Only hashes the weights of the model."""
@@ -61,11 +161,25 @@ def hash_file(filename):
     return hash_sha256.hexdigest()
 
 
+# Order of the `Dtype` enum in the safetensors Rust crate. `save()` lays
+# tensors out by descending dtype, then by name.
+DTYPE_ORDER = [
+    "BOOL", "F4", "F6_E2M3", "F6_E3M2", "U8", "I8", "F8_E5M2", "F8_E4M3", "F8_E8M0",
+    "I16", "U16", "F16", "BF16", "I32", "U32", "F32", "C64", "F64", "I64", "U64",
+]
+
+
+def _layout_key(name, dtype):
+    return -DTYPE_ORDER.index(dtype), name
+
+
+@metrics.timer("hash.legacy")
 def legacy_hash_file(filename):
     """Hashes a model file using the legacy `sd_models.model_hash()` method."""
     hash_sha256 = hashlib.sha256()
 
-    metadata = read_metadata(filename)
+    header, data_start = read_header(filename)
+    metadata = header.get("__metadata__", {})
 
     # For compatibility with legacy models: This replicates the behavior of
     # sd_models.model_hash as if there were no user-specified metadata in the
@@ -75,13 +189,10 @@ def legacy_hash_file(filename):
     # updates the name/description/etc. The new hashing method fixes this
     # problem by only hashing the region of the file containing the tensors.
     if any(not k.startswith("ss_") for k in metadata):
-      # Strip the user metadata, re-serialize the file as if it were freshly
-      # created from sd-scripts, and hash that with model_hash's behavior.
-      tensors, metadata = load_file(filename, "cpu")
-      metadata = {k: v for k, v in metadata.items() if k.startswith("ss_")}
-      model_bytes = safetensors.torch.save(tensors, metadata)
-
-      hash_sha256.update(model_bytes[0x100000:0x110000])
+      # Strip the user metadata and work out what a fresh
+      # `safetensors.torch.save()` of the file would put in model_hash's
+      # window, reading only those bytes.
+      hash_sha256.update(_stripped_window(filename, header, data_start, 0x100000, 0x110000))
       return hash_sha256.hexdigest()[0:8]
     else:
       # This should work fine with model_hash since when the legacy hashing
@@ -90,27 +201,117 @@ def legacy_hash_file(filename):
       return sd_models.model_hash(filename)
 
 
+def _stripped_window(filename, header, data_start, start, end):
+    """Returns bytes `start:end` of the file `safetensors.torch.save()` would
+    write for this model with only its `ss_` metadata kept."""
+    metadata = {k: v for k, v in header.get("__metadata__", {}).items() if k.startswith("ss_")}
+    tensors = sorted(
+        ((name, info) for name, info in header.items() if name != "__metadata__"),
+        key=lambda item: _layout_key(item[0], item[1]["dtype"]),
+    )
+
+    new_header = {"__metadata__": metadata}
+    segments = []  # (offset in the original file, length) in output order
+    offset = 0
+    for name, info in tensors:
+        begin, stop = info["data_offsets"]
+        new_header[name] = {"dtype": info["dtype"], "shape": info["shape"], "data_offsets": [offset, offset + stop - begin]}
+        segments.append((data_start + begin, stop - begin))
+        offset += stop - begin
+
+    prefix = encode_header(new_header)
+
+    window = bytearray(prefix[start:end])
+    position = len(prefix)
+    with open(filename, mode="rb") as file_obj:
+        with mmap.mmap(file_obj.fileno(), length=0, access=mmap.ACCESS_READ) as m:
+            for source, length in segments:
+                if position >= end:
+                    break
+                lo, hi = max(start, position), min(end, position + length)
+                if lo < hi:
+                    window += m[source + lo - position:source + hi - position]
+                position += length
+    return bytes(window)
+
+
+# safetensors dtype -> name of the torch dtype
 DTYPES = {
-    "F64": torch.float64,
-    "F32": torch.float32,
-    "F16": torch.float16,
-    "BF16": torch.bfloat16,
-    "I64": torch.int64,
-    # "U64": torch.uint64,
-    "I32": torch.int32,
-    # "U32": torch.uint32,
-    "I16": torch.int16,
-    # "U16": torch.uint16,
-    "I8": torch.int8,
-    "U8": torch.uint8,
-    "BOOL": torch.bool
+    "F64": "float64",
+    "F32": "float32",
+    "F16": "float16",
+    "BF16": "bfloat16",
+    "I64": "int64",
+    # "U64": "uint64",
+    "I32": "int32",
+    # "U32": "uint32",
+    "I16": "int16",
+    # "U16": "uint16",
+    "I8": "int8",
+    "U8": "uint8",
+    "BOOL": "bool"
 }
 
 
 def create_tensor(storage, info, offset):
     """Creates a tensor without holding on to an open handle to the parent model
     file."""
-    dtype = DTYPES[info["dtype"]]
+    import torch
+
+    dtype = getattr(torch, DTYPES[info["dtype"]])
     shape = info["shape"]
     start, stop = info["data_offsets"]
     return torch.asarray(storage[start + offset : stop + offset], dtype=torch.uint8).view(dtype=dtype).reshape(shape).clone().detach()
+
+
+@metrics.timer("safetensors.save")
+def save_file(tensors, filename, metadata=None):
+    """Writes tensors to a .safetensors file one at a time.
+
+    Lays the tensors out like `safetensors.torch.save_file`, so the tensor
+    region and therefore the model and legacy hashes are identical; with
+    several metadata keys the header may differ, as safetensors writes them
+    in hash map order. Never holds more than one tensor's data in memory. Values may also be lazy
+    tensors such as `lazy_checkpoint.LazyTensor`, whose `materialize()` is
+    only called when that tensor is written. The file is written to
+    `<filename>.tmp` and renamed once complete, keeping the permissions of
+    an existing `filename`.
+
+    Args:
+        tensors (dict[str, torch.Tensor]): Tensors to save.
+        filename (str): Destination path.
+        metadata (dict[str, str], optional): Text metadata. Defaults to None.
+    """
+    import torch
+
+    DTYPE_NAMES = {getattr(torch, v): k for k, v in DTYPES.items()}
+    for name, tensor in tensors.items():
+        if not isinstance(tensor, torch.Tensor) and not hasattr(tensor, "materialize"):
+            raise TypeError(f"Key `{name}` is a {type(tensor).__name__}, not a tensor")
+        if tensor.dtype not in DTYPE_NAMES:
+            raise ValueError(f"Unsupported dtype {tensor.dtype} for `{name}`")
+    items = sorted(tensors.items(), key=lambda item: _layout_key(item[0], DTYPE_NAMES[item[1].dtype]))
+
+    header = {"__metadata__": metadata} if metadata is not None else {}
+    offset = 0
+    for name, tensor in items:
+        nbytes = tensor.numel() * tensor.element_size()
+        header[name] = {"dtype": DTYPE_NAMES[tensor.dtype], "shape": list(tensor.shape), "data_offsets": [offset, offset + nbytes]}
+        offset += nbytes
+
+    tmp = f"{filename}.tmp"
+    try:
+        with open(tmp, mode="wb") as file_obj:
+            file_obj.write(encode_header(header))
+            for name, tensor in items:
+                if hasattr(tensor, "materialize"):
+                    tensor = tensor.materialize()
+                if tensor.numel():
+                    file_obj.write(tensor.detach().contiguous().reshape(-1).view(torch.uint8).numpy().data)
+        if os.path.exists(filename):
+            shutil.copymode(filename, tmp)
+        os.replace(tmp, filename)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
@@ -0,0 +1,153 @@
+import os
+import json
+import mmap
+from collections import namedtuple
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import tqdm
+from sqlalchemy import select, delete
+
+from src.models import LocalModelFile
+from src.persistence import upsert_rows
+
+TensorInfo = namedtuple("TensorInfo", ["name", "dtype", "shape", "start", "end"])
+
+
+class SafetensorsIndex:
+    """Reads the header of a .safetensors file without torch.
+
+    Tensor data is only touched through `read()`, which slices a memory
+    map of the file.
+
+    Args:
+        filename (str): Path of the .safetensors file.
+    """
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            with mmap.mmap(f.fileno(), length=0, access=mmap.ACCESS_READ) as m:
+                n = int.from_bytes(m[:8], "little")
+                if n > len(m) - 8:
+                    raise ValueError(f"Header of {filename} is larger than the file")
+                header = json.loads(m[8:8 + n])
+        self.header_size = n + 8
+        self.metadata = header.pop("__metadata__", None) or {}
+        self.tensors = {
+            name: TensorInfo(name, info["dtype"], tuple(info["shape"]),
+                             self.header_size + info["data_offsets"][0], self.header_size + info["data_offsets"][1])
+            for name, info in header.items()
+        }
+
+    @property
+    def names(self) -> list[str]:
+        return list(self.tensors)
+
+    @property
+    def parameter_count(self) -> int:
+        return sum(_numel(t.shape) for t in self.tensors.values())
+
+    def dtype_counts(self) -> dict[str, int]:
+        """Returns the number of parameters stored in each dtype."""
+        counts = {}
+        for t in self.tensors.values():
+            counts[t.dtype] = counts.get(t.dtype, 0) + _numel(t.shape)
+        return counts
+
+    def read(self, name: str) -> bytes:
+        """Returns the raw little-endian bytes of one tensor."""
+        t = self.tensors[name]
+        if t.start == t.end:
+            return b""
+        with open(self.filename, "rb") as f:
+            with mmap.mmap(f.fileno(), length=0, access=mmap.ACCESS_READ) as m:
+                return m[t.start:t.end]
+
+
+def _numel(shape) -> int:
+    n = 1
+    for dim in shape:
+        n *= dim
+    return n
+
+
+def _index_row(path: str) -> dict:
+    st = os.stat(path)
+    index = SafetensorsIndex(path)
+    return {
+        "path": path,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "header_size": index.header_size,
+        "tensor_count": len(index.tensors),
+        "parameter_count": index.parameter_count,
+        "dtypes": json.dumps(index.dtype_counts()),
+        "metadata_json": json.dumps(index.metadata),
+        "base_model": index.metadata.get("ss_base_model_version"),
+        "updated_at": datetime.utcnow(),
+    }
+
+
+def scan_directory(engine, root: str, workers: int = 8) -> dict:
+    """Indexes every .safetensors file under `root` into `local_model_files`.
+
+    Files whose size and mtime are unchanged since the last scan are
+    skipped, headers of the others are read in a thread pool. Rows for
+    files that no longer exist under `root` are removed.
+
+    Args:
+        engine (Engine): Database engine.
+        root (str): Directory to scan.
+        workers (int, optional): Concurrent header reads. Defaults to 8.
+
+    Returns:
+        dict: Counts of fresh, indexed, failed and removed files.
+    """
+    root = os.path.abspath(root)
+    found = {}
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.endswith(".safetensors"):
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found[path] = (st.st_size, st.st_mtime_ns)
+
+    prefix = os.path.join(root, "")
+    with engine.connect() as conn:
+        known = {
+            row.path: (row.size, row.mtime_ns)
+            for row in conn.execute(
+                select(LocalModelFile.path, LocalModelFile.size, LocalModelFile.mtime_ns)
+                .where(LocalModelFile.path.startswith(prefix, autoescape=True))
+            )
+        }
+
+    stale = [path for path, key in found.items() if known.get(path) != key]
+    removed = [path for path in known if path not in found]
+    counts = {"fresh": len(found) - len(stale), "indexed": 0, "failed": 0, "removed": len(removed)}
+
+    def index(path):
+        try:
+            return _index_row(path)
+        except Exception as ex:
+            print(f"!!! FAILED indexing {path}: {ex}")
+            return None
+
+    rows = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for row in tqdm.tqdm(executor.map(index, stale), total=len(stale), unit="file"):
+            if row is None:
+                counts["failed"] += 1
+            else:
+                rows.append(row)
+                counts["indexed"] += 1
+
+    with engine.begin() as conn:
+        upsert_rows(conn, LocalModelFile.__table__, rows)
+        for i in range(0, len(removed), 500):
+            conn.execute(delete(LocalModelFile).where(LocalModelFile.path.in_(removed[i:i + 500])))
+
+    return counts
@@ -0,0 +1,94 @@
+from sqlalchemy import bindparam, text
+
+# Column weights passed to bm25(); a hit in the name outranks one in the description.
+SEARCH_WEIGHTS = {
+    "name": 10.0,
+    "description": 1.0,
+    "tags": 5.0,
+    "creator": 3.0,
+    "trained_words": 5.0,
+}
+
+_REFRESH_SQL = text("""
+    INSERT INTO models_fts(rowid, name, description, tags, creator, trained_words)
+    SELECT m.id, m.name, m.description, m.tags, m.creator_username,
+           (SELECT group_concat(v.trained_words, ' ') FROM model_versions v WHERE v.parent_id = m.id)
+    FROM models m
+""")
+
+
+def create_search_index(conn) -> bool:
+    """Creates the `models_fts` FTS5 table if missing.
+
+    Returns:
+        bool: True if the table was created and needs a full rebuild.
+    """
+    exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'models_fts'")).first()
+    if exists:
+        return False
+    columns = ", ".join(SEARCH_WEIGHTS)
+    conn.execute(text(f"CREATE VIRTUAL TABLE models_fts USING fts5({columns}, tokenize='unicode61 remove_diacritics 2')"))
+    return True
+
+
+def rebuild_search_index(conn):
+    """Re-indexes every stored model."""
+    conn.execute(text("DELETE FROM models_fts"))
+    conn.execute(_REFRESH_SQL)
+
+
+def refresh_search_index(conn, model_ids):
+    """Re-indexes `model_ids` from the rows written in the current transaction.
+
+    Args:
+        conn (Connection): Connection inside the write transaction.
+        model_ids (list[int]): Models that were inserted or updated.
+    """
+    if not model_ids:
+        return
+    ids = bindparam("ids", expanding=True)
+    conn.execute(text("DELETE FROM models_fts WHERE rowid IN :ids").bindparams(ids), {"ids": list(model_ids)})
+    conn.execute(
+        text(_REFRESH_SQL.text + " WHERE m.id IN :ids").bindparams(ids),
+        {"ids": list(model_ids)},
+    )
+
+
+def to_match_query(query: str) -> str:
+    """Turns free text into an FTS5 query: every word must match, as a prefix.
+
+    Words are quoted so punctuation in user input cannot be parsed as FTS5
+    syntax.
+    """
+    terms = ['"' + term.replace('"', '""') + '"*' for term in query.split()]
+    return " ".join(terms)
+
+
+def search_models(conn, query: str, limit: int = 20, model_type: str = None) -> list:
+    """Runs a ranked full-text search over the local mirror.
+
+    Args:
+        conn (Connection): Database connection.
+        query (str): Free text query.
+        limit (int, optional): Maximum results. Defaults to 20.
+        model_type (str, optional): Only return models of this type. Defaults to None.
+
+    Returns:
+        list: Rows of (id, name, type, creator_username, rank), best match first.
+    """
+    match = to_match_query(query)
+    if not match:
+        return []
+    weights = ", ".join(str(w) for w in SEARCH_WEIGHTS.values())
+    sql = f"""
+        SELECT m.id, m.name, m.type, m.creator_username, bm25(models_fts, {weights}) AS rank
+        FROM models_fts
+        JOIN models m ON m.id = models_fts.rowid
+        WHERE models_fts MATCH :match
+    """
+    params = {"match": match, "limit": int(limit)}
+    if model_type:
+        sql += " AND m.type = :model_type"
+        params["model_type"] = model_type
+    sql += " ORDER BY rank LIMIT :limit"
+    return conn.execute(text(sql), params).all()
@@ -0,0 +1,248 @@
+import json
+import collections
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, func, select
+
+from src.models import CrawlState, CrawlSeenModel, Model, ModelVersion
+from src.crawler import ModelsCrawler, next_request
+from src.ingest import columns, parse_page
+from src.persistence import PersistStats, save_rows, upsert_rows
+
+
+VERSION_ID = columns(ModelVersion.__table__).index("id")
+CREATED_AT = columns(ModelVersion.__table__).index("created_at")
+
+
+def _naive_utc(value: datetime) -> datetime:
+    """SQLite stores DateTime columns without a timezone, so compare in naive UTC."""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+# Request params that do not narrow down which models are returned.
+UNFILTERED_PARAMS = ("limit", "sort")
+
+
+def crawl_key(params: dict, kind: str = "models") -> str:
+    """Builds the `crawl_state` key for a set of request filters."""
+    return f"{kind}:" + json.dumps(params, sort_keys=True)
+
+
+def load_state(session, key: str) -> CrawlState:
+    state = session.get(CrawlState, key)
+    if state is None:
+        state = CrawlState(key=key, high_water_mark=None, last_page=0)
+    return state
+
+
+def _has_new_content(conn, versions: list[tuple], high_water_mark: datetime) -> bool:
+    """True if any version row of a page is missing locally or newer than
+    the stored high-water mark. Without a mark no walk has completed yet,
+    so every page counts as new."""
+    ids = list({v[VERSION_ID] for v in versions})
+    if not ids:
+        return False
+    if high_water_mark is None:
+        return True
+    known = set()
+    for i in range(0, len(ids), 500):
+        known.update(conn.scalars(select(ModelVersion.id).where(ModelVersion.id.in_(ids[i:i + 500]))))
+    if len(known) < len(ids):
+        return True
+    created = (_naive_utc(v[CREATED_AT]) for v in versions)
+    return any(c is not None and c > high_water_mark for c in created)
+
+
+def sync_models(engine, Session, params: dict = None, rate: float = 1.0, max_pages: int = None) -> PersistStats:
+    """Fetches models newest first until a page contains nothing new: every
+    version on it is stored locally and no newer than the high-water mark.
+    The first sync for a set of filters starts from the newest version
+    already stored, e.g. by `models get`.
+
+    Pages are walked through the `nextCursor`/`nextPage` links of each
+    response and upserted as they arrive. The high-water mark is only
+    advanced once the walk finishes, so an interrupted sync repeats the
+    same pages next time instead of leaving a gap.
+
+    Args:
+        engine (Engine): Database engine.
+        Session (sessionmaker): Session factory bound to `engine`.
+        params (dict, optional): Extra `_request_models` filters. Defaults to None.
+        rate (float, optional): Maximum requests per second. Defaults to 1.
+        max_pages (int, optional): Stop after this many pages, leaving the high-water mark as it was. Defaults to None.
+
+    Returns:
+        PersistStats: Rows written during the sync.
+    """
+    params = dict(params or {})
+    params["sort"] = "Newest"
+    key = crawl_key(params)
+
+    with Session() as session:
+        state = session.get(CrawlState, key)
+        if state is None:
+            # First sync for these filters: start from what earlier crawls
+            # stored. The seed is saved before walking, so an interrupted
+            # first sync resumes from it rather than from its own pages.
+            state = load_state(session, key)
+            state.high_water_mark = session.scalar(select(func.max(ModelVersion.created_at)))
+            state.updated_at = datetime.utcnow()
+            session.add(state)
+            session.commit()
+        high_water_mark = state.high_water_mark
+    print(f"Syncing {key}, high-water mark: {high_water_mark}")
+
+    crawler = ModelsCrawler(params, workers=1, rate=rate)
+    total_stats = PersistStats()
+    newest = high_water_mark
+    request = {}
+    page = 0
+    completed = False
+
+    while request is not None:
+        data = crawler.fetch(request)
+        page += 1
+        metadata, rows = parse_page(data)
+        with engine.connect() as conn:
+            has_new = _has_new_content(conn, rows.versions, high_water_mark)
+
+        stats = save_rows(engine, rows)
+        total_stats.add(stats)
+        print(f"Synced page {page}: {stats}")
+
+        for version in rows.versions:
+            created_at = _naive_utc(version[CREATED_AT])
+            if created_at is not None and (newest is None or created_at > newest):
+                newest = created_at
+
+        if not has_new:
+            print(f"Page {page} holds no new content, stopping.")
+            completed = True
+            break
+        # Follow the links the API hands out, cursor-paginated responses
+        # do not report totalPages.
+        request = next_request(metadata)
+        if request is None:
+            completed = True
+        elif max_pages and page >= max_pages:
+            break
+
+    with Session() as session:
+        state = load_state(session, key)
+        if completed:
+            state.high_water_mark = newest
+        else:
+            print(f"Stopped after {max_pages} pages, keeping the high-water mark at {high_water_mark}")
+        state.last_page = page
+        state.updated_at = datetime.utcnow()
+        session.merge(state)
+        session.commit()
+
+    print(f"Sync finished after {page} pages: {total_stats}")
+    return total_stats
+
+
+def _state_row(state: CrawlState) -> dict:
+    return {c.name: getattr(state, c.key) for c in CrawlState.__table__.columns}
+
+
+def _record_page(engine, state: CrawlState, ids: list[int]) -> list[int]:
+    """Saves the model ids of a committed page together with the crawl
+    position, in one transaction.
+
+    Returns:
+        list[int]: Ids already returned earlier in the crawl, or twice on this page.
+    """
+    counts = collections.Counter(ids)
+    with engine.begin() as conn:
+        seen = set()
+        unique = list(counts)
+        for i in range(0, len(unique), 500):
+            seen.update(conn.scalars(
+                select(CrawlSeenModel.model_id)
+                .where(CrawlSeenModel.key == state.key)
+                .where(CrawlSeenModel.model_id.in_(unique[i:i + 500]))
+            ))
+        new = [i for i in unique if i not in seen]
+        state.items_seen += len(new)
+        state.duplicates += len(ids) - len(new)
+        state.updated_at = datetime.utcnow()
+        upsert_rows(conn, CrawlState.__table__, [_state_row(state)])
+        upsert_rows(conn, CrawlSeenModel.__table__, [{"key": state.key, "model_id": i} for i in new])
+    return sorted(seen | {i for i, n in counts.items() if n > 1})
+
+
+def crawl_models(engine, Session, params: dict = None, rate: float = 1.0, restart: bool = False) -> PersistStats:
+    """Walks every page of `/api/v1/models` by following the cursor the API
+    returns, instead of page offsets that shift while new models arrive.
+
+    The next cursor is saved with each committed page, so an interrupted
+    crawl picks up after the last saved page when run again with the same
+    filters. Model ids returned more than once are reported per page, and
+    the final report compares the distinct ids seen with `totalItems`.
+
+    Args:
+        engine (Engine): Database engine.
+        Session (sessionmaker): Session factory bound to `engine`.
+        params (dict, optional): Extra `_request_models` filters. Defaults to None.
+        rate (float, optional): Maximum requests per second. Defaults to 1.
+        restart (bool, optional): Discard the position of an unfinished crawl. Defaults to False.
+
+    Returns:
+        PersistStats: Rows written during the crawl.
+    """
+    params = dict(params or {})
+    key = crawl_key(params, "models-full")
+
+    with Session() as session:
+        state = load_state(session, key)
+        session.expunge_all()
+    if state.cursor is None or restart:
+        # Nothing to resume: a new crawl with fresh completeness counters.
+        start = None
+        state.last_page = 0
+        state.items_seen = 0
+        state.duplicates = 0
+        state.total_items = None
+        state.completed_at = None
+        with engine.begin() as conn:
+            conn.execute(delete(CrawlSeenModel).where(CrawlSeenModel.key == key))
+        print(f"Crawling {key}")
+    else:
+        start = json.loads(state.cursor)
+        print(f"Resuming {key} after page {state.last_page}, {state.items_seen} models seen")
+
+    crawler = ModelsCrawler(params, workers=1, rate=rate)
+    total_stats = PersistStats()
+    for request, data, following in crawler.follow(start):
+        metadata, rows = parse_page(data)
+        stats = save_rows(engine, rows)
+        total_stats.add(stats)
+
+        state.last_page += 1
+        if metadata.get("totalItems") is not None:
+            state.total_items = metadata["totalItems"]
+        state.cursor = json.dumps(following) if following is not None else None
+        if following is None:
+            state.completed_at = datetime.utcnow()
+        duplicates = _record_page(engine, state, [m[0] for m in rows.models])
+
+        print(f"Saved page {state.last_page} {request}: {stats}")
+        if duplicates:
+            print(f"!!! Page {state.last_page} repeats {len(duplicates)} models: {duplicates[:20]}")
+
+    report = f"Crawl finished after {state.last_page} pages: {state.items_seen} models, {state.duplicates} repeated"
+    if state.total_items is not None:
+        report += f", {state.total_items} reported by the API ({max(0, state.total_items - state.items_seen)} missing)"
+    if not any(v is not None for k, v in params.items() if k not in UNFILTERED_PARAMS):
+        with engine.connect() as conn:
+            unseen = conn.scalar(
+                select(func.count()).select_from(Model)
+                .where(Model.id.not_in(select(CrawlSeenModel.model_id).where(CrawlSeenModel.key == key)))
+            )
+        report += f", {unseen} stored models not returned"
+    print(report)
+    print(f"Total: {total_stats}")
+    return total_stats
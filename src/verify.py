@@ -0,0 +1,139 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import tqdm
+from sqlalchemy import select
+
+from src import http_client, metrics
+from src.http_client import TokenBucket
+from src.civit_api import API_HOST
+from src.models import VerificationResult
+from src.persistence import upsert_rows
+
+# Results are written in batches of this many rows.
+RESULT_BATCH_SIZE = 200
+
+VerifyTarget = namedtuple("VerifyTarget", ["model_id", "model_name", "version_id", "version_name", "url"])
+
+
+@metrics.timer("verify.probe")
+def probe(url: str) -> tuple[int, str]:
+    """Checks that `url` serves a file without downloading it.
+
+    Tries a HEAD request first. Signed storage URLs behind the redirect
+    often only accept GET, so anything else is retried as a GET for the
+    first byte. Responses are always closed so connections go back to
+    the pool.
+
+    Returns:
+        tuple[int, str]: Final status code, and an error description or None.
+    """
+    response = http_client.head(url, allow_redirects=True)
+    response.close()
+    if response.status_code == 200:
+        return response.status_code, None
+
+    response = http_client.get(url, headers={"Range": "bytes=0-0"}, allow_redirects=True, stream=True)
+    try:
+        if response.status_code == 206:
+            response.content  # a single byte, lets the connection be reused
+            return response.status_code, None
+        if response.status_code == 200:
+            # Range ignored: the file is there, drop the connection instead of reading it.
+            return response.status_code, None
+        body = next(response.iter_content(512), b"")
+        return response.status_code, body.decode("utf8", errors="replace") or response.reason
+    finally:
+        response.close()
+
+
+def needs_probe(engine, version_ids: list[int], max_age: timedelta) -> set[int]:
+    """Returns the versions without a successful result newer than `max_age`."""
+    cutoff = datetime.utcnow() - max_age
+    fresh = set()
+    with engine.connect() as conn:
+        for i in range(0, len(version_ids), 500):
+            stmt = (
+                select(VerificationResult.version_id)
+                .where(VerificationResult.version_id.in_(version_ids[i:i + 500]))
+                .where(VerificationResult.ok)
+                .where(VerificationResult.checked_at >= cutoff)
+            )
+            fresh.update(conn.scalars(stmt))
+    return set(version_ids) - fresh
+
+
+class Verifier:
+    """Probes model downloads concurrently and records the outcome in
+    `verification_results`.
+
+    Args:
+        engine (Engine): Database engine.
+        workers (int, optional): Probes kept in flight. Defaults to 8.
+        rate (float, optional): Maximum requests per second to the API host. Defaults to 1.
+    """
+    def __init__(self, engine, workers: int = 8, rate: float = 1.0):
+        self.engine = engine
+        self.workers = max(1, workers)
+        http_client.get_client().limit_host(API_HOST, TokenBucket(rate, burst=self.workers))
+
+    def _check(self, target: VerifyTarget) -> dict:
+        row = {
+            "version_id": target.version_id, "model_id": target.model_id, "url": target.url,
+            "status_code": None, "ok": False, "error": None,
+        }
+        if target.url is None:
+            row["error"] = "No file!"
+        else:
+            try:
+                row["status_code"], row["error"] = probe(target.url)
+                row["ok"] = row["error"] is None
+            except Exception as ex:
+                row["error"] = str(ex)
+        metrics.count("verify.ok" if row["ok"] else "verify.failed")
+        row["checked_at"] = datetime.utcnow()
+        return row
+
+    def _save(self, rows: list[dict]):
+        with self.engine.begin() as conn:
+            upsert_rows(conn, VerificationResult.__table__, rows)
+
+    def run(self, targets: list[VerifyTarget]) -> list[tuple[VerifyTarget, dict]]:
+        """Probes every target, saving results as they complete.
+
+        Returns:
+            list[tuple[VerifyTarget, dict]]: Targets that failed, with their result row.
+        """
+        failures = []
+        batch = []
+        targets_iter = iter(targets)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor, tqdm.tqdm(total=len(targets)) as progress:
+            pending = {}
+
+            def submit():
+                target = next(targets_iter, None)
+                if target is not None:
+                    pending[executor.submit(self._check, target)] = target
+
+            for _ in range(self.workers * 2):
+                submit()
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    target = pending.pop(future)
+                    submit()
+                    row = future.result()
+                    if not row["ok"]:
+                        print(f"!!! {target.model_id} - {target.model_name} ({target.version_name}): {row['status_code']} {row['error']}")
+                        failures.append((target, row))
+                    batch.append(row)
+                    progress.update(1)
+                if len(batch) >= RESULT_BATCH_SIZE:
+                    self._save(batch)
+                    batch = []
+
+        if batch:
+            self._save(batch)
+        return failures
@@ -0,0 +1,36 @@
+import pytest
+
+from benchmarks.stub_server import StubServer, reroute
+
+
+@pytest.fixture
+def stub_server(tmp_path):
+    """Starts a `StubServer` serving `tmp_path/files` and routes the shared
+    HTTP client's civitai.com requests to it. Call it with `StubServer`
+    keyword arguments."""
+    servers = []
+
+    def start(**kwargs):
+        root = tmp_path / "files"
+        root.mkdir(exist_ok=True)
+        server = StubServer(str(root), **kwargs).start()
+        reroute(server)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def database(tmp_path):
+    """A migrated database in `tmp_path`, as `(engine, Session)`."""
+    from sqlalchemy.orm import sessionmaker
+    from src.database import create_database_engine, init_database
+
+    engine = create_database_engine(str(tmp_path / "test"))
+    init_database(engine)
+    yield engine, sessionmaker(bind=engine)
+    engine.dispose()
@@ -0,0 +1,43 @@
+from src.crawler import ModelsCrawler, next_request
+
+
+def test_next_request_prefers_cursor():
+    assert next_request({"nextCursor": 5, "nextPage": "https://civitai.com/api/v1/models?page=3"}) == {"cursor": "5"}
+    assert next_request({"nextPage": "https://civitai.com/api/v1/models?limit=5&cursor=abc"}) == {"cursor": "abc"}
+    assert next_request({"nextPage": "https://civitai.com/api/v1/models?page=3"}) == {"page": 3}
+    assert next_request({"totalPages": 3}) is None
+
+
+def test_crawl_follows_links_without_total_pages(stub_server):
+    stub_server(api_pages=3)
+    crawler = ModelsCrawler({"limit": 5}, rate=1000)
+
+    pages = list(crawler.crawl())
+
+    assert [page for page, _ in pages] == [1, 2, 3]
+    ids = [item["id"] for _, data in pages for item in data["items"]]
+    assert ids == list(range(15))
+    assert crawler.failed_pages == []
+
+
+def test_crawl_without_total_pages_stops_at_last_page(stub_server):
+    stub_server(api_pages=5)
+    crawler = ModelsCrawler({"limit": 5}, rate=1000)
+
+    assert [page for page, _ in crawler.crawl(last_page=2)] == [1, 2]
+
+
+def test_crawl_records_failed_link(stub_server, monkeypatch):
+    stub_server(api_pages=3)
+    crawler = ModelsCrawler({"limit": 5}, rate=1000)
+    fetch = crawler.fetch
+
+    def failing_fetch(request):
+        if request.get("cursor") == "2":
+            raise RuntimeError("Failed request")
+        return fetch(request)
+
+    monkeypatch.setattr(crawler, "fetch", failing_fetch)
+
+    assert [page for page, _ in crawler.crawl()] == [1, 2]
+    assert crawler.failed_pages == [3]
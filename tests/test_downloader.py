@@ -0,0 +1,136 @@
+import os
+import json
+import random
+import hashlib
+
+import pytest
+
+from src.downloader import Downloader, DownloadError
+
+URL = "https://civitai.com/api/download/models/1234"
+SIZE = 300 * 1024
+
+
+@pytest.fixture
+def model_file(tmp_path) -> bytes:
+    """A served file of random bytes, returned as its content."""
+    data = random.Random(0).randbytes(SIZE)
+    (tmp_path / "files").mkdir(exist_ok=True)
+    (tmp_path / "files" / "1234.safetensors").write_bytes(data)
+    return data
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest().upper()
+
+
+def test_resumes_after_dropped_connection(stub_server, model_file, tmp_path, capsys):
+    server = stub_server(drop_after=100 * 1024)
+    outpath = str(tmp_path / "out" / "model.bin")
+    os.makedirs(os.path.dirname(outpath))
+
+    hasher = Downloader(chunk_size=16 * 1024).download(URL, outpath, size_kb=SIZE / 1024, sha256=sha256(model_file))
+
+    assert open(outpath, "rb").read() == model_file
+    assert hasher.sha256 == hashlib.sha256(model_file).hexdigest()
+    assert "Resuming at" in capsys.readouterr().out
+    # Only the partial chunk read before the drop is fetched twice.
+    assert SIZE < server.bytes_sent < SIZE + 16 * 1024
+    assert not os.path.exists(outpath + ".part")
+
+
+def interrupted_segments(outpath: str, data: bytes, size: int = SIZE):
+    """Leaves a segmented download of `data` with the first half of each of
+    its four segments written."""
+    step = SIZE // 4
+    segments = [[start, start + step, start + step // 2] for start in range(0, SIZE, step)]
+    part = bytearray(SIZE)
+    for start, _, done in segments:
+        part[start:done] = data[start:done]
+    with open(outpath + ".part", "wb") as f:
+        f.write(part)
+    with open(outpath + ".part.json", "w") as f:
+        json.dump({"size": size, "segments": segments}, f)
+
+
+def test_segmented_download_resumes_from_state_file(stub_server, model_file, tmp_path, capsys):
+    server = stub_server()
+    outpath = str(tmp_path / "model.bin")
+    interrupted_segments(outpath, model_file)
+
+    downloader = Downloader(chunk_size=16 * 1024, segments=4, segment_threshold=1)
+    hasher = downloader.download(URL, outpath, size_kb=SIZE / 1024, sha256=sha256(model_file))
+
+    assert open(outpath, "rb").read() == model_file
+    assert hasher.sha256 == hashlib.sha256(model_file).hexdigest()
+    assert "Resuming segmented download" in capsys.readouterr().out
+    # One byte for the range probe, then only the missing halves.
+    assert server.bytes_sent == 1 + SIZE // 2
+    assert not os.path.exists(outpath + ".part.json")
+
+
+def test_complete_part_file_is_accepted_on_416(stub_server, model_file, tmp_path):
+    server = stub_server()
+    outpath = str(tmp_path / "model.bin")
+    with open(outpath + ".part", "wb") as f:
+        f.write(model_file)
+
+    hasher = Downloader().download(URL, outpath, size_kb=SIZE / 1024, sha256=sha256(model_file))
+
+    assert hasher.sha256 == hashlib.sha256(model_file).hexdigest()
+    assert open(outpath, "rb").read() == model_file
+    assert server.bytes_sent == 0
+
+
+@pytest.mark.parametrize("segments", [1, 4])
+@pytest.mark.parametrize("size_kb, expected_sha256", [
+    (SIZE / 1024 + 10, None),
+    (SIZE / 1024, "0" * 64),
+])
+def test_mismatch_discards_part_file(stub_server, model_file, tmp_path, segments, size_kb, expected_sha256):
+    stub_server()
+    outpath = str(tmp_path / "model.bin")
+    downloader = Downloader(segments=segments, segment_threshold=1)
+
+    with pytest.raises(DownloadError, match="Verification failed"):
+        downloader.download(URL, outpath, size_kb=size_kb, sha256=expected_sha256)
+
+    assert not os.path.exists(outpath)
+    assert not os.path.exists(outpath + ".part")
+    assert not os.path.exists(outpath + ".part.json")
+
+
+def test_segmented_part_file_is_not_resumed_as_a_stream(stub_server, model_file, tmp_path):
+    server = stub_server()
+    outpath = str(tmp_path / "model.bin")
+    interrupted_segments(outpath, model_file)
+
+    # A single connection without a checksum: the holes must still be filled.
+    Downloader(chunk_size=16 * 1024).download(URL, outpath, size_kb=SIZE / 1024)
+
+    assert open(outpath, "rb").read() == model_file
+    assert server.bytes_sent == 1 + SIZE // 2
+    assert not os.path.exists(outpath + ".part.json")
+
+
+def test_stale_segment_state_starts_over(stub_server, model_file, tmp_path):
+    server = stub_server()
+    outpath = str(tmp_path / "model.bin")
+    interrupted_segments(outpath, model_file, size=SIZE + 1)
+
+    Downloader(chunk_size=16 * 1024).download(URL, outpath, size_kb=SIZE / 1024)
+
+    assert open(outpath, "rb").read() == model_file
+    assert server.bytes_sent == 1 + SIZE
+
+
+def test_416_for_oversized_part_file_starts_over(stub_server, model_file, tmp_path):
+    server = stub_server()
+    outpath = str(tmp_path / "model.bin")
+    with open(outpath + ".part", "wb") as f:
+        f.write(b"x" * (SIZE + 100))
+
+    Downloader().download(URL, outpath, size_kb=SIZE / 1024)
+
+    assert open(outpath, "rb").read() == model_file
+    assert server.bytes_sent == SIZE
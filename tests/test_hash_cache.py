@@ -0,0 +1,41 @@
+import os
+
+import torch
+from sqlalchemy import select
+
+from src.convert import convert_files
+from src.hash_cache import HashCache
+from src.models import FileHash
+
+
+def cached_paths(engine) -> list[str]:
+    with engine.connect() as conn:
+        return list(conn.scalars(select(FileHash.path)))
+
+
+def test_get_ignores_missing_files(database, tmp_path):
+    engine, _ = database
+    cache = HashCache(engine)
+    filename = str(tmp_path / "model.ckpt")
+    torch.save({"a": torch.ones(4)}, filename)
+    cache.hashes(filename)
+    assert cache.get(filename) is not None
+
+    os.unlink(filename)
+
+    assert cache.get(filename) is None
+
+
+def test_conversion_drops_source_entry(database, tmp_path):
+    engine, _ = database
+    cache = HashCache(engine)
+    filename = str(tmp_path / "model.pt")
+    torch.save({"a": torch.ones(4), "b": torch.zeros(2, 3)}, filename)
+    cache.hashes(filename)
+    assert cached_paths(engine) == [os.path.abspath(filename)]
+
+    counts = convert_files([filename], workers=1, hash_cache=cache)
+
+    assert counts == {"converted": 1, "failed": 0}
+    assert os.path.exists(str(tmp_path / "model.safetensors"))
+    assert cached_paths(engine) == []
@@ -0,0 +1,49 @@
+import threading
+
+from src.dump_pipeline import DumpPipeline
+from src.image_store import ImageStore, _write_atomic
+
+URL = "https://civitai.com/img/preview.jpeg"
+
+
+def run_threads(target, n: int = 20) -> list:
+    """Runs `target` in `n` threads started together, returns what they raised."""
+    barrier = threading.Barrier(n)
+    errors = []
+
+    def run():
+        barrier.wait()
+        try:
+            target()
+        except Exception as ex:
+            errors.append(ex)
+
+    threads = [threading.Thread(target=run) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return errors
+
+
+def test_concurrent_atomic_writes(tmp_path):
+    path = str(tmp_path / "raw" / "image")
+
+    errors = run_threads(lambda: _write_atomic(path, b"x" * 100000))
+
+    assert errors == []
+    assert open(path, "rb").read() == b"x" * 100000
+    assert list((tmp_path / "raw").iterdir()) == [tmp_path / "raw" / "image"]
+
+
+def test_concurrent_jobs_fetch_a_preview_once(stub_server, tmp_path):
+    server = stub_server()
+    store = ImageStore(str(tmp_path / "images"))
+    pipeline = DumpPipeline(store)
+
+    errors = run_threads(lambda: pipeline._fetch_preview("abc123", URL))
+
+    assert errors == []
+    assert server.requests == 1
+    assert open(store.raw_path("abc123"), "rb").read() == server.preview()
+    assert pipeline.fetching == {}
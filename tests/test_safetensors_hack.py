@@ -0,0 +1,126 @@
+import os
+import stat
+import hashlib
+
+import pytest
+import torch
+from safetensors.torch import load_file, save, save_file
+
+from src import safetensors_hack, sd_models
+
+
+def test_write_metadata_keeps_tensors_and_permissions(tmp_path):
+    filename = str(tmp_path / "model.safetensors")
+    save_file({"b": torch.ones(3, 5), "a": torch.arange(7, dtype=torch.int64)}, filename, {"ss_a": "1"})
+    os.chmod(filename, 0o640)
+    model_hash = safetensors_hack.hash_file(filename)
+
+    safetensors_hack.write_metadata(filename, {"ssmd_display_name": "Model", "ss_a": "1"})
+
+    assert safetensors_hack.read_metadata(filename) == {"ssmd_display_name": "Model", "ss_a": "1"}
+    assert safetensors_hack.hash_file(filename) == model_hash
+    assert stat.S_IMODE(os.stat(filename).st_mode) == 0o640
+    assert not os.path.exists(filename + ".tmp")
+
+
+def reference_legacy_hash(filename):
+    """`legacy_hash_file` as it was before it read only the hashed window:
+    loads every tensor and re-serializes the model without user metadata."""
+    metadata = safetensors_hack.read_metadata(filename) or {}
+    if any(not k.startswith("ss_") for k in metadata):
+        tensors = load_file(filename)
+        model_bytes = save(tensors, {k: v for k, v in metadata.items() if k.startswith("ss_")})
+        return hashlib.sha256(model_bytes[0x100000:0x110000]).hexdigest()[0:8]
+    return sd_models.model_hash(filename)
+
+
+def mixed_tensors(seed: int, scale: int) -> dict:
+    """Tensors of every dtype with names whose sort order differs from
+    their layout order, about `scale` elements each."""
+    generator = torch.Generator().manual_seed(seed)
+    tensors = {}
+    for i, dtype in enumerate(MIXED_DTYPES):
+        shape = (scale + i * 13,)
+        if dtype.is_floating_point:
+            tensor = torch.randn(shape, generator=generator).to(dtype)
+        elif dtype == torch.bool:
+            tensor = torch.randint(0, 2, shape, generator=generator).bool()
+        else:
+            tensor = torch.randint(0, 100, shape, generator=generator).to(dtype)
+        tensors[NAMES[(i * 7 + seed) % len(NAMES)] + f".{i}"] = tensor
+    return tensors
+
+
+MIXED_DTYPES = [
+    torch.float64, torch.float32, torch.float16, torch.bfloat16, torch.int64,
+    torch.int32, torch.int16, torch.int8, torch.uint8, torch.bool,
+]
+NAMES = ["lora_up", "Lora_down", "alpha", "_bias", "Zeta", "émbedding", "text_encoder", "10", "9"]
+
+METADATA = {
+    "none": None,
+    "ss only": {"ss_network_dim": "32", "ss_base_model_version": "sd_v1"},
+    "ssmd only": {"ssmd_display_name": "Model", "ssmd_author": "someone"},
+    "ss and ssmd": {"ss_network_dim": "32", "ssmd_display_name": "Model", "ssmd_cover_images": "[]"},
+}
+
+CASES = {
+    # Tensor data covers the whole window.
+    "large": lambda seed: mixed_tensors(seed, 60000),
+    # Files that end before, or inside, the window.
+    "small": lambda seed: mixed_tensors(seed, 500),
+    "ends in window": lambda seed: {"a": torch.zeros(0x100000 // 4 + 1000), "b": torch.ones(3, dtype=torch.int8)},
+    "zero-size": lambda seed: {
+        **mixed_tensors(seed, 40000), "empty": torch.zeros(0, 4), "empty.f16": torch.zeros(0, dtype=torch.float16),
+        "scalar": torch.tensor(1.5),
+    },
+}
+
+
+@pytest.mark.parametrize("metadata", METADATA.values(), ids=METADATA.keys())
+@pytest.mark.parametrize("case", CASES.keys())
+@pytest.mark.parametrize("seed", [0, 1])
+def test_legacy_hash_matches_full_rewrite(tmp_path, case, metadata, seed):
+    filename = str(tmp_path / "model.safetensors")
+    save_file(CASES[case](seed), filename, metadata)
+
+    assert safetensors_hack.legacy_hash_file(filename) == reference_legacy_hash(filename)
+
+
+@pytest.mark.parametrize("header_size", [0xF8000, 0x100000 - 24, 0x104000, 0x10FFF0, 0x118000])
+@pytest.mark.parametrize("ssmd", [False, True])
+def test_legacy_hash_with_header_in_window(tmp_path, header_size, ssmd):
+    # A single ss_ key keeps the metadata order deterministic, safetensors
+    # writes several in HashMap order.
+    metadata = {"ss_tag_frequency": "x" * header_size}
+    if ssmd:
+        metadata["ssmd_description"] = "y" * 2000
+    filename = str(tmp_path / "model.safetensors")
+    save_file(mixed_tensors(header_size, 20000), filename, metadata)
+
+    assert safetensors_hack.legacy_hash_file(filename) == reference_legacy_hash(filename)
+
+
+@pytest.mark.parametrize("metadata", METADATA.values(), ids=METADATA.keys())
+def test_save_file_matches_reference_hashes(tmp_path, metadata):
+    tensors = {**mixed_tensors(3, 60000), "empty": torch.zeros(0, 4)}
+    reference = str(tmp_path / "reference.safetensors")
+    streamed = str(tmp_path / "streamed.safetensors")
+    save_file(tensors, reference, metadata)
+
+    safetensors_hack.save_file(tensors, streamed, metadata)
+
+    assert safetensors_hack.hash_file(streamed) == safetensors_hack.hash_file(reference)
+    assert safetensors_hack.legacy_hash_file(streamed) == safetensors_hack.legacy_hash_file(reference)
+    assert safetensors_hack.read_metadata(streamed) == safetensors_hack.read_metadata(reference)
+
+
+def test_save_file_keeps_permissions_of_replaced_file(tmp_path):
+    filename = str(tmp_path / "model.safetensors")
+    save_file({"a": torch.ones(2)}, filename)
+    os.chmod(filename, 0o640)
+
+    safetensors_hack.save_file({"a": torch.zeros(2)}, filename)
+
+    assert stat.S_IMODE(os.stat(filename).st_mode) == 0o640
+    assert load_file(filename)["a"].tolist() == [0, 0]
@@ -0,0 +1,93 @@
+from sqlalchemy import func, select
+
+from src.crawler import ModelsCrawler
+from src.models import Model
+from src.sync import crawl_key, crawl_models, load_state, sync_models
+
+
+def stored_models(engine) -> int:
+    with engine.connect() as conn:
+        return conn.scalar(select(func.count()).select_from(Model))
+
+
+def test_sync_follows_cursor_without_total_pages(stub_server, database):
+    engine, Session = database
+    stub_server(api_pages=3)
+
+    stats = sync_models(engine, Session, {"limit": 20}, rate=1000)
+
+    assert stored_models(engine) == 60
+    assert stats.models_new == 60
+
+
+def test_sync_stops_at_max_pages(stub_server, database):
+    engine, Session = database
+    stub_server(api_pages=3)
+
+    sync_models(engine, Session, {"limit": 20}, rate=1000, max_pages=2)
+
+    assert stored_models(engine) == 40
+
+
+def high_water_mark(Session, params: dict):
+    with Session() as session:
+        return load_state(session, crawl_key({**params, "sort": "Newest"})).high_water_mark
+
+
+def test_sync_after_interruption_fills_the_gap(stub_server, database, monkeypatch):
+    engine, Session = database
+    stub_server(api_pages=3)
+    fetch = ModelsCrawler.fetch
+
+    def failing_fetch(self, request):
+        if request.get("cursor") == "1":
+            raise RuntimeError("Failed request")
+        return fetch(self, request)
+
+    monkeypatch.setattr(ModelsCrawler, "fetch", failing_fetch)
+    try:
+        sync_models(engine, Session, {"limit": 20}, rate=1000)
+    except RuntimeError:
+        pass
+    assert stored_models(engine) == 20
+    assert high_water_mark(Session, {"limit": 20}) is None
+
+    monkeypatch.setattr(ModelsCrawler, "fetch", fetch)
+    sync_models(engine, Session, {"limit": 20}, rate=1000)
+
+    assert stored_models(engine) == 60
+    assert high_water_mark(Session, {"limit": 20}) is not None
+
+
+def test_sync_stops_at_first_page_without_new_content(stub_server, database):
+    engine, Session = database
+    server = stub_server(api_pages=3)
+    sync_models(engine, Session, {"limit": 20}, rate=1000)
+    requests = server.requests
+
+    stats = sync_models(engine, Session, {"limit": 20}, rate=1000)
+
+    assert server.requests == requests + 1
+    assert stats.models_new == 0
+
+
+def test_sync_cut_short_keeps_high_water_mark(stub_server, database):
+    engine, Session = database
+    stub_server(api_pages=3)
+
+    sync_models(engine, Session, {"limit": 20}, rate=1000, max_pages=1)
+
+    assert high_water_mark(Session, {"limit": 20}) is None
+
+
+def test_first_sync_after_full_crawl_is_incremental(stub_server, database):
+    engine, Session = database
+    server = stub_server(api_pages=3)
+    crawl_models(engine, Session, {"limit": 20}, rate=1000)
+    requests = server.requests
+
+    stats = sync_models(engine, Session, {"limit": 20}, rate=1000)
+
+    assert server.requests == requests + 1
+    assert stats.models_new == 0
+    assert high_water_mark(Session, {"limit": 20}) is not None